@@ -0,0 +1,180 @@
+"""This module caches current test analysis results and plots by content,
+so re-analyzing or re-plotting an archived run (store/index rebuilds,
+report regeneration, dashboards) only recomputes runs whose data or
+analysis changed.
+
+An entry is keyed by the SHA-256 of the raw waveform (scope preamble and
+ADC sample bytes) together with the analysis configuration: ANALYSIS_VERSION,
+the estimator/distortion/plot settings of plotter_calculator, the grading
+limits version and the record schema. Each entry is a CurrentTestResult
+blob (<key>.bin) and, once rendered, its plot (<key>.png). A hit refreshes
+the entry's modification time; when the cache grows past its size cap
+the least recently used entries are removed.
+
+Usage: python analysis_cache.py [root] [--render] [--max-mb N] [--clear]
+
+M. Capotosto
+10/19/2026
+NSLS-II Diagnostics and Instrumentation"""
+import os
+import glob
+import json
+import hashlib
+import argparse
+from time import perf_counter
+import numpy as np
+import plotter_calculator as pc
+from grading_rules import default_rules
+from results import CurrentTestResult, SCHEMA_VERSION
+from run_layout import DEFAULT_ROOT
+
+DEFAULT_CACHE_DIR = os.path.join(DEFAULT_ROOT, "analysis_cache")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024  # Size cap (bytes)
+_PREAMBLE_KEYS = ("ymult", "yzero", "yoff", "xincr")
+
+
+def analysis_config():
+    """Everything besides the raw data that the cached output depends on"""
+    return {"analysis_version": pc.ANALYSIS_VERSION,
+            "schema_version": SCHEMA_VERSION,
+            "limits_version": default_rules().version,
+            "tone": [pc.TONE_ESTIMATOR, pc.TONE_ZOOM, pc.TONE_ZOOM_POINTS,
+                     pc.SINE_FIT_ITERATIONS],
+            "distortion": [pc.DISTORTION_HARMONICS,
+                           pc.DISTORTION_LOBE_BINS],
+            "plot": [pc.PLOT_MAX_POINTS, pc.PLOT_OPTIMIZE_PNG]}
+
+
+class AnalysisCache:
+    """Content-addressed cache of analysis results and plots"""
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR,
+                 max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        self._config = json.dumps(analysis_config(), sort_keys=True).encode()
+
+    def key(self, channel_data, decoded_wfdata):
+        """Cache key of one acquisition (channels 1-3)"""
+        digest = hashlib.sha256(self._config)
+        for i in range(1, 4):
+            digest.update(np.array([channel_data[i][k]
+                                    for k in _PREAMBLE_KEYS]).tobytes())
+            digest.update(memoryview(np.ascontiguousarray(np.frombuffer(
+                decoded_wfdata[i]["adc_wave"], dtype=np.uint8))))
+        return digest.hexdigest()
+
+    def _path(self, key, suffix):
+        return os.path.join(self.directory, key + suffix)
+
+    def get(self, key):
+        """(CurrentTestResult, plot path or None) of a cached entry, or None.
+        The result's plot_filename is the cached plot, if any."""
+        try:
+            with open(self._path(key, ".bin"), "rb") as file:
+                result = CurrentTestResult.from_bytes(file.read())
+        except (OSError, ValueError):
+            return None
+        os.utime(self._path(key, ".bin"))  # Most recently used
+        plot = self._path(key, ".png")
+        return result, plot if os.path.exists(plot) else None
+
+    def put(self, key, result, plot=None):
+        """Store a result, and optionally move a rendered plot file into
+        the cache. Evicts old entries if the cache is over its cap."""
+        if plot is not None:
+            os.replace(plot, self._path(key, ".png"))
+        temp_path = self._path(key, ".bin.tmp")
+        with open(temp_path, "wb") as file:
+            file.write(result.to_bytes())
+        os.replace(temp_path, self._path(key, ".bin"))
+        self.evict()
+
+    def analyze(self, channel_data, decoded_wfdata, render=False):
+        """Cached analyze_waveforms. With render=True the plot is rendered
+        too (if not cached yet) and the result's plot_filename is the cached
+        PNG. Returns a CurrentTestResult."""
+        key = self.key(channel_data, decoded_wfdata)
+        cached = self.get(key)
+        if cached is not None and (cached[1] is not None or not render):
+            self.hits += 1
+            result, plot = cached
+            result.plot_filename = plot or ""
+            return result
+        self.misses += 1
+        volts, _, _, scope_time = pc.unpack_raw_adc(channel_data,
+                                                    decoded_wfdata)
+        plot = self._path(key, ".render.png") if render else None
+        result = pc.analyze_volts(volts, 1 / pc.sample_interval(channel_data),
+                                  self._path(key, ".png") if render else "")
+        if render:
+            pc.render_waveforms(result, volts, scope_time, plot)
+        self.put(key, result, plot)
+        return result
+
+    def entries(self):
+        """[(last used time, bytes, key)] of every entry"""
+        sizes = {}
+        used = {}
+        for entry in os.scandir(self.directory):
+            key = entry.name.split(".", 1)[0]
+            stat = entry.stat()
+            sizes[key] = sizes.get(key, 0) + stat.st_size
+            if entry.name.endswith(".bin"):
+                used[key] = stat.st_mtime
+        return [(used.get(key, 0.0), size, key) for key, size in sizes.items()]
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits its cap.
+        Returns the number of entries removed."""
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            for path in glob.glob(self._path(glob.escape(key), ".*")):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass  # In use (Windows); retried on the next eviction
+            total -= size
+            removed += 1
+        return removed
+
+    def clear(self):
+        """Remove every entry"""
+        for entry in os.scandir(self.directory):
+            os.remove(entry.path)
+
+
+if __name__ == "__main__":
+    from run_layout import find_runs
+    from results_store import load_run
+
+    parser = argparse.ArgumentParser(
+        description="Analyze (and plot) every archived run through the cache")
+    parser.add_argument("root", nargs="?", default=DEFAULT_ROOT,
+                        help="Archive root (default: Test_Data next to "
+                             "this script)")
+    parser.add_argument("--render", action="store_true",
+                        help="Also render and cache the plots")
+    parser.add_argument("--max-mb", type=float,
+                        default=DEFAULT_MAX_BYTES / 2**20,
+                        help="Cache size cap (MB)")
+    parser.add_argument("--clear", action="store_true",
+                        help="Empty the cache first")
+    args = parser.parse_args()
+
+    cache = AnalysisCache(os.path.join(args.root, "analysis_cache"),
+                          int(args.max_mb * 2**20))
+    if args.clear:
+        cache.clear()
+    start = perf_counter()
+    n_runs = sum(load_run(run_dir, cache, args.render) is not None
+                 for run_dir in find_runs(args.root))
+    print(f"{n_runs} runs in {perf_counter() - start:.2f} s: {cache.hits} "
+          f"cached, {cache.misses} analyzed; cache "
+          f"{sum(size for _, size, _ in cache.entries()) / 2**20:.1f} MB")
@@ -0,0 +1,153 @@
+"""This module converts the Test_Data archive from the legacy text files to
+the binary formats:
+
+    <sn>_channel_data.csv          -> <sn>_waveforms.dcwf (waveform_store)
+    <sn>_fault_test_raw_data.csv   -> <sn>_fault_test.bin (FaultTestResult
+                                      binary record, results.py)
+
+Runs are converted in parallel with a process pool. Every output is read
+back and compared with its source before it is kept, and runs whose
+outputs are already newer than their sources are skipped, so the tool can
+be re-run after each test session. The legacy files are left in place.
+
+Usage: python archive_migration.py [root] [--workers N] [--force]
+
+M. Capotosto
+10/19/2026
+NSLS-II Diagnostics and Instrumentation"""
+import os
+import csv
+import glob
+import argparse
+from dataclasses import fields
+from time import perf_counter
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from results import FaultTestResult
+from waveform_store import read_legacy_channel_csv, write_waveforms, \
+    open_waveforms, WAVEFORM_SUFFIX
+from result_writer import write_atomic, TEMP_SUFFIX
+from run_layout import find_runs, run_time, DEFAULT_ROOT
+
+LEGACY_CHANNEL_SUFFIX = "_channel_data.csv"
+LEGACY_FAULT_SUFFIX = "_fault_test_raw_data.csv"
+FAULT_SUFFIX = "_fault_test.bin"
+
+
+def read_legacy_fault_csv(path):
+    """Read a <sn>_fault_test_raw_data.csv into a FaultTestResult"""
+    with open(path, newline="", encoding="utf-8") as file:
+        row = next(csv.DictReader(file))
+    return FaultTestResult(**{
+        f.name: row[f.name] == "True" if f.type is bool else f.type(
+            float(row[f.name]))
+        for f in fields(FaultTestResult)})
+
+
+def _up_to_date(source, target):
+    """True if target was converted from the current version of source.
+    Outputs only appear under their final name once verified, so an
+    interrupted conversion never counts as up to date."""
+    return os.path.exists(target) and \
+        os.path.getmtime(target) >= os.path.getmtime(source)
+
+
+def _convert_channels(source, target, timestamp):
+    """Convert one channel CSV to a temporary file, verify it against the
+    source, then rename it to target"""
+    channel_data, decoded_wfdata = read_legacy_channel_csv(source)
+    temp_path = target + TEMP_SUFFIX
+    try:
+        write_waveforms(temp_path, channel_data, decoded_wfdata, timestamp)
+        with open_waveforms(temp_path) as wf:
+            stored_pre = wf.channel_data()
+            stored = wf.decoded_wfdata()
+            for i, pre in channel_data.items():
+                samples = np.frombuffer(decoded_wfdata[i]["adc_wave"],
+                                        dtype=np.uint8)
+                if any(stored_pre[i][k] != pre[k]
+                       for k in ("ymult", "yzero", "yoff", "xincr")) or \
+                        not np.array_equal(stored[i]["adc_wave"], samples):
+                    raise ValueError(f"channel {i} does not match the "
+                                     f"source")
+        os.replace(temp_path, target)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def _convert_fault(source, target):
+    """Convert one fault CSV, then verify the record against it"""
+    record = read_legacy_fault_csv(source)
+    blob = record.to_bytes()
+    if FaultTestResult.from_bytes(blob) != record:
+        raise ValueError("record does not round-trip")
+    write_atomic(target, blob)
+
+
+def convert_run(run_dir, force=False):
+    """Convert one run directory. Returns (run_dir, converted file count,
+    skipped file count, error message or None). Outputs are written under
+    a temporary name and renamed once complete, so a failed or interrupted
+    conversion leaves no partial file behind."""
+    raw_data = os.path.join(run_dir, "raw_data")
+    converted = skipped = 0
+    try:
+        jobs = []
+        for source in glob.glob(os.path.join(raw_data,
+                                             "*" + LEGACY_CHANNEL_SUFFIX)):
+            jobs.append((source, source[:-len(LEGACY_CHANNEL_SUFFIX)] +
+                         WAVEFORM_SUFFIX))
+        for source in glob.glob(os.path.join(raw_data,
+                                             "*" + LEGACY_FAULT_SUFFIX)):
+            jobs.append((source, source[:-len(LEGACY_FAULT_SUFFIX)] +
+                         FAULT_SUFFIX))
+        for source, target in jobs:
+            if not force and _up_to_date(source, target):
+                skipped += 1
+                continue
+            if target.endswith(WAVEFORM_SUFFIX):
+                _convert_channels(source, target, run_time(run_dir))
+            else:
+                _convert_fault(source, target)
+            converted += 1
+        return run_dir, converted, skipped, None
+    except Exception as e:  # pylint: disable=broad-except
+        return run_dir, converted, skipped, f"{e!r}"
+
+
+def migrate_archive(root=DEFAULT_ROOT, workers=None, force=False):
+    """Convert every run under root in parallel.
+    Returns (converted, skipped, failed) counts."""
+    runs = find_runs(root)
+    converted = skipped = 0
+    failed = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for run_dir, n_conv, n_skip, error in pool.map(
+                convert_run, runs, [force] * len(runs),
+                chunksize=max(1, len(runs) // (4 * (os.cpu_count() or 1)))):
+            converted += n_conv
+            skipped += n_skip
+            if error is not None:
+                failed.append(run_dir)
+                print(f"Error converting {run_dir}: {error}")
+    return converted, skipped, failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Convert legacy Test_Data CSVs to binary formats")
+    parser.add_argument("root", nargs="?", default=DEFAULT_ROOT,
+                        help="Archive root (default: Test_Data next to "
+                             "this script)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes (default: CPU count)")
+    parser.add_argument("--force", action="store_true",
+                        help="Re-convert runs that are already up to date")
+    args = parser.parse_args()
+
+    start = perf_counter()
+    n_converted, n_skipped, failed_runs = migrate_archive(
+        args.root, args.workers, args.force)
+    print(f"Converted {n_converted} files, skipped {n_skipped} up to date, "
+          f"{len(failed_runs)} runs failed, in {perf_counter() - start:.2f} s")
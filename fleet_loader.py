@@ -0,0 +1,251 @@
+"""This module exposes every archived current test capture as one
+memory-mapped (n_runs, 3, n_samples) uint8 array, with a structured array
+of per-run metadata (run directory, S/N, test time, scope preamble), for
+cross-unit studies.
+
+The samples are consolidated into Test_Data/fleet_waveforms.dcfl (a
+16-byte header, then one run after another) and the metadata into
+fleet_waveforms_runs.npy. update_fleet() appends only runs not yet in the
+file, so opening the fleet after a test session decodes just the new
+runs. The array is an np.memmap: nothing is read until it is indexed, and
+indexing, e.g.
+
+    fleet = open_fleet()
+    m_b = fleet.select(sn_prefix="DCCT-M-B")
+    ch1 = fleet.volts(m_b, channel=1)
+
+only reads the pages of the selected runs, so memory stays bounded however
+large the archive grows. Captures whose length differs from the fleet file
+are skipped.
+
+Usage: python fleet_loader.py [root] [--no-refresh]
+
+M. Capotosto
+10/19/2026
+NSLS-II Diagnostics and Instrumentation"""
+import os
+import argparse
+from time import perf_counter
+import numpy as np
+from waveform_store import open_waveforms, read_legacy_channel_csv, \
+    WAVEFORM_SUFFIX
+from archive_migration import LEGACY_CHANNEL_SUFFIX
+from run_layout import find_runs, run_time, run_sn, relocated, DEFAULT_ROOT
+
+FLEET_NAME = "fleet_waveforms"
+FLEET_CHANNELS = 3  # CH1-CH3
+FLEET_VERSION = 1
+_MAGIC = b"DCFL"
+_HEADER = np.dtype([("magic", "S4"), ("version", "<u2"),
+                    ("n_channels", "<u2"), ("n_samples", "<u4"),
+                    ("reserved", "<u4")])
+RUN_DTYPE = np.dtype([
+    ("run_dir", "U128"),  # Relative to the archive root
+    ("dcct_sn", "U32"),
+    ("test_time", "<M8[s]"),
+    ("ymult", "<f8", (FLEET_CHANNELS,)),
+    ("yzero", "<f8", (FLEET_CHANNELS,)),
+    ("yoff", "<f8", (FLEET_CHANNELS,)),
+    ("xincr", "<f8", (FLEET_CHANNELS,)),
+])
+
+
+def fleet_paths(root=DEFAULT_ROOT):
+    """(samples file, metadata file) of an archive's fleet"""
+    base = os.path.join(root, FLEET_NAME)
+    return base + ".dcfl", base + "_runs.npy"
+
+
+def _read_header(path):
+    header = np.fromfile(path, dtype=_HEADER, count=1)
+    if len(header) == 0 or header[0]["magic"] != _MAGIC or \
+            header[0]["version"] != FLEET_VERSION:
+        raise ValueError(f"{path} is not a version {FLEET_VERSION} fleet "
+                         f"file, delete it to rebuild")
+    return header[0]
+
+
+def _load_capture(run_dir):
+    """(preamble dict, (3, n_samples) uint8 block) of a run, or None"""
+    raw = os.path.join(run_dir, "raw_data", run_sn(run_dir))
+    if os.path.exists(raw + WAVEFORM_SUFFIX):
+        with open_waveforms(raw + WAVEFORM_SUFFIX) as wf:
+            return wf.channel_data(), np.array(wf.samples[:FLEET_CHANNELS])
+    if os.path.exists(raw + LEGACY_CHANNEL_SUFFIX):
+        channel_data, decoded = read_legacy_channel_csv(
+            raw + LEGACY_CHANNEL_SUFFIX)
+        return channel_data, np.vstack([
+            np.frombuffer(decoded[i]["adc_wave"], dtype=np.uint8)
+            for i in range(1, FLEET_CHANNELS + 1)])
+    return None
+
+
+def _read_runs(meta_path):
+    if not os.path.exists(meta_path):
+        return np.zeros(0, dtype=RUN_DTYPE)
+    return np.load(meta_path)
+
+
+def update_fleet(root=DEFAULT_ROOT):
+    """Append the captures of runs not yet in the fleet file.
+    Returns the number of runs added."""
+    data_path, meta_path = fleet_paths(root)
+    runs = _read_runs(meta_path)
+    n_samples = _read_header(data_path)["n_samples"] \
+        if os.path.exists(data_path) else None
+    known = set(runs["run_dir"])
+    blocks = []
+    metadata = []
+    for run_dir in find_runs(root):
+        rel = os.path.relpath(run_dir, root)
+        if rel in known:
+            continue
+        capture = _load_capture(run_dir)
+        if capture is None:
+            continue
+        channel_data, block = capture
+        if n_samples is None:
+            n_samples = block.shape[1]
+        if block.shape != (FLEET_CHANNELS, n_samples):
+            print(f"Skipping {run_dir}: {block.shape[1]} samples, the fleet "
+                  f"file holds {n_samples}")
+            continue
+        row = np.zeros((), dtype=RUN_DTYPE)
+        row["run_dir"] = rel
+        row["dcct_sn"] = run_sn(run_dir)
+        row["test_time"] = np.datetime64(run_time(run_dir), "s")
+        for key in ("ymult", "yzero", "yoff", "xincr"):
+            row[key] = [channel_data[i][key]
+                        for i in range(1, FLEET_CHANNELS + 1)]
+        blocks.append(block)
+        metadata.append(row)
+    if not blocks:
+        return 0
+
+    if not os.path.exists(data_path):
+        header = np.zeros(1, dtype=_HEADER)
+        header["magic"] = _MAGIC
+        header["version"] = FLEET_VERSION
+        header["n_channels"] = FLEET_CHANNELS
+        header["n_samples"] = n_samples
+        with open(data_path, "wb") as file:
+            file.write(header.tobytes())
+    with open(data_path, "r+b") as file:
+        # Drop samples of an update interrupted before its metadata was saved
+        file.truncate(_HEADER.itemsize + len(runs) * FLEET_CHANNELS *
+                      int(n_samples))
+        file.seek(0, os.SEEK_END)
+        for block in blocks:
+            file.write(block.tobytes())
+    temp_path = meta_path + ".tmp.npy"
+    np.save(temp_path, np.concatenate([runs, np.array(metadata)]))
+    os.replace(temp_path, meta_path)
+    return len(blocks)
+
+
+def relocate_runs(moves, root=DEFAULT_ROOT):
+    """Update the directories of runs moved to another layout (moves
+    {old run_dir: new run_dir}, relative to root). The samples are not
+    touched. Returns the number of runs changed."""
+    _, meta_path = fleet_paths(root)
+    runs = _read_runs(meta_path)
+    new_dirs = [relocated(run_dir, moves) for run_dir in runs["run_dir"]]
+    changed = int(np.sum(runs["run_dir"] != np.array(new_dirs, dtype=str))) \
+        if len(runs) else 0
+    if changed:
+        runs["run_dir"] = new_dirs
+        temp_path = meta_path + ".tmp.npy"
+        np.save(temp_path, runs)
+        os.replace(temp_path, meta_path)
+    return changed
+
+
+class FleetWaveforms:
+    """The fleet as a lazily read array. 'samples' is a read-only memmap,
+    shape (n_runs, 3, n_samples); 'runs' is the per-run metadata (RUN_DTYPE),
+    in the same order."""
+
+    def __init__(self, root=DEFAULT_ROOT):
+        data_path, meta_path = fleet_paths(root)
+        self.runs = _read_runs(meta_path)
+        n_samples = int(_read_header(data_path)["n_samples"]) \
+            if os.path.exists(data_path) else 0
+        shape = (len(self.runs), FLEET_CHANNELS, n_samples)
+        self.samples = np.memmap(data_path, dtype=np.uint8, mode="r",
+                                 offset=_HEADER.itemsize, shape=shape) \
+            if len(self.runs) else np.zeros(shape, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.runs)
+
+    def close(self):
+        """Release the memory map (needed before updating the fleet file on
+        Windows). Arrays taken from 'samples' must not be used after."""
+        if isinstance(self.samples, np.memmap):
+            self.samples._mmap.close()  # pylint: disable=protected-access
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def select(self, sn_prefix=None, since=None, until=None):
+        """Indices of the runs whose S/N starts with sn_prefix and that were
+        tested in [since, until) (datetimes); None matches everything"""
+        mask = np.ones(len(self.runs), dtype=bool)
+        if sn_prefix is not None:
+            mask &= np.char.startswith(self.runs["dcct_sn"], sn_prefix)
+        if since is not None:
+            mask &= self.runs["test_time"] >= np.datetime64(since, "s")
+        if until is not None:
+            mask &= self.runs["test_time"] < np.datetime64(until, "s")
+        return np.flatnonzero(mask)
+
+    def volts(self, runs=slice(None), channel=None):
+        """Selected runs (index array, mask or slice) scaled to volts,
+        (n, 3, n_samples), or (n, n_samples) for one channel (1-3). Only
+        these runs are read."""
+        meta = self.runs[runs]
+        keys = ("ymult", "yzero", "yoff")
+        if channel is None:
+            samples = self.samples[runs]
+            ymult, yzero, yoff = (meta[key][:, :, None] for key in keys)
+        else:
+            samples = self.samples[runs, channel - 1]
+            ymult, yzero, yoff = (meta[key][:, channel - 1, None]
+                                  for key in keys)
+        return (samples - yoff) * ymult + yzero
+
+
+def open_fleet(root=DEFAULT_ROOT, refresh=True):
+    """Open an archive's fleet, first appending new runs unless
+    refresh=False"""
+    if refresh:
+        update_fleet(root)
+    return FleetWaveforms(root)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Update and summarize the fleet waveform file")
+    parser.add_argument("root", nargs="?", default=DEFAULT_ROOT,
+                        help="Archive root (default: Test_Data next to "
+                             "this script)")
+    parser.add_argument("--no-refresh", action="store_true",
+                        help="Do not add new runs first")
+    args = parser.parse_args()
+
+    start = perf_counter()
+    added = 0 if args.no_refresh else update_fleet(args.root)
+    print(f"Added {added} runs in {perf_counter() - start:.2f} s")
+    with FleetWaveforms(args.root) as fleet:
+        print(f"{len(fleet)} runs, samples {fleet.samples.shape}")
+        for prefix in ("DCCT-M-A", "DCCT-M-B"):
+            start = perf_counter()
+            selected = fleet.select(sn_prefix=prefix)
+            ch1 = fleet.volts(selected, channel=1)
+            vpp = np.ptp(ch1, axis=1) if len(ch1) else np.zeros(0)
+            print(f"{prefix}: {len(selected)} runs, CH1 Vpp "
+                  f"{vpp.mean() if len(vpp) else float('nan'):.4f} V mean, "
+                  f"read in {(perf_counter() - start) * 1000:.1f} ms")
@@ -17,8 +17,13 @@ The amplitude of the output signal must also be verified to be a valid level.
 M. Capotosto
 3/8/2025
 NSLS-II Diagnostics and Instrumentation"""
-from time import sleep
-from plotter_calculator import plot_waveforms
+from time import sleep, monotonic
+from contextlib import ExitStack
+from plotter_calculator import plot_waveforms, grade_measurements, \
+    unpack_raw_adc, sample_interval, ShotAverager
+from instrument_modules.ownership import claim
+from instrument_modules.wait_utils import wait_for
+from waveform_store import parse_curve_block
 
 # *************************************************************************
 # ******Constants******
@@ -48,6 +53,48 @@ CH1_TERMINATION = "MEG"  # 1M Input Impedance
 CH2_TERMINATION = "MEG"  # 1M Input Impedance
 CH3_TERMINATION = "MEG"  # 1M Input Impedance
 CH4_TERMINATION = "MEG"  # 1M Input Impedance
+
+# Trigger: rising edge of the signal generator drive monitored on CH3, so
+# every capture starts at the same phase of the stimulus.
+TRIG_SOURCE = "CH3"
+TRIG_LEVEL = "0"  # Volts, zero crossing of the 20Vpp sine
+TRIG_SLOPE = "RISE"
+TRIG_HOLDOFF = "20E-09"
+TRIG_MODE = "NORMAL"  # Only acquire on a real trigger
+TRIG_POSITION = "10"  # Trigger point at 10% of the record
+ACQ_TIMEOUT = 5  # Seconds to wait for the single-shot trigger
+# Seconds the DCCT output is left to settle after the drive is switched on,
+# before the first capture (the inline scope setup counts towards it)
+OUTPUT_SETTLE_TIME = 2
+# Seconds to wait for the background scope setup to release the scope
+# before configuring it inline
+SCOPE_SETUP_TIMEOUT = 60
+
+# On-scope measurement slots used by the fast mode:
+# (slot, type, source 1, source 2, result key)
+SCOPE_MEASUREMENTS = [
+    ("1", "PK2PK", "1", None, "vpp1"),
+    ("2", "PK2PK", "2", None, "vpp2"),
+    ("3", "PK2PK", "3", None, "vpp3"),
+    ("4", "FREQUENCY", "1", None, "frequency"),
+    ("5", "PHASE", "2", "1", "phase_shift"),  # CH2 relative to CH1
+]
+
+# Multi-shot averaging: stop early once the 95% confidence interval of the
+# mean is within these half-widths (units of each quantity)
+SHOT_MIN = 3  # Shots always taken before checking convergence
+SHOT_CI_LIMITS = {
+    "vpp1": 0.002,  # V
+    "vpp2": 0.002,  # V
+    "vpp3": 0.05,  # V
+    "frequency": 0.02,  # Hz
+    "phase_shift": 0.2,  # Degrees
+}
+
+# PSU rail verification
+RAIL_READY_VOLTAGE = 14.5  # Both +/-15V rails must exceed this (magnitude)
+RAIL_POLL_INTERVAL = 0.1  # Seconds between rail readbacks
+RAIL_SETTLE_TIMEOUT = 5  # Seconds before re-commanding the rails
 # *************************************************************************
 
 
@@ -60,6 +107,30 @@ def init_psu_ct(psu):
     psu.toggle_output("3", "ON")
 
 
+def rails_ready(psu):
+    """Return (ch2v, ch3v) if both rails are up, otherwise None"""
+    ch2v = psu.measure_voltage("2")
+    ch3v = psu.measure_voltage("3")
+    if ch2v > RAIL_READY_VOLTAGE and abs(ch3v) > RAIL_READY_VOLTAGE:
+        return ch2v, ch3v
+    return None
+
+
+def wait_for_rails(psu):
+    """Wait until both PSU rails are up, re-commanding 15V on each timeout.
+    Returns the (ch2v, ch3v) readback."""
+    while True:
+        try:
+            return wait_for(lambda: rails_ready(psu),
+                            timeout=RAIL_SETTLE_TIMEOUT,
+                            poll_interval=RAIL_POLL_INTERVAL,
+                            description="PSU +/-15V rails")
+        except TimeoutError as e:
+            print(f"{e}, re-commanding PSU rails...")
+            psu.set_voltage("2", "15")
+            psu.set_voltage("3", "15")
+
+
 def init_scope_ct(scope):
     """Configure initial conditions for the scope..."""
     scope.horizontal_record_length(HOR_REC_LENGTH)
@@ -80,14 +151,9 @@ def init_scope_ct(scope):
     scope.chan_vertical_scale("2", VERTSCALE2)
     scope.chan_vertical_scale("3", VERTSCALE3)
     scope.chan_vertical_scale("4", VERTSCALE4)
-    ##################################################################################
-    ##################################################################################
-    ##################################################################################
-    ##################################################################################
-    ##################################################################################
-    # ADD TRIGGER CONFIG............................................................
-    # ........................................................................
-    # .........................................................
+    scope.config_edge_trigger(TRIG_SOURCE, TRIG_LEVEL, TRIG_SLOPE,
+                              TRIG_HOLDOFF, TRIG_MODE)
+    scope.horizontal_position(TRIG_POSITION)
     for i in range(1, 4):  # Iterate through settings for Channel 1 through 4 identically...
         scope.bandwidth(str(i), "FULL")
         scope.coupling(str(i), "DC")
@@ -95,6 +161,20 @@ def init_scope_ct(scope):
         scope.invert(str(i))
         scope.vertical_position(str(i))
     scope.vertical_position("4", "-5")
+    init_scope_measurements(scope)
+
+
+def init_scope_measurements(scope):
+    """Configure the measurement slots read by measure_on_scope()"""
+    for slot, meastype, chan, chan2, _ in SCOPE_MEASUREMENTS:
+        scope.config_measurement(slot, meastype, chan, chan2)
+
+
+def measure_on_scope(scope):
+    """Read every configured measurement slot in one query.
+    Returns a dict keyed as in SCOPE_MEASUREMENTS."""
+    values = scope.query_measurements([m[0] for m in SCOPE_MEASUREMENTS])
+    return {m[4]: value for m, value in zip(SCOPE_MEASUREMENTS, values)}
 
 
 def gen_init_ct(gen):
@@ -119,14 +199,22 @@ def gen_init_ct(gen):
 
 def acquire_wfdata(scope):
     # PG555
-    """Acquire single shot waveform"""
-    scope.acquire_state("OFF")
-    scope.config_acq("SEQUENCE", "OFF")  # Set for single shot
-    scope.acquire_state("ON")  # Wait for a trigger and take a shot
-    scope.wai()  # Wait for the acquisition to complete...
+    """Acquire single shot waveform, triggered on the CH3 stimulus"""
+    trigger_single_shot(scope)
+    return transfer_wfdata(scope)
+
+
+def trigger_single_shot(scope):
+    """Arm a single-sequence acquisition and wait until it has captured"""
     scope.acquire_state("OFF")
+    scope.acquire_stopafter("SEQUENCE")  # Set for single shot
+    scope.acquire_state("ON")  # Arm, capture on the next trigger
+    scope.wait_for_acquisition(ACQ_TIMEOUT)  # Returns once captured
     # scope.measurement_gating("SCREEN")
 
+
+def transfer_wfdata(scope):
+    """Transfer the captured CH1-CH3 waveforms and their preambles"""
     channel_data = {}
     for i in range(1, 4):
         j = str(i)
@@ -143,14 +231,32 @@ def acquire_wfdata(scope):
     return channel_data
 
 
+def average_shots(scope, channel_data, decoded_wfdata, shots):
+    """Accumulate up to 'shots' acquisitions, starting from one already
+    transferred, and stop early once SHOT_CI_LIMITS are met.
+    Returns (channel_data, decoded_wfdata, shot_stats) with the last
+    shot's waveforms and the ShotAverager."""
+    shot_stats = ShotAverager()
+    while True:
+        volts, _, _, _ = unpack_raw_adc(channel_data, decoded_wfdata)
+        shot_stats.add(volts, 1 / sample_interval(channel_data))
+        if shot_stats.shots >= shots or \
+                shot_stats.converged(SHOT_CI_LIMITS, SHOT_MIN):
+            break
+        channel_data = acquire_wfdata(scope)
+        decoded_wfdata = decode_wfdata(channel_data)
+    print(f"Averaged: {shot_stats.summary()}")
+    return channel_data, decoded_wfdata, shot_stats
+
+
 def decode_wfdata(channel_data):
     """Decode waveform data"""
     decoded_wfdata = {}
     for i in range(1, 4):
         data = channel_data[i]["data"]
-        headerlen = 2 + int(data[1])  # Access the second byte in the raw wfdata
+        adc_wave = parse_curve_block(data)
+        headerlen = 2 + int(chr(data[1]))  # '#', digit count, byte count
         header = data[:headerlen]
-        adc_wave = data[headerlen:-1]
 
         decoded_wfdata[i] = {
             "headerlen": headerlen,
@@ -160,46 +266,75 @@ def decode_wfdata(channel_data):
     return decoded_wfdata
 
 
-def current_test(gen, psu, scope):
-    """Current Test function"""
+def current_test(gen, psu, scope, scope_setup=None, fast=False,
+                 archive_sample=False, shots=1):
+    """Current Test function
+
+    scope_setup: optional Future from a background init_scope_ct(scope)
+    (see instrument_modules.ownership.run_in_background). When given, the
+    scope is assumed configured; otherwise, or if the setup does not
+    release the scope within SCOPE_SETUP_TIMEOUT, it is configured inline.
+    Either way the first capture waits OUTPUT_SETTLE_TIME after the drive
+    is switched on.
+
+    fast: grade from on-scope measurements. Waveforms are only transferred
+    if that grade fails, or if archive_sample is set.
+
+    shots: grade from the mean of up to this many acquisitions (see
+    average_shots); 1 grades a single shot.
+
+    Returns (channel_data, decoded_wfdata, scope_result, shot_stats).
+    scope_result is the fast-mode CurrentTestResult (None when fast is
+    False); the waveform dicts are None when the fast-mode pass made the
+    transfer unnecessary. shot_stats is the ShotAverager when shots > 1,
+    otherwise None.
+    """
+    with ExitStack() as stack:
+        stack.enter_context(claim("current test", gen, psu))
+        try:
+            stack.enter_context(claim("current test", scope,
+                                      timeout=SCOPE_SETUP_TIMEOUT))
+        except TimeoutError as e:
+            print(f"{e}, configuring the scope inline...")
+            scope_setup = None
+        return _run_current_test(gen, psu, scope, scope_setup, fast,
+                                 archive_sample, shots)
+
+
+def _run_current_test(gen, psu, scope, scope_setup, fast, archive_sample,
+                      shots):
+    """Current Test procedure, called with all instruments owned"""
     print("Initializing instruments...\n")
     gen.output_state("1", "OFF")
     init_psu_ct(psu)
-    sleep(0.5)
-    ch2v = psu.measure_voltage("2")
-    sleep(1)
-    ch3v = abs(psu.measure_voltage("3"))
-    sleep(1)
-    while not ((ch2v > 14.5) and (abs(ch3v) > 14.5)):
-        psu.set_voltage("2", "15")
-        sleep(1)
-        psu.set_voltage("3", "15")
-        sleep(1)
-        ch2v = psu.measure_voltage("2")
-        sleep(1)
-        ch3v = psu.measure_voltage("3")
-    if ((ch2v > 14.5) and (abs(ch3v) > 14.5)):
-        print(f"CH2V: {ch2v}, CH3V: {ch3v}")
-        sleep(0.5)
-        gen_init_ct(gen)
-        gen.output_state("1", "ON")
+    ch2v, ch3v = wait_for_rails(psu)
+    print(f"CH2V: {ch2v}, CH3V: {ch3v}")
+    gen_init_ct(gen)
+    gen.output_state("1", "ON")
+    settled_at = monotonic() + OUTPUT_SETTLE_TIME
+    if scope_setup is None:
+        init_scope_ct(scope)
     else:
-        while not ((ch2v > 14.5) and (abs(ch3v) > 14.5)):
-            psu.set_voltage("2", "15")
-            sleep(1)
-            psu.set_voltage("3", "15")
-            sleep(1)
-            ch2v = psu.measure_voltage("2")
-            sleep(1)
-            ch3v = psu.measure_voltage("3")
-    sleep(1)
-    init_scope_ct(scope)
-    sleep(1)
-    channel_data = acquire_wfdata(scope)
-    sleep(1)
+        try:
+            scope_setup.result()  # Re-raise any background config error
+        except Exception as e:  # pylint: disable=broad-except
+            print(f"Background scope setup failed: {e}, reconfiguring...")
+            init_scope_ct(scope)
+    sleep(max(0.0, settled_at - monotonic()))  # Let the DCCT output settle
+    trigger_single_shot(scope)
+    scope_result = None
+    if fast:
+        scope_result = grade_measurements(measure_on_scope(scope))
+        print(f"Scope measurements: {scope_result}")
+        if scope_result.test_passed and not archive_sample:
+            return None, None, scope_result, None
+    channel_data = transfer_wfdata(scope)
     decoded_wfdata = decode_wfdata(channel_data)
-    sleep(1)
-    return channel_data, decoded_wfdata
+    shot_stats = None
+    if shots > 1:
+        channel_data, decoded_wfdata, shot_stats = average_shots(
+            scope, channel_data, decoded_wfdata, shots)
+    return channel_data, decoded_wfdata, scope_result, shot_stats
 
 
 if __name__ == "__main__":
@@ -241,7 +376,7 @@ if __name__ == "__main__":
 
     report_path, raw_data_path = create_test_directories(dcct_sn,
                                                          dir_time_formatted)
-    current_channel_data, current_decoded_wfdata = current_test(sig_gen_standalone, psu_standalone, scope_standalone)
+    current_channel_data, current_decoded_wfdata, _, _ = current_test(sig_gen_standalone, psu_standalone, scope_standalone)
     current_plot_filename_l = os.path.join(raw_data_path, f"waveform_plots_{dcct_sn}"
                                                           f"_{dir_time_formatted}.png")
     plot_waveforms(current_channel_data, current_decoded_wfdata, current_plot_filename_l)
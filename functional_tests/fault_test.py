@@ -19,6 +19,7 @@ under normal operating conditions.
 """
 from time import sleep
 import numpy as np
+from results import FaultTestResult
 
 
 
@@ -86,8 +87,16 @@ class FLT12_Fault_Test:
     def init_dmm(self):
         self.dmm.factory_reset()
 
-    def run_the_fault_test(self):
-        """Fault Test Procedure"""
+    def run_the_fault_test(self, on_step=None, completed=None):
+        """Fault Test Procedure
+
+        on_step: optional callback(event, data) called after each sweep step
+        ("positive_step"/"negative_step") and each completed phase ("initial",
+        "positive", "negative"), e.g. to journal the test (run_journal.py).
+        completed: {phase: data} of phases completed before an interruption,
+        as passed to on_step; those phases are not repeated."""
+        on_step = on_step or (lambda event, data: None)
+        completed = completed or {}
         ##############################################################################################
         # ******Initialize Instruments...******
         ##############################################################################################
@@ -107,154 +116,203 @@ class FLT12_Fault_Test:
         ##############################################################################################
         # ******Find FLT12 Initial Voltage...******
         ##############################################################################################
-        # print(self.flt12_initial_voltage)
-        self.flt12_initial_voltage = round(self.dmm.meas_dcv(), 4)
-        print(self.flt12_initial_voltage)
-        sleep(0.5)
-        if self.flt12_initial_voltage >= self.FLT12_DEASSERT:
-            flt12_deassertion_test_passed = True
-            print(f"De-Assert/Initial Voltage Test Passed!  {round(self.flt12_initial_voltage, 3)} Volts..."
-                  "Continuing to remaining tests...\n")
-            self.flt12_flag = False  # FLT12 Status Flag Initializaiton
+        if "initial" in completed:  # Journaled before an interruption
+            initial = completed["initial"]
+            self.flt12_initial_voltage = initial["initial_voltage"]
+            flt12_deassertion_test_passed = initial["deassertion_test"]
+            self.flt12_flag = not flt12_deassertion_test_passed
         else:
-            flt12_deassertion_test_passed = False
-            print("De-Assert Voltage too low! Test failed! Continuing to remaining tests...\n")
-            self.flt12_flag = True  # FLT12 Status Flag Initializaiton
+            # print(self.flt12_initial_voltage)
+            self.flt12_initial_voltage = round(self.dmm.meas_dcv(), 4)
+            print(self.flt12_initial_voltage)
+            sleep(0.5)
+            if self.flt12_initial_voltage >= self.FLT12_DEASSERT:
+                flt12_deassertion_test_passed = True
+                print(f"De-Assert/Initial Voltage Test Passed!  "
+                      f"{round(self.flt12_initial_voltage, 3)} Volts..."
+                      "Continuing to remaining tests...\n")
+                self.flt12_flag = False  # FLT12 Status Flag Initializaiton
+            else:
+                flt12_deassertion_test_passed = False
+                print("De-Assert Voltage too low! Test failed! "
+                      "Continuing to remaining tests...\n")
+                self.flt12_flag = True  # FLT12 Status Flag Initializaiton
+            on_step("initial",
+                    {"initial_voltage": self.flt12_initial_voltage,
+                     "deassertion_test": flt12_deassertion_test_passed})
         ###############################################################################################
 
         ##############################################################################################
         # ******Test Positive FLT12 Fault******
         ##############################################################################################
-        flt12_positive_assert_pin_voltage = round(self.dmm.meas_dcv(), 4)  # Create a valid initial \
-        # value for the while loop...
-        self.gen.apply_pulse("1", self.GEN_TEST_FREQ, "0.005", self.GEN_TEST_VOLTAGE_NEG, "0")
-        self.psu.set_voltage("3", "10")  # Drop PSU N15V to 10V to expedite testing...
-        sleep(1)
-        N15V_setpoint = self.psu.measure_voltage("3")
-        psu_rb = N15V_setpoint  # Initialize psu_rb before the loop print statements...
-        sleep(1)
-
-        while ((flt12_positive_assert_pin_voltage >= self.FLT12_ASSERT) and (abs(N15V_setpoint) >=
-                                                                             self.N15V_THRES_LOW)):
-            # Repeat until fault is asserted...
+        if "positive" in completed:  # Journaled before an interruption
+            phase = completed["positive"]
+            flt12_positive_assert_pin_voltage = phase["pin_voltage"]
+            flt12_positive_assert_ps_voltage = phase["ps_voltage"]
+            flt12_positive_assertion_test_passed = phase["passed"]
+        else:
+            # Create a valid initial value for the while loop...
             flt12_positive_assert_pin_voltage = round(self.dmm.meas_dcv(), 4)
+            self.gen.apply_pulse("1", self.GEN_TEST_FREQ, "0.005",
+                                 self.GEN_TEST_VOLTAGE_NEG, "0")
+            self.psu.set_voltage("3", "10")  # Drop PSU N15V to 10V to expedite testing...
             sleep(1)
-            print(f"PSU N15V Rail Voltage: {psu_rb} \n"
-                  f"FLT12 Fault Status Voltage:{np.round(flt12_positive_assert_pin_voltage, 3)} \n"
-                  f"FLT12 Fault Status Flag: {self.flt12_flag}")
-            # input(f"pre-sp increase... 249....{N15V_setpoint}")
-            N15V_setpoint += 0.250
-            # input(f"Post-sp increase...{N15V_setpoint}")
-            psu_rb = self.psu.measure_voltage("3")
+            N15V_setpoint = self.psu.measure_voltage("3")
+            psu_rb = N15V_setpoint  # Initialize psu_rb before the loop print statements...
             sleep(1)
-            # input(f"while ({N15V_setpoint - 0.02}) <= {psu_rb} <= ({N15V_setpoint + 0.02})")
-            while not ((N15V_setpoint - 0.02) <= psu_rb <= (N15V_setpoint + 0.02)):  \
-                    # Command PSU to drop 250mV until readback shows it does...
-                print("Adjusting PSU voltage...retrying...")
-                psu_sp = str(N15V_setpoint)
-                print(f"DBUG PSU SP: {psu_sp}")
-                self.psu.set_voltage("3", psu_sp)
+
+            while ((flt12_positive_assert_pin_voltage >= self.FLT12_ASSERT)
+                   and (abs(N15V_setpoint) >= self.N15V_THRES_LOW)):
+                # Repeat until fault is asserted...
+                flt12_positive_assert_pin_voltage = round(self.dmm.meas_dcv(), 4)
                 sleep(1)
+                print(f"PSU N15V Rail Voltage: {psu_rb} \n"
+                      f"FLT12 Fault Status Voltage:"
+                      f"{np.round(flt12_positive_assert_pin_voltage, 3)} \n"
+                      f"FLT12 Fault Status Flag: {self.flt12_flag}")
+                # input(f"pre-sp increase... 249....{N15V_setpoint}")
+                N15V_setpoint += 0.250
+                # input(f"Post-sp increase...{N15V_setpoint}")
                 psu_rb = self.psu.measure_voltage("3")
                 sleep(1)
-                # input(f"PSU RB 260: {psu_rb}")
-            print("PSU Voltage adjusted, re-acquiring data...")
-        # loop...FLT12 is now ASSERTED...
-        # input(f"DBUG: 267: fell out of while cond. (({flt12_assert_pin_voltage} >= {FLT12_DEASSERT}) and \
-        # ({abs(N15V_setpoint)} >= {N15V_THRES_HIGH})):")
-        flt12_flag = True
-        flt12_positive_assert_ps_voltage = psu_rb  # Store the final value that caused assert
+                # input(f"while ({N15V_setpoint - 0.02}) <= {psu_rb} "
+                #       f"<= ({N15V_setpoint + 0.02})")
+                # Command PSU to drop 250mV until readback shows it does...
+                while not ((N15V_setpoint - 0.02) <= psu_rb
+                           <= (N15V_setpoint + 0.02)):
+                    print("Adjusting PSU voltage...retrying...")
+                    psu_sp = str(N15V_setpoint)
+                    print(f"DBUG PSU SP: {psu_sp}")
+                    self.psu.set_voltage("3", psu_sp)
+                    sleep(1)
+                    psu_rb = self.psu.measure_voltage("3")
+                    sleep(1)
+                    # input(f"PSU RB 260: {psu_rb}")
+                print("PSU Voltage adjusted, re-acquiring data...")
+                on_step("positive_step",
+                        {"setpoint": N15V_setpoint, "readback": psu_rb,
+                         "pin_voltage": flt12_positive_assert_pin_voltage})
+            # loop...FLT12 is now ASSERTED...
+            # input(f"DBUG: 267: fell out of while cond. "
+            #       f"(({flt12_assert_pin_voltage} >= {FLT12_DEASSERT}) and "
+            #       f"({abs(N15V_setpoint)} >= {N15V_THRES_HIGH})):")
+            flt12_flag = True
+            # Store the final value that caused assert
+            flt12_positive_assert_ps_voltage = psu_rb
 
-        print(f"PSU N15V Rail Voltage: {psu_rb} \n"
-              f"FLT12 Fault Status Voltage: {flt12_positive_assert_pin_voltage} \n"
-              f"FLT12 Fault Status Flag: {flt12_flag}\n\n\n")
-        sleep(0.5)
-        if ((flt12_flag is True) and (abs(psu_rb) >= self.N15V_THRES_LOW) and (abs(psu_rb) <= self.N15V_THRES_HIGH)):
-            print("FLT12 Positive Assertion Test passed!\n")
-            flt12_positive_assertion_test_passed = True
-        else:
-            print("FLT12 Positive Assertion Test failed: N15V is outside threshold!\n")
-            flt12_positive_assertion_test_passed = False
-        self.psu.toggle_output("2", "OFF")
-        sleep(0.5)
-        self.psu.toggle_output("3", "OFF")
-        sleep(0.5)
-        self.psu.set_voltage(chan="2", val="15")
-        sleep(0.5)
-        self.psu.set_voltage(chan="3", val="15")
-        sleep(0.5)
+            print(f"PSU N15V Rail Voltage: {psu_rb} \n"
+                  f"FLT12 Fault Status Voltage: {flt12_positive_assert_pin_voltage} \n"
+                  f"FLT12 Fault Status Flag: {flt12_flag}\n\n\n")
+            sleep(0.5)
+            if ((flt12_flag is True) and (abs(psu_rb) >= self.N15V_THRES_LOW)
+                    and (abs(psu_rb) <= self.N15V_THRES_HIGH)):
+                print("FLT12 Positive Assertion Test passed!\n")
+                flt12_positive_assertion_test_passed = True
+            else:
+                print("FLT12 Positive Assertion Test failed: N15V is outside threshold!\n")
+                flt12_positive_assertion_test_passed = False
+            self.psu.toggle_output("2", "OFF")
+            sleep(0.5)
+            self.psu.toggle_output("3", "OFF")
+            sleep(0.5)
+            self.psu.set_voltage(chan="2", val="15")
+            sleep(0.5)
+            self.psu.set_voltage(chan="3", val="15")
+            sleep(0.5)
+            on_step("positive",
+                    {"pin_voltage": flt12_positive_assert_pin_voltage,
+                     "ps_voltage": flt12_positive_assert_ps_voltage,
+                     "passed": flt12_positive_assertion_test_passed})
 
         ###############################################################################################
 
         ##############################################################################################
         # ******Test Negative FLT12 Fault******
         ##############################################################################################
-        self.psu.toggle_output("2", "OFF")
-        sleep(1)
-        self.psu.toggle_output("3", "OFF")
-        sleep(1)
+        if "negative" in completed:  # Journaled before an interruption
+            phase = completed["negative"]
+            flt12_negative_assert_pin_voltage = phase["pin_voltage"]
+            flt12_negative_assert_ps_voltage = phase["ps_voltage"]
+            flt12_negative_assertion_test_passed = phase["passed"]
+        else:
+            self.psu.toggle_output("2", "OFF")
+            sleep(1)
+            self.psu.toggle_output("3", "OFF")
+            sleep(1)
 
-        self.init_psu()
-        flt12_flag = False  # FLT12 Status Flag Initializaiton
-        self.gen.apply_pulse("1", self.GEN_TEST_FREQ, "0.005", self.GEN_TEST_VOLTAGE, "0")
-        sleep(1)
-        flt12_negative_assert_pin_voltage = round(self.dmm.meas_dcv(), 4)  # Create a valid initial \
-        # value for the while loop...
-        self.psu.set_voltage("3", "10")  # Drop PSU N15V to 10V to expedite testing...
-        sleep(1)
-        N15V_setpoint = self.psu.measure_voltage("3")
-        psu_rb = N15V_setpoint  # Initialize psu_rb before the loop print statements...
-        sleep(1)
-        while ((flt12_negative_assert_pin_voltage >= self.FLT12_ASSERT) and (abs(N15V_setpoint)
-                                                                             >= self.N15V_THRES_LOW)):
-            # Repeat until fault is asserted...
+            self.init_psu()
+            flt12_flag = False  # FLT12 Status Flag Initializaiton
+            self.gen.apply_pulse("1", self.GEN_TEST_FREQ, "0.005", self.GEN_TEST_VOLTAGE, "0")
+            sleep(1)
+            # Create a valid initial value for the while loop...
             flt12_negative_assert_pin_voltage = round(self.dmm.meas_dcv(), 4)
+            self.psu.set_voltage("3", "10")  # Drop PSU N15V to 10V to expedite testing...
             sleep(1)
-            print(f"PSU N15V Rail Voltage: {psu_rb} \n"
-                  f"FLT12 Fault Status Voltage:{np.round(flt12_negative_assert_pin_voltage, 3)} \n"
-                  f"FLT12 Fault Status Flag: {flt12_flag}")
-            # input(f"pre-sp increase... 249....{N15V_setpoint}")
-            N15V_setpoint += 0.250
-            # input(f"Post-sp increase...{N15V_setpoint}")
-            psu_rb = self.psu.measure_voltage("3")
+            N15V_setpoint = self.psu.measure_voltage("3")
+            psu_rb = N15V_setpoint  # Initialize psu_rb before the loop print statements...
             sleep(1)
-            # input(f"while ({N15V_setpoint - 0.02}) <= {psu_rb} <= ({N15V_setpoint + 0.02})")
-            while not ((N15V_setpoint - 0.02) <= psu_rb <= (N15V_setpoint + 0.02)): \
-                    # Command PSU to drop 250mV until readback shows it does...
-                print("Adjusting PSU voltage...retrying...")
-                psu_sp = str(N15V_setpoint)
-                print(f"DBUG PSU SP: {psu_sp}")
-                self.psu.set_voltage("3", psu_sp)
+            while ((flt12_negative_assert_pin_voltage >= self.FLT12_ASSERT)
+                   and (abs(N15V_setpoint) >= self.N15V_THRES_LOW)):
+                # Repeat until fault is asserted...
+                flt12_negative_assert_pin_voltage = round(self.dmm.meas_dcv(), 4)
                 sleep(1)
+                print(f"PSU N15V Rail Voltage: {psu_rb} \n"
+                      f"FLT12 Fault Status Voltage:"
+                      f"{np.round(flt12_negative_assert_pin_voltage, 3)} \n"
+                      f"FLT12 Fault Status Flag: {flt12_flag}")
+                # input(f"pre-sp increase... 249....{N15V_setpoint}")
+                N15V_setpoint += 0.250
+                # input(f"Post-sp increase...{N15V_setpoint}")
                 psu_rb = self.psu.measure_voltage("3")
                 sleep(1)
-                # input(f"PSU RB 260: {psu_rb}")
-            print("PSU Voltage adjusted, re-acquiring data...")
+                # input(f"while ({N15V_setpoint - 0.02}) <= {psu_rb} "
+                #       f"<= ({N15V_setpoint + 0.02})")
+                # Command PSU to drop 250mV until readback shows it does...
+                while not ((N15V_setpoint - 0.02) <= psu_rb
+                           <= (N15V_setpoint + 0.02)):
+                    print("Adjusting PSU voltage...retrying...")
+                    psu_sp = str(N15V_setpoint)
+                    print(f"DBUG PSU SP: {psu_sp}")
+                    self.psu.set_voltage("3", psu_sp)
+                    sleep(1)
+                    psu_rb = self.psu.measure_voltage("3")
+                    sleep(1)
+                    # input(f"PSU RB 260: {psu_rb}")
+                print("PSU Voltage adjusted, re-acquiring data...")
+                on_step("negative_step",
+                        {"setpoint": N15V_setpoint, "readback": psu_rb,
+                         "pin_voltage": flt12_negative_assert_pin_voltage})
 
-        # Fell out of the loop...FLT12 is now ASSERTED...
-        # input(f"DBUG: 267: fell out of while cond. (({flt12_assert_pin_voltage[4]} \
-        # >= {FLT12_DEASSERT}) and ({abs(N15V_setpoint)} >= {N15V_THRES_HIGH})):")
-        flt12_flag = True
-        flt12_negative_assert_ps_voltage = psu_rb  # Store the final value that caused assert
+            # Fell out of the loop...FLT12 is now ASSERTED...
+            # input(f"DBUG: 267: fell out of while cond. (({flt12_assert_pin_voltage[4]} \
+            # >= {FLT12_DEASSERT}) and ({abs(N15V_setpoint)} >= {N15V_THRES_HIGH})):")
+            flt12_flag = True
+            # Store the final value that caused assert
+            flt12_negative_assert_ps_voltage = psu_rb
 
-        print(f"PSU N15V Rail Voltage: {psu_rb} \n"
-              f"FLT12 Fault Status Voltage: {flt12_negative_assert_pin_voltage} \n"
-              f"FLT12 Fault Status Flag: {flt12_flag}\n\n\n")
-        sleep(0.5)
-        if ((flt12_flag is True) and (abs(psu_rb) >= self.N15V_THRES_LOW) and (abs(psu_rb) <= self.N15V_THRES_HIGH)):
-            print("FLT12 Negative Assertion Test passed!\n")
-            flt12_negative_assertion_test_passed = True
-        else:
-            print("FLT12 Negative Assertion Test failed: N15V is outside threshold!\n")
-            flt12_negative_assertion_test_passed = False
-        self.psu.toggle_output("2", "OFF")
-        sleep(0.5)
-        self.psu.toggle_output("3", "OFF")
-        sleep(0.5)
-        self.psu.set_voltage(chan="2", val="15")
-        sleep(0.5)
-        self.psu.set_voltage(chan="3", val="15")
-        sleep(0.5)
+            print(f"PSU N15V Rail Voltage: {psu_rb} \n"
+                  f"FLT12 Fault Status Voltage: {flt12_negative_assert_pin_voltage} \n"
+                  f"FLT12 Fault Status Flag: {flt12_flag}\n\n\n")
+            sleep(0.5)
+            if ((flt12_flag is True) and (abs(psu_rb) >= self.N15V_THRES_LOW)
+                    and (abs(psu_rb) <= self.N15V_THRES_HIGH)):
+                print("FLT12 Negative Assertion Test passed!\n")
+                flt12_negative_assertion_test_passed = True
+            else:
+                print("FLT12 Negative Assertion Test failed: N15V is outside threshold!\n")
+                flt12_negative_assertion_test_passed = False
+            self.psu.toggle_output("2", "OFF")
+            sleep(0.5)
+            self.psu.toggle_output("3", "OFF")
+            sleep(0.5)
+            self.psu.set_voltage(chan="2", val="15")
+            sleep(0.5)
+            self.psu.set_voltage(chan="3", val="15")
+            sleep(0.5)
+            on_step("negative",
+                    {"pin_voltage": flt12_negative_assert_pin_voltage,
+                     "ps_voltage": flt12_negative_assert_ps_voltage,
+                     "passed": flt12_negative_assertion_test_passed})
 
         print("FLT12 Fault Test is complete. \n")
 
@@ -262,18 +320,18 @@ class FLT12_Fault_Test:
                        flt12_negative_assertion_test_passed)
         # input(f"BLOCKING Passing returns out...Positive assert pin voltage: {flt12_positive_assert_pin_voltage}")
         # input(f"BLOCKING Passing returns out...Negative assert pin voltage: {flt12_negative_assert_pin_voltage}")
-        return {
-            "test_passed": test_passed,
-            "positive_assertion_test": flt12_positive_assertion_test_passed,
-            "deassertion_test": flt12_deassertion_test_passed,
-            "initial_voltage": self.flt12_initial_voltage,
-            "positive_assert_pin_voltage": flt12_positive_assert_pin_voltage,
-            "positive_assert_ps_voltage": flt12_positive_assert_ps_voltage,
-            "negative_assertion_test": flt12_negative_assertion_test_passed,
-            "negative_assert_pin_voltage": flt12_negative_assert_pin_voltage,
-            "negative_assert_ps_voltage": flt12_negative_assert_ps_voltage,
-            "test_current": self.GEN_TEST_VOLTAGE
-        }
+        return FaultTestResult(
+            test_passed=test_passed,
+            positive_assertion_test=flt12_positive_assertion_test_passed,
+            deassertion_test=flt12_deassertion_test_passed,
+            initial_voltage=self.flt12_initial_voltage,
+            positive_assert_pin_voltage=flt12_positive_assert_pin_voltage,
+            positive_assert_ps_voltage=flt12_positive_assert_ps_voltage,
+            negative_assertion_test=flt12_negative_assertion_test_passed,
+            negative_assert_pin_voltage=flt12_negative_assert_pin_voltage,
+            negative_assert_ps_voltage=flt12_negative_assert_ps_voltage,
+            test_current=self.GEN_TEST_VOLTAGE
+        )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,167 @@
+"""This module grades test results against the pass/fail limits in
+grading_limits.json, so the limits live in one versioned place instead of
+being repeated through the analysis and report code.
+
+The limits file holds one section per record ("current", "fault"). Each
+check in a section is a set of {field: {"min": x, "max": y}} conditions,
+all of which must hold; "verdict": false marks a check that is reported
+but does not decide the unit's pass/fail. A section is compiled once into
+per-condition min/max vectors, and grading a table of results (a
+structured array from results.py, or any mapping of columns) is then a
+single broadcast comparison. The same call grades one unit or a whole
+archive.
+
+M. Capotosto
+10/19/2026
+NSLS-II Diagnostics and Instrumentation"""
+import os
+import json
+import argparse
+from time import perf_counter
+import numpy as np
+
+DEFAULT_LIMITS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                   "grading_limits.json")
+
+
+class RuleSection:
+    """Compiled checks of one result section"""
+
+    def __init__(self, checks):
+        self.names = []
+        self.verdict = []  # Per check: counts towards the section verdict
+        self.fields = []  # Per condition
+        lo = []
+        hi = []
+        starts = []  # Index of each check's first condition
+        for name, conditions in checks.items():
+            conditions = dict(conditions)
+            self.verdict.append(bool(conditions.pop("verdict", True)))
+            if not conditions:
+                raise ValueError(f"Check '{name}' has no conditions")
+            self.names.append(name)
+            starts.append(len(self.fields))
+            for field_name, limit in conditions.items():
+                self.fields.append(field_name)
+                lo.append(limit.get("min", -np.inf))
+                hi.append(limit.get("max", np.inf))
+        if not self.names:
+            raise ValueError("Limits section has no checks")
+        self.verdict = np.array(self.verdict, dtype=bool)
+        self._lo = np.array(lo, dtype=float)
+        self._hi = np.array(hi, dtype=float)
+        self._starts = np.array(starts, dtype=np.intp)
+        self.dtype = np.dtype([(name, "?") for name in self.names] +
+                              [("passed", "?")])
+
+    def limits(self, check, field_name):
+        """(min, max) of one condition; None where unbounded"""
+        index = self.names.index(check)
+        start = self._starts[index]
+        end = self._starts[index + 1] if index + 1 < len(self.names) \
+            else len(self.fields)
+        i = start + self.fields[start:end].index(field_name)
+        return tuple(None if np.isinf(v) else float(v)
+                     for v in (self._lo[i], self._hi[i]))
+
+    def grade(self, table, prefix=""):
+        """Grade every row of 'table' (columns named prefix + field).
+        Returns a structured array with one bool column per check, plus
+        "passed" (all verdict checks passed)."""
+        values = np.column_stack([np.asarray(table[prefix + f], dtype=float)
+                                  for f in self.fields])
+        ok = (values >= self._lo) & (values <= self._hi)
+        checks = np.logical_and.reduceat(ok, self._starts, axis=1)
+        graded = np.empty(len(values), dtype=self.dtype)
+        for i, name in enumerate(self.names):
+            graded[name] = checks[:, i]
+        graded["passed"] = checks[:, self.verdict].all(axis=1)
+        return graded
+
+
+class GradingRules:
+    """A versioned limits file, compiled for grading"""
+
+    def __init__(self, config):
+        self.version = int(config["version"])
+        self.sections = {name: RuleSection(config[name])
+                         for name in ("current", "fault")}
+
+    @classmethod
+    def load(cls, path=DEFAULT_LIMITS_PATH):
+        """Load and compile a limits file"""
+        with open(path, encoding="utf-8") as file:
+            return cls(json.load(file))
+
+    def limits(self, section, check, field_name):
+        """(min, max) of a condition, e.g. for printing in the report"""
+        return self.sections[section].limits(check, field_name)
+
+    def grade(self, section, table, prefix=""):
+        """Grade a table of one section's records (see RuleSection)"""
+        return self.sections[section].grade(table, prefix)
+
+    def grade_values(self, section, values):
+        """Grade one record given as a {field: value} dict.
+        Returns {check: bool, ..., "passed": bool}."""
+        graded = self.grade(section, {k: [v] for k, v in values.items()})[0]
+        return {name: bool(graded[name]) for name in graded.dtype.names}
+
+    def grade_units(self, units):
+        """Re-grade a UnitResult.to_array() table against these limits.
+
+        The fault test's own verdict (fault_test_passed) comes from the
+        assertion sequence and is kept; the current checks and the fault
+        voltage checks are recomputed. Returns a structured array of
+        current checks, fault checks (prefixed "fault_") and "passed"."""
+        current = self.grade("current", units, "current_")
+        fault = self.grade("fault", units, "fault_")
+        dtype = [(name, "?") for name in current.dtype.names[:-1]] + \
+            [(f"fault_{name}", "?") for name in fault.dtype.names[:-1]] + \
+            [("passed", "?")]
+        graded = np.empty(len(units), dtype=dtype)
+        for name in current.dtype.names[:-1]:
+            graded[name] = current[name]
+        for name in fault.dtype.names[:-1]:
+            graded[f"fault_{name}"] = fault[name]
+        graded["passed"] = current["passed"] & fault["passed"] & \
+            units["fault_test_passed"]
+        return graded
+
+
+_DEFAULT_RULES = None
+
+
+def default_rules():
+    """The limits in grading_limits.json, loaded on first use"""
+    global _DEFAULT_RULES  # pylint: disable=global-statement
+    if _DEFAULT_RULES is None:
+        _DEFAULT_RULES = GradingRules.load()
+    return _DEFAULT_RULES
+
+
+if __name__ == "__main__":
+    from results import UnitResult
+    parser = argparse.ArgumentParser(
+        description="Time a re-grade of synthetic unit results")
+    parser.add_argument("--limits", default=DEFAULT_LIMITS_PATH,
+                        help="Limits file to grade against")
+    parser.add_argument("--units", type=int, default=100000,
+                        help="Number of synthetic units")
+    args = parser.parse_args()
+
+    rules = GradingRules.load(args.limits)
+    rng = np.random.default_rng(0)
+    table = np.zeros(args.units, dtype=UnitResult.DTYPE)
+    table["fault_test_passed"] = True
+    table["fault_initial_voltage"] = rng.normal(14.8, 0.2, args.units)
+    for column, mean, sigma in (("current_vpp1", 0.52, 0.01),
+                                ("current_vpp2", 0.52, 0.01),
+                                ("current_vpp3", 21, 0.4),
+                                ("current_frequency", 10, 0.2),
+                                ("current_phase_shift", 179.5, 0.6)):
+        table[column] = rng.normal(mean, sigma, args.units)
+    start = perf_counter()
+    result = rules.grade_units(table)
+    print(f"Limits v{rules.version}: graded {args.units} units in "
+          f"{perf_counter() - start:.3f} s, {result['passed'].sum()} passed")
@@ -14,6 +14,7 @@ NSLS-II Diagnostics and Instrumentation
 from time import sleep
 from instrument_modules.visa_utils import connect_usb_instrument, \
     connect_ethernet_instrument  # Importing utility module
+from instrument_modules.wait_utils import wait_for
 
 TIMEOUT = 20000  # VISA Timeout in ms
 
@@ -66,6 +67,13 @@ class DPO4000:
         command = f"HORIZONTAL:SCALE {hor_scale_length}"
         self.device.write(command)
 
+    def horizontal_position(self, hor_position="50"):
+        """Set the trigger point position as a percentage of the record
+        VALUES: 0 to 100
+        """
+        command = f"HORIZONTAL:POSITION {hor_position}"
+        self.device.write(command)
+
     # *************************************************************************
     # ******VERTICAL Commands******
     def bandwidth(self, chan, bandwidth="FULL"):
@@ -134,6 +142,75 @@ class DPO4000:
         command = f"CH{chan}:YUNITS {units}"
         self.device.write(command)
 
+    # *************************************************************************
+    # ******Trigger Commands******
+    def trigger_type(self, trig_type="EDGE"):
+        """Set the A trigger type
+        VALUES: EDGe | LOGic | PULse | BUS | VIDeo
+        """
+        command = f"TRIGGER:A:TYPE {trig_type}"
+        self.device.write(command)
+
+    def trigger_edge_source(self, source="CH1"):
+        """Set the edge trigger source
+        VALUES: CH1 | CH2 | CH3 | CH4 | EXT | LINE | AUX
+        """
+        command = f"TRIGGER:A:EDGE:SOURCE {source}"
+        self.device.write(command)
+
+    def trigger_edge_slope(self, slope="RISE"):
+        """Set the edge trigger slope
+        VALUES: RISe | FALL | EITHer
+        """
+        command = f"TRIGGER:A:EDGE:SLOPE {slope}"
+        self.device.write(command)
+
+    def trigger_edge_coupling(self, coupling="DC"):
+        """Set the edge trigger coupling
+        VALUES: AC | DC | HFRej | LFRej | NOISErej
+        """
+        command = f"TRIGGER:A:EDGE:COUPLING {coupling}"
+        self.device.write(command)
+
+    def trigger_level(self, source="CH1", level="0"):
+        """Set the trigger level (Volts) for a source channel"""
+        command = f"TRIGGER:A:LEVEL:{source} {level}"
+        self.device.write(command)
+
+    def trigger_holdoff(self, holdoff="20E-09"):
+        """Set the trigger holdoff time
+        Values in E-notation, 20ns to 8s
+        """
+        command = f"TRIGGER:A:HOLDOFF:TIME {holdoff}"
+        self.device.write(command)
+
+    def trigger_mode(self, mode="NORMAL"):
+        """Set the trigger mode
+        VALUES: AUTO | NORMal
+        NORMal only acquires on a valid trigger event.
+        """
+        command = f"TRIGGER:A:MODE {mode}"
+        self.device.write(command)
+
+    def trigger_state(self):
+        """Query the trigger system state
+        Returns: ARMED | AUTO | READY | SAVE | TRIGGER
+        """
+        command = "TRIGGER:STATE?"
+        return self.device.query(command).strip()
+
+    def config_edge_trigger(self, source="CH1", level="0", slope="RISE",
+                            holdoff="20E-09", mode="NORMAL",
+                            coupling="DC"):
+        """Configure a complete edge trigger on a source channel"""
+        self.trigger_type("EDGE")
+        self.trigger_edge_source(source)
+        self.trigger_edge_coupling(coupling)
+        self.trigger_edge_slope(slope)
+        self.trigger_level(source, level)
+        self.trigger_holdoff(holdoff)
+        self.trigger_mode(mode)
+
     # *************************************************************************
     # ******Acquire Commands******
     def select_ch(self, chan):
@@ -151,6 +228,18 @@ class DPO4000:
         command = f"ACQUIRE:STATE {acq_state}"
         self.device.write(command)
 
+    def acquisition_running(self):
+        """Query ACQUIRE:STATE, True while an acquisition is in progress"""
+        command = "ACQUIRE:STATE?"
+        return bool(int(self.device.query(command)))
+
+    def wait_for_acquisition(self, timeout=10, poll_interval=0.05):
+        """Wait for a single-sequence acquisition to trigger and complete.
+        Raises TimeoutError if no trigger arrives within 'timeout' s."""
+        wait_for(lambda: not self.acquisition_running(), timeout=timeout,
+                 poll_interval=poll_interval,
+                 description="Scope single-shot acquisition")
+
     # *************************************************************************
     # ******DATA Commands******
     def data_source(self, chan):
@@ -248,6 +337,28 @@ class DPO4000:
                 good = 0
         return ymult, yzero, yoff, xincr, data
 
+    def config_curve_transfer(self, width="1", enc="RPB"):
+        """Set the curve data format once, for acquire_waveform_fast()"""
+        self.data_width(width)
+        self.data_encoding(enc)
+
+    def waveform_preamble(self):
+        """Query YMULT, YZERO, YOFF and XINCR of the current data source in
+        one round trip. Returns them as a tuple of floats."""
+        command = "WFMOUTPRE:YMULT?;YZERO?;YOFF?;XINCR?"
+        response = self.device.query(command)
+        return tuple(float(value) for value in response.strip().split(";"))
+
+    def acquire_waveform_fast(self, chan):
+        """Transfer one channel with a single preamble query and no retry
+        loop, for repeated transfers (e.g. a live display). The data format
+        must already be set with config_curve_transfer()."""
+        self.data_source(chan)
+        ymult, yzero, yoff, xincr = self.waveform_preamble()
+        self.device.write("CURVE?")
+        data = self.device.read_raw()
+        return ymult, yzero, yoff, xincr, data
+
     def scope_test(self):
         """Scope test"""
         self.vertical_position("1", "1")
@@ -260,14 +371,49 @@ class DPO4000:
         self.vertical_position("4", "-5")
         sleep(1)
 
-    def measure_amplitude(self, chan, meastype):
-        """Select Channel waveform on/off, select for acq"""
-        command = f"MEASUrement:IMMed:SOUrce{chan}"
+    # *************************************************************************
+    # ******MEASUREMENT Commands******
+    def measure_amplitude(self, chan, meastype="PK2PK"):
+        """Take a single immediate measurement on a channel and return it
+        VALUES: PK2PK | AMPlitude | FREQuency | MEAN | RMS | MAXimum | ...
+        """
+        self.device.write(f"MEASUREMENT:IMMED:SOURCE1 CH{chan}")
+        self.device.write(f"MEASUREMENT:IMMED:TYPE {meastype}")
+        return float(self.device.query("MEASUREMENT:IMMED:VALUE?"))
+
+    def measurement_type(self, slot, meastype):
+        """Set the measurement type of a MEAS<slot> slot
+        VALUES: PK2PK | FREQuency | PHAse | MEAN | AMPlitude | RMS | ...
+        """
+        command = f"MEASUREMENT:MEAS{slot}:TYPE {meastype}"
+        self.device.write(command)
+
+    def measurement_source(self, slot, chan, source_num="1"):
+        """Set source 1 (or source 2, for PHAse/DELay) of a MEAS<slot> slot"""
+        command = f"MEASUREMENT:MEAS{slot}:SOURCE{source_num} CH{chan}"
+        self.device.write(command)
+
+    def measurement_state(self, slot, state="ON"):
+        """Enable/disable a MEAS<slot> slot"""
+        command = f"MEASUREMENT:MEAS{slot}:STATE {state}"
         self.device.write(command)
 
-        command = f"MEASUrement:IMMed:TYPe{meastype}"
-        voltage = self.device.write(command)
-        return voltage
+    def config_measurement(self, slot, meastype, chan, chan2=None):
+        """Configure and enable a MEAS<slot> slot. chan2 is the reference
+        channel for two-source measurements such as PHAse."""
+        self.measurement_type(slot, meastype)
+        self.measurement_source(slot, chan, "1")
+        if chan2 is not None:
+            self.measurement_source(slot, chan2, "2")
+        self.measurement_state(slot, "ON")
+
+    def query_measurements(self, slots):
+        """Query the values of several MEAS<slot> slots in one round trip.
+        Returns a list of floats in the order of 'slots'."""
+        command = ";".join(f":MEASUREMENT:MEAS{slot}:VALUE?"
+                           for slot in slots)
+        response = self.device.query(command)
+        return [float(value) for value in response.strip().split(";")]
 
 
 if __name__ == "__main__":
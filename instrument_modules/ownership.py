@@ -0,0 +1,87 @@
+"""This module provides per-instrument ownership locks so that test stages
+running on different threads cannot drive the same instrument at once, and
+a helper to run a stage (e.g. scope configuration) in the background while
+another stage owns the remaining instruments.
+
+M. Capotosto
+10/19/2026
+NSLS-II Diagnostics and Instrumentation
+"""
+import threading
+from contextlib import contextmanager, ExitStack
+from concurrent.futures import Future
+
+_REGISTRY_LOCK = threading.Lock()
+_LOCKS = {}  # id(instrument) -> threading.RLock
+_OWNERS = {}  # id(instrument) -> name of the owning stage
+
+
+def _instrument_lock(instrument):
+    """Return the (lazily created) ownership lock for an instrument"""
+    with _REGISTRY_LOCK:
+        return _LOCKS.setdefault(id(instrument), threading.RLock())
+
+
+def owner_of(instrument):
+    """Return the name of the stage currently owning the instrument, or
+    None if it is free"""
+    return _OWNERS.get(id(instrument))
+
+
+@contextmanager
+def claim(stage, *instruments, timeout=None):
+    """Own the instruments for the duration of a with-block.
+
+    Blocks until any other stage releases them. Locks are taken in a fixed
+    order so two stages claiming overlapping sets cannot deadlock. The same
+    thread may re-claim an instrument it already owns.
+
+    Raises TimeoutError if an instrument is not released within 'timeout'
+    seconds.
+    """
+    ordered = sorted(set(instruments), key=id)
+    with ExitStack() as stack:
+        for instrument in ordered:
+            lock = _instrument_lock(instrument)
+            if not lock.acquire(timeout=-1 if timeout is None else timeout):
+                raise TimeoutError(f"{type(instrument).__name__} is owned by "
+                                   f"'{owner_of(instrument)}', '{stage}' "
+                                   f"timed out waiting for it")
+            stack.callback(lock.release)
+            previous = _OWNERS.get(id(instrument))
+            _OWNERS[id(instrument)] = stage
+            stack.callback(_restore_owner, instrument, previous)
+        yield
+
+
+def _restore_owner(instrument, previous):
+    """Hand the owner name back on release (handles nested claims)"""
+    if previous is None:
+        _OWNERS.pop(id(instrument), None)
+    else:
+        _OWNERS[id(instrument)] = previous
+
+
+def run_in_background(stage, instruments, func, *args, **kwargs):
+    """Run func(*args, **kwargs) on a worker thread while owning the given
+    instruments. Returns a concurrent.futures.Future for the result.
+
+    Ownership is taken before this function returns, so any stage that
+    claims the same instruments afterwards waits for func to finish.
+    """
+    future = Future()
+    claimed = threading.Event()
+
+    def worker():
+        try:
+            with claim(stage, *instruments):
+                claimed.set()
+                future.set_result(func(*args, **kwargs))
+        except BaseException as e:  # pylint: disable=broad-except
+            future.set_exception(e)
+        finally:
+            claimed.set()
+
+    threading.Thread(target=worker, name=stage, daemon=True).start()
+    claimed.wait()
+    return future
@@ -0,0 +1,39 @@
+"""This module provides a polling "wait for condition" primitive shared by
+the instrument drivers and test modules, replacing fixed sleep() delays
+with checks that return as soon as the instrument reports it is ready.
+
+M. Capotosto
+10/19/2026
+NSLS-II Diagnostics and Instrumentation
+"""
+from time import monotonic, sleep
+
+DEFAULT_TIMEOUT = 10.0  # Seconds
+DEFAULT_POLL_INTERVAL = 0.1  # Seconds between polls
+
+
+def wait_for(condition, timeout=DEFAULT_TIMEOUT,
+             poll_interval=DEFAULT_POLL_INTERVAL, description="Condition"):
+    """Poll condition() until it returns a truthy value, and return it.
+
+    Parameters:
+        condition (callable): Takes no arguments. Any truthy return value
+                              (e.g. a tuple of readings) ends the wait.
+        timeout (float): Seconds before giving up.
+        poll_interval (float): Seconds to sleep between polls.
+        description (str): Used in the log line and timeout message.
+
+    Raises:
+        TimeoutError: If the condition does not hold within 'timeout'.
+    """
+    start = monotonic()
+    while True:
+        value = condition()
+        elapsed = monotonic() - start
+        if value:
+            print(f"{description} ready after {elapsed:.2f} s")
+            return value
+        if elapsed >= timeout:
+            raise TimeoutError(f"{description} not ready after "
+                               f"{elapsed:.2f} s")
+        sleep(poll_interval)
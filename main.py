@@ -4,26 +4,69 @@ M. Capotosto
 3/5/2025
 NSLS-II Diagnostics and Instrumentation"""
 
-import csv
 import sys
+import argparse
 import os
+import sqlite3
+from dataclasses import asdict
 from time import sleep
 from datetime import datetime
-from plotter_calculator import plot_waveforms
+import numpy as np
+from plotter_calculator import unpack_raw_adc, sample_interval, \
+    analyze_volts, render_waveforms, render_waveforms_async
 from functional_tests.fault_test import FLT12_Fault_Test
-from functional_tests.current_test import current_test
+from functional_tests.current_test import current_test, init_scope_ct
 from instrument_modules.rigol_dp800 import DP800
 from instrument_modules.rigol_dg4000 import DG4000
 from instrument_modules.Tek_DPO4000 import DPO4000
 # from instrument_modules.keithley_2100 import Keithley2100
 from instrument_modules.keysight_34461a import Keysight34461A
+from instrument_modules.ownership import claim, run_in_background
 from report_generator import plot_pdf
+from results import UnitResult
+from grading_rules import default_rules
+from waveform_store import waveform_bytes, open_waveforms, WAVEFORM_SUFFIX
+from results_store import append_result
+from run_index import RunIndex
+from run_layout import run_dir_path, resolve_run_dir, LAYOUT_SHARDED, \
+    DEFAULT_ROOT
+from plot_worker import PlotRenderWorker
+from result_writer import ResultWriter
+from run_journal import RunJournal, load_journal
+from waveform_compression import parse_codec
+from waveform_monitor import run_live_monitor
 
 SCRIPT_REVISION = 0  # Revision # for report tracking purposes...
 # *************************************************************************
 # ******Constants******
 GEN_TEST_FREQ = "10"  # Set test frequency (Hz)
 GEN_TEST_VOLTAGE = "20"  # Set function gen voltage, VPP
+# Fast mode grades the current test from on-scope measurements, and only
+# transfers/plots waveforms on a failure or for every Nth (archive) unit.
+CURRENT_TEST_FAST_MODE = False
+ARCHIVE_SAMPLE_INTERVAL = 10  # Fast mode: keep waveforms of every Nth unit
+# Grade the current test from the mean of up to this many acquisitions,
+# stopping early once the averages are stable (1 = single shot)
+CURRENT_TEST_SHOTS = 1
+# Waveform plot rendering: "sync" renders before continuing, "async" renders
+# on a background thread, "process" renders in a separate worker process
+# (plot_worker.py) so it never competes with instrument control, "skip"
+# writes no plot.
+PLOT_RENDER_MODE = "process"
+# Offer the live waveform monitor (waveform_monitor.py) when the current
+# test fails, while the DCCT is still driven, to debug the wiring.
+LIVE_MONITOR_ON_FAILURE = True
+# Compression of the saved waveform files (waveform_compression.py), e.g.
+# "zlib+delta". Waveform files are ~1% of the archive (PNGs and PDFs are
+# the bulk), so they are kept raw and memory-mappable by default.
+# "python waveform_compression.py" compares the options on Test_Data.
+WAVEFORM_CODEC = "raw"
+WAVEFORM_CODEC_LEVEL = None  # zlib/lzma level, None for the default
+# Test_Data layout of new run directories (run_layout.py): LAYOUT_SHARDED
+# files them under <model>/<YYYY>/<MM>/<DD>/, LAYOUT_FLAT as
+# DCCT_<sn>-<timestamp> in Test_Data itself. The tools read both; existing
+# flat runs are moved with "python run_layout.py".
+RUN_DIR_LAYOUT = LAYOUT_SHARDED
 
 # *************************************************************************
 # ******Set Insturment IP Addresses******
@@ -62,14 +105,14 @@ def get_current_datetime():
         report_time_formatted_l
 
 
-def create_test_directories(dcct_sn, dir_time_formatted):
+def create_test_directories(dcct_sn, dir_create_time):
     """Create any missing parent directories, make new DCCT directory, raw
     data subdirectories"""
     # Define paths
-    report_path = os.path.join("Test_Data", f"DCCT_{dcct_sn}-"
-                               f"{dir_time_formatted}",
-                               f"DCCT_{dcct_sn}_Report.pdf")
-    raw_data_path = f"./Test_Data/DCCT_{dcct_sn}-{dir_time_formatted}/raw_data"
+    run_dir = run_dir_path(DEFAULT_ROOT, dcct_sn, dir_create_time,
+                           RUN_DIR_LAYOUT)
+    report_path = os.path.join(run_dir, f"DCCT_{dcct_sn}_Report.pdf")
+    raw_data_path = os.path.join(run_dir, "raw_data")
 
     # Create parent directories for report and raw data paths (not including
     # the file name)
@@ -92,6 +135,12 @@ def get_test_tech_info():
     while True:
         tester_name = input("Enter your name: ")
         tester_life = input("Enter your Life #: ")
+        try:  # Reject entries too long for the result record
+            UnitResult(tester_name=tester_name,
+                       tester_life=tester_life).to_bytes()
+        except ValueError as e:
+            print(f"Entry too long, please re-enter: {e}")
+            continue
 
         if input(f"You entered: {tester_name}, {tester_life},"
                  f" is this correct? <Y/N>: ") in ("Y", "y"):
@@ -111,26 +160,21 @@ def save_test_tech_info():
         [tester_name, tester_life]
     ]
 
-    try:
-        # Open the file in write mode (will create the file if it doesn't
-        # exist)
-        with open(file_path_l, mode='w', newline='', encoding='utf-8') \
-                as file_l:
-            writer = csv.writer(file_l)
-
-            # Write the header and the data rows
-            writer.writerows(data)
-
-        print(f"Tester data saved to: {file_path_l}")
-
-    except OSError as e:
-        print(f"Error writing to {file_path_l}: {e}")
+    # Written in the background; failures are reported at the end of the
+    # unit (result_writer.flush)
+    result_writer.submit_csv(file_path_l, data)
+    print(f"Tester data queued for: {file_path_l}")
 
 
 def get_dcct_info():
     """Acquire DCCT Serial No./Type Information"""
     while True:
         dcct_sn_raw = input("Enter DCCT S/N: ")
+        try:  # Reject labels too long for the result record
+            UnitResult(dcct_sn_raw=dcct_sn_raw).to_bytes()
+        except ValueError as e:
+            print(f"Label too long, please re-scan: {e}")
+            continue
         dcct_sn = dcct_sn_raw[:13]
         if input(f"You entered: {dcct_sn}, is this correct? <Y/N>: ") in \
                 ("Y", "y"):
@@ -138,26 +182,14 @@ def get_dcct_info():
                 report_time_formatted = get_current_datetime()
             # Create test data directories
             report_path, raw_data_path = \
-                create_test_directories(dcct_sn, dir_time_formatted)
+                create_test_directories(dcct_sn, dir_create_time)
 
             file_path_l = os.path.join(raw_data_path,
                                        f"{dcct_sn}_raw_label.csv")
             data = [dcct_sn_raw]
 
-            try:
-                # Open the file in write mode (will create the file if it
-                # doesn't exist)
-                with open(file_path_l, mode='w', newline='',
-                          encoding='utf-8') as file_l:
-                    writer = csv.writer(file_l)
-
-                    # Write the header and the data rows
-                    writer.writerows(data)
-
-                print(f"Tester data saved to: {file_path_l}")
-
-            except OSError as e:
-                print(f"Error writing to {file_path_l}: {e}")
+            result_writer.submit_csv(file_path_l, data)
+            print(f"Tester data queued for: {file_path_l}")
         return dcct_sn, dir_create_time, dir_time_formatted, \
             report_date_formatted, report_time_formatted, \
             report_path, raw_data_path, dcct_sn_raw
@@ -204,32 +236,28 @@ def gen_init():
 
 # *************************************************************************
 # ******Run FAULT 1/FAULT2 Testing******
-def run_fault_test():
-    """Call the fault_test function."""
+def run_fault_test(completed_phases=None):
+    """Call the fault_test function. completed_phases: fault test phases
+    journaled before an interruption (--resume), skipped on the first
+    attempt."""
     while True:
         fault_test = FLT12_Fault_Test(psu, gen, dmm)
-        fault_test_results_l = fault_test.run_the_fault_test()
+        journal.record("fault_start")
+        for phase, data in (completed_phases or {}).items():
+            journal.fault_step(phase, data)  # Carried over into this attempt
+        fault_test_results_l = fault_test.run_the_fault_test(
+            on_step=journal.fault_step, completed=completed_phases)
+        completed_phases = None  # Repeats run every phase
+        fault_test_row = asdict(fault_test_results_l)
         # **********************************************************************************
         # Save test data to file...
         file_path_l = os.path.join(raw_data_path,
                                    f"{dcct_sn}_fault_test_raw_data.csv")
 
-        try:
-            with open(file_path_l, mode='w', encoding='utf-8', newline='') \
-                    as file:
-                writer = csv.writer(file)
-
-                # Write the header (keys of the dictionary)
-                writer.writerow(fault_test_results_l.keys())
-
-                # Write the values (dictionary values in the same order
-                # as the keys)
-                writer.writerow(fault_test_results_l.values())
-
-            print(f"Fault test results saved to: {file_path_l}")
-
-        except OSError as e:
-            print(f"Error writing to {file_path_l}: {e}")
+        # Header (record field names), then the values in the same order
+        result_writer.submit_csv(file_path_l, [fault_test_row.keys(),
+                                               fault_test_row.values()])
+        print(f"Fault test results queued for: {file_path_l}")
 
         # ************************************************************************************
 
@@ -241,10 +269,10 @@ def run_fault_test():
         print("Cycling DCCT PSU power...\n\n")
         sleep(3)
 
-        if (fault_test_results_l["test_passed"]
-                and fault_test_results_l["positive_assertion_test"]
-                and fault_test_results_l["negative_assertion_test"]
-                and fault_test_results_l["deassertion_test"]):
+        if (fault_test_results_l.test_passed
+                and fault_test_results_l.positive_assertion_test
+                and fault_test_results_l.negative_assertion_test
+                and fault_test_results_l.deassertion_test):
             print("All FLT12 Status tests passed. Proceeding to DCCT Current "
                   "Testing...\n\n")
             return fault_test_results_l
@@ -266,106 +294,233 @@ def run_fault_test():
 # *************************************************************************
 # ******Run Current Testing******
 
-def run_current_test():
+def run_current_test(scope_setup_l=None, archive_sample_l=False):
     """Call the run_current_test function."""
-    current_channel_data_l, current_decoded_wfdata_l = \
-        current_test(gen, psu, scope)
+    current_channel_data_l, current_decoded_wfdata_l, scope_result_l, \
+        shot_stats_l = current_test(gen, psu, scope, scope_setup_l,
+                                    fast=CURRENT_TEST_FAST_MODE,
+                                    archive_sample=archive_sample_l,
+                                    shots=CURRENT_TEST_SHOTS)
+    if current_channel_data_l is None:
+        print("Fast mode: passed on scope measurements, no waveforms "
+              "transferred.")
+        return None, None, None, scope_result_l, None
 
     # **********************************************************************************
     # Save raw data to file...
 
     # **********************************************************************************
-    # Save raw channel data
+    # Save raw channel data (native waveform file, see waveform_store.py)
     file_path_chan_l = os.path.join(raw_data_path,
-                                    f"{dcct_sn}_channel_data.csv")
+                                    f"{dcct_sn}{WAVEFORM_SUFFIX}")
     current_plot_filename_l = os.path.join(raw_data_path,
                                            f"waveform_plots_{dcct_sn}"
                                            f"_{dir_time_formatted}.png")
-    try:
-        # Open the file in write mode and automatically close when the
-        # block is finished
-        with open(file_path_chan_l, mode='w', newline='', encoding='utf-8') \
-                as file_chan_l:
-            writer = csv.writer(file_chan_l)
-            header = ["Channel", "Y Multiplier", "Y Zero", "Y Offset",
-                      "X Incrementation", "Waveform Data"]
-            writer.writerow(header)
-
-            # Write the channel data for each channel inside the open block
-            for channel, data in current_channel_data_l.items():
-                writer.writerow([channel, data["ymult"], data["yzero"],
-                                 data["yoff"], data["xincr"], data["data"]])
-
-        print(f"Raw WF Channel Data saved to: {file_path_chan_l}")
-
-    except OSError as e:
-        print(f"Error writing to {file_path_chan_l}: {e}")
+    result_writer.submit(file_path_chan_l, waveform_bytes(
+        current_channel_data_l, current_decoded_wfdata_l, dir_create_time,
+        parse_codec(WAVEFORM_CODEC), WAVEFORM_CODEC_LEVEL))
+    print(f"Raw WF Channel Data queued for: {file_path_chan_l}")
 
     return current_channel_data_l, current_decoded_wfdata_l, \
-        current_plot_filename_l
+        current_plot_filename_l, scope_result_l, shot_stats_l
 # *************************************************************************
 # ******Generate Report Dictionaries/Dataset...******
 # *************************************************************************
 
 
-def generate_report_dataset():
-    """Generate data dictionary for the report_generator.py module"""
+def generate_report_dataset(unit_result_l):
+    """Generate data dictionary for the report_generator.py module from a
+    UnitResult record"""
+    fault = unit_result_l.fault
+    current = unit_result_l.current
     dut_info_l = {
-        "Title": f"DCCT Test Results for DCCT S/N: {dcct_sn}",
-        "Technician": f"{tester_name}",
-        "Life": f"{tester_life}",
-        "DCCT_sn_raw": f"{dcct_sn_raw}",
-        "Date": f"{report_date_formatted}",
-        "Time": f"{report_time_formatted}",
-        "flt12_test_passed_l": fault_test_results["test_passed"],
+        "Title": f"DCCT Test Results for DCCT S/N: {unit_result_l.dcct_sn}",
+        "Technician": f"{unit_result_l.tester_name}",
+        "Life": f"{unit_result_l.tester_life}",
+        "DCCT_sn_raw": f"{unit_result_l.dcct_sn_raw}",
+        "Date": f"{unit_result_l.test_time.strftime('%m/%d/%y')}",
+        "Time": f"{unit_result_l.test_time.strftime('%I:%M %p')}",
+        "flt12_test_passed_l": fault.test_passed,
         "flt12_positive_assertion_test_passed_l":
-            fault_test_results["positive_assertion_test"],
+            fault.positive_assertion_test,
         "flt12_negative_assertion_test_passed_l":
-            fault_test_results["negative_assertion_test"],
-        "flt12_deassertion_test_passed_l":
-            fault_test_results["deassertion_test"],
-        "flt12_initial_voltage_l": fault_test_results["initial_voltage"],
-        "flt12_positive_signal_voltage_l":
-            fault_test_results["positive_assert_pin_voltage"],
-        "flt12_negative_signal_voltage_l":
-            fault_test_results["negative_assert_pin_voltage"],
-        "flt12_positive_psu_voltage_l":
-            fault_test_results["positive_assert_ps_voltage"],
-        "flt12_negative_psu_voltage_l":
-            fault_test_results["negative_assert_ps_voltage"],
-        "dcct_sn_raw": dcct_sn_raw,
-        "flt12_test_current": fault_test_results["test_current"],
-        "current_test_ch1_threshold": ch1_threshold,
-        "current_test_ch2_threshold": ch2_threshold,
-        "current_test_ch3_threshold": ch3_threshold,
-        "current_test_frequency": frequency,
-        "current_test_phase_shift": phase_shift,
-        "current_test_freq_phase_pass": freq_phase_pass,
-        "current_test_vpp1": vpp1,
-        "current_test_vpp2": vpp2,
-        "current_test_vpp3": vpp3
+            fault.negative_assertion_test,
+        "flt12_deassertion_test_passed_l": fault.deassertion_test,
+        "flt12_initial_voltage_l": fault.initial_voltage,
+        "flt12_positive_signal_voltage_l": fault.positive_assert_pin_voltage,
+        "flt12_negative_signal_voltage_l": fault.negative_assert_pin_voltage,
+        "flt12_positive_psu_voltage_l": fault.positive_assert_ps_voltage,
+        "flt12_negative_psu_voltage_l": fault.negative_assert_ps_voltage,
+        "dcct_sn_raw": unit_result_l.dcct_sn_raw,
+        "flt12_test_current": fault.test_current,
+        "current_test_ch1_threshold": current.ch1_threshold,
+        "current_test_ch2_threshold": current.ch2_threshold,
+        "current_test_ch3_threshold": current.ch3_threshold,
+        "current_test_frequency": current.frequency,
+        "current_test_phase_shift": current.phase_shift,
+        "current_test_freq_phase_pass": current.freq_phase_pass,
+        "current_test_vpp1": current.vpp1,
+        "current_test_vpp2": current.vpp2,
+        "current_test_vpp3": current.vpp3,
+        "current_test_distortion_analyzed": current.distortion_analyzed,
+        "current_test_dc_offset": (current.dc_offset1, current.dc_offset2,
+                                   current.dc_offset3),
+        "current_test_thd": (current.thd1, current.thd2, current.thd3),
+        "current_test_snr": (current.snr1, current.snr2, current.snr3),
+        "current_test_sinad": (current.sinad1, current.sinad2,
+                               current.sinad3),
+        "current_test_gain_mismatch": current.gain_mismatch
     }
     return dut_info_l
 
+
+def no_plot_reason(result, channel_data_l):
+    """Why a current test result has no plot (a report_generator
+    NO_PLOT_MESSAGES key), or None if it has one"""
+    if result.plot_filename:
+        return None
+    if not result.distortion_analyzed:
+        return "fast_mode"  # Graded on the scope, nothing transferred
+    if channel_data_l is None:
+        return "not_saved"  # Resumed without its waveform file
+    if PLOT_RENDER_MODE == "skip":
+        return "skipped"
+    return "render_failed"
+
+
+def resume_run_paths(run_dir, unit):
+    """Paths and times of an interrupted run, as get_dcct_info returns them
+    for a new one"""
+    test_time = unit["test_time"]
+    return unit["dcct_sn"], test_time, \
+        test_time.strftime("%m-%d-%y_%H-%M-%S"), \
+        test_time.strftime("%m/%d/%y"), test_time.strftime("%I:%M %p"), \
+        os.path.join(run_dir, f"DCCT_{unit['dcct_sn']}_Report.pdf"), \
+        os.path.join(run_dir, "raw_data"), unit["dcct_sn_raw"]
+
+
+def load_saved_waveforms(waveform_path):
+    """Channel data of a resumed run's waveform file, or (None, None)"""
+    if not os.path.exists(waveform_path):
+        return None, None
+    with open_waveforms(waveform_path) as wf:
+        channel_data_l = wf.channel_data()
+        decoded_wfdata_l = {i: {"adc_wave": np.array(ch["adc_wave"])}
+                            for i, ch in wf.decoded_wfdata().items()}
+    return channel_data_l, decoded_wfdata_l
+
+
+def render_plot(result, volts_l, scope_time_l):
+    """Render a current test plot in this process. Clears
+    result.plot_filename if it cannot be rendered."""
+    try:
+        render_waveforms(result, volts_l, scope_time_l, result.plot_filename)
+    except Exception as e:  # pylint: disable=broad-except
+        print(f"Error rendering the waveform plot: {e}, the report is "
+              f"generated without it.")
+        result.plot_filename = ""
+
+
+def save_raw_data(stage):
+    """Wait for the queued raw data files to reach the disk, offering to
+    retry failed writes. Returns the paths of the files still not saved."""
+    while True:
+        failures = result_writer.flush()
+        for failure in failures:
+            print(f"Error writing to {failure.path}: {failure.error}")
+        if not failures:
+            return []
+        if input(f"{len(failures)} raw data file(s) of the {stage} were not "
+                 f"saved. Retry? <Y/N>: ") not in ("Y", "y"):
+            return [failure.path for failure in failures]
+        for failure in failures:
+            if failure.data is not None:
+                result_writer.submit(failure.path, failure.data)
+
+
+def resubmit_missing_files(state):
+    """Queue again the raw data files of a resumed run's journaled stages
+    that never reached the disk"""
+    files = {
+        f"{dcct_sn}_Technician_Data.csv": [
+            ["tester_name", "tester_life"],
+            [state.unit["tester_name"], state.unit["tester_life"]]],
+        f"{dcct_sn}_raw_label.csv": [state.unit["dcct_sn_raw"]],
+    }
+    if state.fault is not None:
+        fault_test_row = asdict(state.fault)
+        files[f"{dcct_sn}_fault_test_raw_data.csv"] = [
+            fault_test_row.keys(), fault_test_row.values()]
+    for name, rows in files.items():
+        file_path_l = os.path.join(raw_data_path, name)
+        if not os.path.exists(file_path_l):
+            result_writer.submit_csv(file_path_l, rows)
+            print(f"Missing raw data re-queued for: {file_path_l}")
+
 # *************************************************************************
 # ******Carry out the testing...******
 # *************************************************************************
 
 
-tester_name, tester_life = get_test_tech_info()  # Get test technician info
+arg_parser = argparse.ArgumentParser(description="ALSu DCCT test station")
+arg_parser.add_argument("--resume", metavar="RUN_DIR",
+                        help="Continue an interrupted unit from its journal")
+args = arg_parser.parse_args()
 
+resume_state = None
+if args.resume:
+    # A run recorded before the archive was migrated to the sharded layout
+    if not os.path.isdir(args.resume):
+        args.resume = resolve_run_dir(DEFAULT_ROOT, args.resume) or \
+            args.resume
+    try:
+        resume_state = load_journal(args.resume)
+    except OSError as e:
+        print(f"Error reading the journal of {args.resume}: {e}")
+        sys.exit(1)
+    if resume_state.unit is None:
+        print(f"{args.resume} has no unit information to resume from.")
+        sys.exit(1)
+    if resume_state.complete:
+        print(f"{args.resume} is already complete.")
+        sys.exit(0)
+    tester_name = resume_state.unit["tester_name"]
+    tester_life = resume_state.unit["tester_life"]
+else:
+    tester_name, tester_life = get_test_tech_info()  # Get test technician info
+
+
+# Raw data files are written in the background (result_writer.py)
+result_writer = ResultWriter()
+
+# Start the render process now, so matplotlib is loaded before it is needed
+plot_worker = PlotRenderWorker() if PLOT_RENDER_MODE == "process" else None
 
 LOOP_FLAG = 1
+UNIT_COUNT = 0  # Units tested this session
 
 while LOOP_FLAG == 1:
+    unsaved_files = []  # Raw data files of this unit that were not saved
 
-    dcct_sn, dir_create_time, dir_time_formatted, report_date_formatted, \
+    if resume_state is not None:
+        dcct_sn, dir_create_time, dir_time_formatted, report_date_formatted, \
             report_time_formatted, report_path, raw_data_path, dcct_sn_raw \
-            = get_dcct_info()  # Get DCCT S/N
-    # Record the time at the start of the test for reporting, file \
-    # naming purposes.
-    print("Test data directories created...")
-    save_test_tech_info()  # Save technician data to the new test directory...
+            = resume_run_paths(args.resume, resume_state.unit)
+        journal = RunJournal(args.resume)
+        print(f"Resuming DCCT {dcct_sn} from {journal.path}...")
+        resubmit_missing_files(resume_state)
+    else:
+        dcct_sn, dir_create_time, dir_time_formatted, report_date_formatted, \
+                report_time_formatted, report_path, raw_data_path, \
+                dcct_sn_raw = get_dcct_info()  # Get DCCT S/N
+        # Record the time at the start of the test for reporting, file \
+        # naming purposes.
+        print("Test data directories created...")
+        save_test_tech_info()  # Save technician data to the new directory
+        journal = RunJournal(os.path.dirname(raw_data_path))
+        journal.record("unit", dcct_sn=dcct_sn, dcct_sn_raw=dcct_sn_raw,
+                       tester_name=tester_name, tester_life=tester_life,
+                       test_time=dir_create_time.isoformat())
 
     input("Confirm all connections are made as per the wiring diagrams.\n\n"
           "Ensure GRAY CT conductors go to GRAY terminal blocks, BLUE "
@@ -386,31 +541,114 @@ while LOOP_FLAG == 1:
           "x20 Attenuation. Press return to continue...")
 
     # *************************************************************************
-    # ******Initialize Instruments******
+    # ******Configure the scope in the background******
+    # The scope is idle during the fault test, so set it up for the current
+    # test now. The current test waits on the scope's ownership lock.
     # *************************************************************************
-    print("Initializing PSU...")
-    psu_init()
-    print("Initializing Signal Generator...")
-    gen_init()
-
-    # *************************************************************************
-    # ******Run DCCT FLT12/FAULT 1/FAULT 2 Test******
-    print("Beginning DCCT FLT12 Fault1/Fault2 Test...")
-    fault_test_results = run_fault_test()
+    print("Configuring Oscilloscope in the background...")
+    scope_setup = run_in_background("scope setup", (scope,),
+                                    init_scope_ct, scope)
+
+    with claim("fault test", psu, gen, dmm):
+        # *********************************************************************
+        # ******Initialize Instruments******
+        # *********************************************************************
+        print("Initializing PSU...")
+        psu_init()
+        print("Initializing Signal Generator...")
+        gen_init()
+
+        # *********************************************************************
+        # ******Run DCCT FLT12/FAULT 1/FAULT 2 Test******
+        if resume_state is not None and resume_state.fault is not None:
+            print("FLT12 Fault1/Fault2 Test completed before the "
+                  "interruption, skipping...")
+            fault_test_results = resume_state.fault
+        else:
+            print("Beginning DCCT FLT12 Fault1/Fault2 Test...")
+            fault_test_results = run_fault_test(
+                resume_state.fault_phases if resume_state else None)
+            # Journal the stage only once its raw data is on disk, or a
+            # resume would skip it with its files missing
+            stage_unsaved = save_raw_data("fault test")
+            unsaved_files += stage_unsaved
+            if not stage_unsaved:
+                journal.record_result("fault_test", fault_test_results)
 
     # *************************************************************************
     # ******Run DCCT CURRENT Testing******
-    print("Beginning DCCT Current test...")
-    current_channel_data, current_decoded_wfdata, current_plot_filename = \
-        run_current_test()
-    current_plot_filename_l = os.path.join(raw_data_path,
-                                           f"waveform_plots_{dcct_sn}"
-                                           f"_{dir_time_formatted}.png")
-
-    plot_filename, ch1_threshold, ch2_threshold, ch3_threshold, \
-        frequency, phase_shift, freq_phase_pass, vpp1, vpp2, vpp3 = \
-        plot_waveforms(current_channel_data, current_decoded_wfdata,
-                       current_plot_filename_l)
+    plot_future = None
+    resumed_current = resume_state is not None and \
+        resume_state.current is not None
+    if resumed_current:
+        print("DCCT Current test completed before the interruption, "
+              "skipping...")
+        current_test_results = resume_state.current
+        current_channel_data, current_decoded_wfdata = load_saved_waveforms(
+            os.path.join(raw_data_path, f"{dcct_sn}{WAVEFORM_SUFFIX}"))
+        if current_test_results.plot_filename and \
+                not os.path.exists(current_test_results.plot_filename):
+            if current_channel_data is None:
+                current_test_results.plot_filename = ""
+            else:  # Re-plot the saved waveforms
+                volts, _, _, scope_time = unpack_raw_adc(
+                    current_channel_data, current_decoded_wfdata)
+                render_plot(current_test_results, volts, scope_time)
+    else:
+        print("Beginning DCCT Current test...")
+        current_channel_data, current_decoded_wfdata, \
+            current_plot_filename, scope_test_results, shot_stats = \
+            run_current_test(
+                scope_setup, UNIT_COUNT % ARCHIVE_SAMPLE_INTERVAL == 0)
+        UNIT_COUNT += 1
+
+        if current_channel_data is None:
+            # Fast mode pass, graded on the scope
+            current_test_results = scope_test_results
+        else:
+            # Grade first; rendering never holds up the pass/fail path
+            volts, _, _, scope_time = unpack_raw_adc(current_channel_data,
+                                                     current_decoded_wfdata)
+            graded_plot_filename = \
+                current_plot_filename if PLOT_RENDER_MODE != "skip" else ""
+            if shot_stats is not None:
+                # Multi-shot: grade and plot the averages
+                current_test_results = shot_stats.result(
+                    graded_plot_filename)
+                volts = shot_stats.mean_volts()
+            else:
+                current_test_results = analyze_volts(
+                    volts, 1 / sample_interval(current_channel_data),
+                    graded_plot_filename)
+            if PLOT_RENDER_MODE == "sync":
+                render_plot(current_test_results, volts, scope_time)
+            elif PLOT_RENDER_MODE == "async":
+                plot_future = render_waveforms_async(
+                    current_test_results, volts, scope_time,
+                    current_plot_filename)
+            elif PLOT_RENDER_MODE == "process":
+                plot_future = plot_worker.submit(
+                    current_test_results, volts, scope_time,
+                    current_plot_filename)
+        stage_unsaved = save_raw_data("current test")
+        unsaved_files += stage_unsaved
+        if plot_future is not None:
+            # Resolve the plot before plot_filename is recorded anywhere
+            try:
+                plot_future.result()
+            except Exception as e:  # pylint: disable=broad-except
+                print(f"Error rendering the waveform plot in the background: "
+                      f"{e}, rendering it here instead...")
+                render_plot(current_test_results, volts, scope_time)
+        if not stage_unsaved:
+            journal.record_result("current_test", current_test_results)
+
+    if LIVE_MONITOR_ON_FAILURE and not resumed_current \
+            and not current_test_results.test_passed \
+            and input("Current test failed. Open the live waveform monitor "
+                      "to check the connections? <Y/N>: ") in ("Y", "y"):
+        with claim("live monitor", scope):
+            run_live_monitor(scope)
 
     # Make sure all outputs are off...
     psu.set_voltage(2, 0)
@@ -426,8 +664,44 @@ while LOOP_FLAG == 1:
     # *************************************************************************
     # ******Generate Report...******
     print("Generating Report...")
-    dut_info = generate_report_dataset()
-    plot_pdf(dut_info, report_path, current_plot_filename)
+    unit_result = UnitResult(dcct_sn=dcct_sn, dcct_sn_raw=dcct_sn_raw,
+                             tester_name=tester_name,
+                             tester_life=tester_life,
+                             test_time=dir_create_time,
+                             script_revision=SCRIPT_REVISION,
+                             limits_version=default_rules().version,
+                             fault=fault_test_results,
+                             current=current_test_results)
+    dut_info = generate_report_dataset(unit_result)
+    # Wait for this unit's raw data files to reach the disk
+    unsaved_files += save_raw_data("unit")
+    waveform_file = os.path.join(raw_data_path, f"{dcct_sn}{WAVEFORM_SUFFIX}")
+    waveform_path = "" if current_channel_data is None \
+        or waveform_file in unsaved_files \
+        else os.path.relpath(waveform_file, DEFAULT_ROOT)
+    record_run = not unsaved_files or input(
+        "The run is missing raw data. Record it in the results store and "
+        "run index anyway? <Y/N>: ") in ("Y", "y")
+    if record_run:
+        try:  # Add the run to the fleet results store
+            append_result(unit_result, waveform_path)
+        except (OSError, ValueError) as e:
+            print(f"Error adding the run to the results store: {e}")
+        try:  # Add the run to the run index
+            with RunIndex() as run_index:
+                run_index.add_run(unit_result, os.path.relpath(
+                    os.path.dirname(raw_data_path), DEFAULT_ROOT))
+        except (sqlite3.Error, ValueError) as e:
+            print(f"Error adding the run to the run index: {e}")
+    else:
+        print(f"The run is not recorded. Once the disk is fixed, resume it "
+              f"with: python main.py --resume "
+              f"{os.path.dirname(raw_data_path)}")
+    plot_pdf(dut_info, report_path, current_test_results.plot_filename,
+             no_plot_reason(current_test_results, current_channel_data))
+    if record_run:
+        journal.record("complete")
+    journal.close()
     os.startfile(report_path)
 
     # if input("Do you want to test another unit? <Y/N>: ") not in "Y, y":
@@ -436,6 +710,9 @@ while LOOP_FLAG == 1:
     # *************************************************************************
 
 
+if plot_worker is not None:
+    plot_worker.close()
+result_writer.close()
 print("Exiting...")
 sleep(5)
 sys.exit(0)
@@ -0,0 +1,166 @@
+"""This module runs waveform plot rendering in a long-lived background
+process, so figure construction and savefig never share CPU time with
+the thread driving the instruments.
+
+The worker is started as "python -m plot_worker" (rather than through
+multiprocessing, which would re-import main.py and reconnect the
+instruments), preloads matplotlib on the Agg backend, and renders jobs
+sent over its stdin pipe. Waveform arrays are passed through shared
+memory; the analysis result is passed as a CurrentTestResult blob.
+Each submit() returns a concurrent.futures.Future resolving to the PNG
+path.
+
+M. Capotosto
+10/19/2026
+NSLS-II Diagnostics and Instrumentation"""
+import os
+import sys
+import pickle
+import itertools
+import threading
+import subprocess
+from concurrent.futures import Future
+from multiprocessing import shared_memory, resource_tracker
+import numpy as np
+
+_SAMPLE_DTYPE = np.float64
+
+
+def _attach_shared_memory(name):
+    """Attach to a block created by the parent, which owns and unlinks it"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # 3.13+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        if os.name == "posix":  # Stop this process' tracker unlinking it
+            resource_tracker.unregister(
+                shm._name, "shared_memory")  # pylint: disable=W0212
+        return shm
+
+
+class PlotRenderWorker:
+    """Client side of the rendering process"""
+
+    def __init__(self):
+        self._proc = subprocess.Popen(
+            [sys.executable, "-m", "plot_worker"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self._ids = itertools.count()
+        self._pending = {}  # job id -> (Future, SharedMemory)
+        self._lock = threading.Lock()
+        self._reader = threading.Thread(target=self._read_results,
+                                        name="plot-worker-results",
+                                        daemon=True)
+        self._reader.start()
+
+    def submit(self, result, volts, scope_time, plot_filename):
+        """Queue one unit for rendering.
+
+        result: CurrentTestResult from plotter_calculator.analyze_volts
+        volts: dict of CH1-CH3 voltage arrays
+        scope_time: sample axis (only its length is sent; the worker
+        rebuilds the same np.arange axis)
+        Returns a Future resolving to plot_filename."""
+        stack = np.vstack([volts[1], volts[2], volts[3]]).astype(
+            _SAMPLE_DTYPE)
+        shm = shared_memory.SharedMemory(create=True, size=stack.nbytes)
+        np.ndarray(stack.shape, _SAMPLE_DTYPE, buffer=shm.buf)[:] = stack
+
+        future = Future()
+        job_id = next(self._ids)
+        with self._lock:
+            self._pending[job_id] = (future, shm)
+        try:
+            pickle.dump((job_id, shm.name, stack.shape, len(scope_time),
+                         result.to_bytes(), plot_filename),
+                        self._proc.stdin)
+            self._proc.stdin.flush()
+        except OSError as e:
+            self._finish(job_id, error=f"Plot worker unavailable: {e}")
+        return future
+
+    def close(self, wait=True):
+        """Stop the worker after it finishes any queued jobs"""
+        try:
+            pickle.dump(None, self._proc.stdin)
+            self._proc.stdin.close()
+        except OSError:
+            pass
+        if wait:
+            self._proc.wait()
+            self._reader.join()
+
+    def _finish(self, job_id, filename=None, error=None):
+        """Release a job's shared memory and resolve its future. A job can
+        be finished twice (a failed submit() and the reader's orphan sweep);
+        the second call does nothing."""
+        with self._lock:
+            job = self._pending.pop(job_id, None)
+        if job is None:
+            return
+        future, shm = job
+        shm.close()
+        shm.unlink()
+        if error is None:
+            future.set_result(filename)
+        else:
+            future.set_exception(RuntimeError(error))
+
+    def _read_results(self):
+        """Resolve futures as the worker reports finished jobs"""
+        while True:
+            try:
+                job_id, filename, error = pickle.load(self._proc.stdout)
+            except (EOFError, OSError):
+                break
+            self._finish(job_id, filename, error)
+        with self._lock:
+            orphaned = list(self._pending)
+        for job_id in orphaned:
+            self._finish(job_id, error="Plot worker exited before "
+                                       "rendering the plot")
+
+
+# *************************************************************************
+# ******Worker Process******
+
+def _serve():
+    """Render jobs from stdin until a None job (or EOF) arrives"""
+    results_out = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())  # Keep stray output
+    sys.stdout = sys.stderr  # off the result pipe
+
+    import matplotlib  # pylint: disable=import-outside-toplevel
+    matplotlib.use("Agg")
+    # pylint: disable=import-outside-toplevel
+    from plotter_calculator import render_waveforms
+    from results import CurrentTestResult
+
+    while True:
+        try:
+            job = pickle.load(sys.stdin.buffer)
+        except EOFError:
+            break
+        if job is None:
+            break
+        job_id, shm_name, shape, n_time, result_blob, plot_filename = job
+        error = None
+        try:
+            shm = _attach_shared_memory(shm_name)
+            try:  # Copy out, the figure may outlive the shared block
+                stack = np.ndarray(shape, _SAMPLE_DTYPE,
+                                   buffer=shm.buf).copy()
+            finally:
+                shm.close()
+            render_waveforms(CurrentTestResult.from_bytes(result_blob),
+                             {1: stack[0], 2: stack[1], 3: stack[2]},
+                             np.arange(0, n_time, 1), plot_filename)
+        except Exception as e:  # pylint: disable=broad-except
+            error = f"Error rendering {plot_filename}: {e!r}"
+        pickle.dump((job_id, plot_filename, error), results_out)
+        results_out.flush()
+
+
+if __name__ == "__main__":
+    _serve()
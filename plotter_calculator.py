@@ -1,30 +1,77 @@
 """This module handles plot generation from decoded waveform binaries,
 and performs calculations on the data acquired.
 
+Analysis (analyze_waveforms/analyze_volts) is pure NumPy and returns a
+CurrentTestResult; rendering (render_waveforms) is separate, draws on
+a pyplot-free Agg figure, and can run synchronously, in the background
+(render_waveforms_async) or be skipped, so grading never waits on it.
+Headless renders reuse one WaveformFigure template per process rather
+than building a new figure for every unit.
+
 M. Capotosto
 3/9/2025
 NSLS-II Diagnostics and Instrumentation"""
 import os
-from struct import unpack
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from results import CurrentTestResult
+from grading_rules import default_rules
+from waveform_compression import optimize_png
+
+ANALYSIS_VERSION = 2  # Bump when analysis or plot output changes in a way
+# the settings below do not capture (invalidates analysis_cache.py entries)
+
+#############################################################################
+# ******FREQUENCY/PHASE ESTIMATOR******
+#############################################################################
+TONE_ESTIMATOR = "dft"  # "dft": CH1 spectrum peak, then single-bin DFTs of
+# every channel, "fft": full FFT per channel, "sinefit": 4-parameter
+# least-squares sine fit
+TONE_ZOOM = False  # Refine the peak on a sub-bin grid (zoom DFT)
+TONE_ZOOM_POINTS = 64  # Grid points across +/-1 bin for the zoom refinement
+SINE_FIT_ITERATIONS = 6  # Gauss-Newton frequency refinements (4-param fit)
+
+#############################################################################
+# ******DISTORTION/NOISE ANALYSIS******
+#############################################################################
+DISTORTION_HARMONICS = 5  # Highest harmonic counted in THD (2nd..Nth)
+DISTORTION_LOBE_BINS = 2  # Bins either side of a tone counted as the tone
+# (Hann window main lobe)
+
+#############################################################################
+# ******MULTI-SHOT AVERAGING******
+#############################################################################
+SHOT_QUANTITIES = ("vpp1", "vpp2", "vpp3", "frequency", "phase_shift")
+SHOT_CI_Z = 1.96  # Normal quantile of the confidence interval (95%)
 
 #############################################################################
-# ******PASS/FAIL THRESHOLDS******
+# ******PLOTTING******
 #############################################################################
-MAX_DC_OFFSET = 0.010  # Maximum DC Offset in waveform
-MAX_PK_PK = 0.6  # Maximum measured PK-to-PK Voltage
-MIN_PK_PK = 0.5  # Minimum measured PK-to-PK Voltage
+PLOT_MAX_POINTS = 2000  # Points drawn per trace; longer records are reduced
+# to a min/max pair per column (None draws every sample)
+# Losslessly shrink each saved PNG (waveform_compression.optimize_png, about
+# 10% smaller). Runs wherever the plot is rendered: with the plot worker
+# process this is off the instrument-control thread.
+PLOT_OPTIMIZE_PNG = True
 
 #############################################################################
 
 # Initialize plots...
 
 
-def init_plots():
-    """Initialize plots"""
+def init_plots(interactive=False):
+    """Initialize plots. Non-interactive figures are created without
+    pyplot, so they render on Agg and need no GUI."""
     # Create a plot figure with 4 plots, for CHA, CHB, CHC, CH AB.
-    f, ax = plt.subplots(2, 2)
+    if interactive:
+        f, ax = plt.subplots(2, 2)
+    else:
+        f = Figure()
+        ax = f.subplots(2, 2)
     f.set_figheight(12)
     f.set_figwidth(12)
     f.suptitle("ALSu DCCT Test Data")
@@ -39,10 +86,15 @@ def clear_plots(ax):
     ax[1, 1].clear()
 
 
-def calculate_frequency(volts):
-    """Calculate the frequency of the waveform using Fourier Transform"""
+def sample_interval(channel_data):
+    """Return the sample interval (s) reported by the scope preamble"""
+    return channel_data[1]["xincr"]
+
+
+def calculate_frequency(volts, fs):
+    """Calculate the frequency of the waveform using Fourier Transform.
+    fs is the sample rate, 1 / xincr of the acquisition."""
 
-    fs = 2000
     N = len(volts[1])  # Number of samples # pylint: disable=C0103
     # dt = scope_time[1] - scope_time[0]  # Time interval between samples
     dt = 1 / fs
@@ -64,29 +116,125 @@ def calculate_frequency(volts):
     return peak_frequency
 
 
-def calculate_phase_shift(volts):
-    """Calculate the phase shift between CH1 and CH2 Waveforms using FFT"""
-    # Calculate the frequency of the signal using FFT
-    frequency = calculate_frequency(volts)
+def single_bin_dft(signals, frequencies, fs):
+    """Evaluate the DFT of every row of 'signals' at the given frequencies
+    (Hz) with one matrix product, instead of a full FFT per channel.
+
+    signals: 2D array, one channel per row
+    Returns a complex array of shape (n_channels, n_frequencies)"""
+    n = np.arange(signals.shape[-1])
+    basis = np.exp(-2j * np.pi * np.outer(n, np.atleast_1d(frequencies)) / fs)
+    return signals @ basis
+
+
+def estimate_tone(volts, fs, zoom=TONE_ZOOM, zoom_points=TONE_ZOOM_POINTS):
+    """Estimate the drive tone of all channels in one batched pass.
+
+    The peak is picked on the whole Channel 1 spectrum (as
+    calculate_frequency does), so an off-frequency tone is reported as
+    such, and optionally ('zoom') refined on a fine grid across +/-1 bin.
+    Every channel is then read at that frequency with one single-bin DFT
+    instead of a full FFT per channel. fs is the sample rate, 1 / xincr.
+
+    Returns (frequency, amplitudes, phases), amplitudes/phases (radians)
+    being arrays ordered by channel number."""
+    stack = np.vstack([volts[ch] for ch in sorted(volts)])
+    N = stack.shape[1]  # pylint: disable=C0103
+    bin_width = fs / N
+    frequency = np.argmax(np.abs(np.fft.rfft(stack[0])[:N // 2])) * bin_width
+
+    if zoom:
+        grid = frequency + np.linspace(-bin_width, bin_width, zoom_points)
+        spectrum = single_bin_dft(stack[:1], grid, fs)
+        frequency = grid[np.argmax(np.abs(spectrum[0]))]
+
+    tone = single_bin_dft(stack, frequency, fs)[:, 0]
+    return frequency, 2 * np.abs(tone) / N, np.angle(tone)
+
+
+def sine_fit(signals, dt, frequency=None, iterations=SINE_FIT_ITERATIONS):
+    """Least-squares fit of y = A*cos(wt) + B*sin(wt) + C to every row of
+    'signals' at once (IEEE 1057 three/four-parameter sine fit).
+
+    A three-parameter fit at the starting frequency seeds a Gauss-Newton
+    refinement of each channel's frequency ('iterations' steps, 0 gives the
+    plain three-parameter fit). Resolution is not limited to the FFT bin
+    width, so shorter records still grade accurately.
+
+    signals: 2D array, one channel per row, sharing the time base
+    dt: sample interval (s), i.e. the scope's xincr
+    frequency: starting frequency (Hz); defaults to the zoomed DFT estimate
+
+    Returns a dict of per-channel arrays: "amplitude" (V, peak), "offset"
+    (V), "frequency" (Hz), "phase" (radians, of a cosine at sample 0) and
+    "residual_rms" (V)."""
+    y = np.atleast_2d(np.asarray(signals, dtype=float))
+    n_chan, n_samples = y.shape
+    t = np.arange(n_samples) * dt
+    if frequency is None:
+        frequency, _, _ = estimate_tone(dict(enumerate(y[:1], start=1)),
+                                        fs=1 / dt, zoom=True)
+    w = np.full(n_chan, 2 * np.pi * frequency)
+
+    def solve(columns):
+        """Solve the batched normal equations for (n_chan, n_samples, k)
+        design matrices"""
+        jt = np.swapaxes(columns, 1, 2)
+        return np.linalg.solve(jt @ columns, (jt @ y[..., None]))[..., 0]
+
+    wt = w[:, None] * t
+    cos, sin, ones = np.cos(wt), np.sin(wt), np.ones_like(wt)
+    a, b, c = solve(np.stack([cos, sin, ones], axis=-1)).T
+    for _ in range(iterations):
+        dw_col = t * (b[:, None] * cos - a[:, None] * sin)
+        a, b, c, dw = solve(np.stack([cos, sin, ones, dw_col], axis=-1)).T
+        w = w + dw
+        wt = w[:, None] * t
+        cos, sin = np.cos(wt), np.sin(wt)
+    if iterations:  # Final linear solve at the converged frequency
+        a, b, c = solve(np.stack([cos, sin, ones], axis=-1)).T
+
+    residual = y - (a[:, None] * cos + b[:, None] * sin + c[:, None])
+    return {
+        "amplitude": np.hypot(a, b),
+        "offset": c,
+        "frequency": w / (2 * np.pi),
+        "phase": np.arctan2(-b, a),
+        "residual_rms": np.sqrt(np.mean(residual ** 2, axis=1))
+    }
+
+
+def calculate_phase_shift(volts, fs, method=TONE_ESTIMATOR):
+    """Calculate the phase shift between CH1 and CH2 Waveforms, either from
+    a full FFT (method="fft"), the single-bin DFT estimator (method="dft")
+    or a least-squares sine fit (method="sinefit"). fs is the sample rate,
+    1 / xincr of the acquisition."""
+    if method == "dft":
+        frequency, _, phases = estimate_tone(volts, fs=fs)
+        phase_ch1, phase_ch2 = phases[0], phases[1]
+    elif method == "sinefit":
+        fit = sine_fit(np.vstack([volts[1], volts[2]]), 1 / fs)
+        frequency = fit["frequency"][0]
+        phase_ch1, phase_ch2 = fit["phase"][0], fit["phase"][1]
+    else:
+        # Calculate the frequency of the signal using FFT
+        frequency = calculate_frequency(volts, fs)
 
-    # Perform FFT on both Channel 1 and Channel 2 signals
-    fft_ch1 = np.fft.fft(volts[1])
-    fft_ch2 = np.fft.fft(volts[2])
+        # Perform FFT on both Channel 1 and Channel 2 signals
+        fft_ch1 = np.fft.fft(volts[1])
+        fft_ch2 = np.fft.fft(volts[2])
 
-    # Get the index corresponding to the peak frequency
-    # (same frequency for both channels)
-    N = len(volts[1])  # pylint: disable=C0103
-    # dt = scope_time[1] - scope_time[0]
-    # freqs = np.fft.fftfreq(N, dt)
-    # positive_freqs = freqs[:N // 2]
+        # Get the index corresponding to the peak frequency
+        # (same frequency for both channels)
+        N = len(volts[1])  # pylint: disable=C0103
 
-    # Find the index of the peak frequency
-    peak_freq_idx = np.argmax(np.abs(fft_ch1[:N // 2]))
-    # Use Channel 1 to find the peak frequency index
+        # Find the index of the peak frequency
+        peak_freq_idx = np.argmax(np.abs(fft_ch1[:N // 2]))
+        # Use Channel 1 to find the peak frequency index
 
-    # Find the phase at the peak frequency
-    phase_ch1 = np.angle(fft_ch1[peak_freq_idx])
-    phase_ch2 = np.angle(fft_ch2[peak_freq_idx])
+        # Find the phase at the peak frequency
+        phase_ch1 = np.angle(fft_ch1[peak_freq_idx])
+        phase_ch2 = np.angle(fft_ch2[peak_freq_idx])
 
     # Calculate the phase shift in degrees
     phase_shift = np.degrees(phase_ch2 - phase_ch1)  # Phase shift between
@@ -105,107 +253,365 @@ def unpack_raw_adc(channel_data, decoded_wfdata):
     ymax = {}
     ymin = {}
 
-    for i in range(1, 4):  # Loop over channels 1 to 4
-        adc_wave = np.array(unpack(f"{len(decoded_wfdata[i]['adc_wave'])}B",
-                                   decoded_wfdata[i]['adc_wave']))
+    for i in range(1, 4):  # Loop over channels 1 to 3
+        # Float before subtracting: uint8 - int yoff would wrap around
+        adc_wave = np.frombuffer(decoded_wfdata[i]['adc_wave'],
+                                 dtype=np.uint8).astype(np.float64)
 
         volts[i] = (adc_wave - channel_data[i]["yoff"]) *\
             channel_data[i]["ymult"] + channel_data[i]["yzero"]
-        ymax[i] = max(volts[i])
-        ymin[i] = min(volts[i])
+        ymax[i] = volts[i].max()
+        ymin[i] = volts[i].min()
 
     scope_time = np.arange(0, len(volts[1]), 1)  # Only one scope_time is used, so choose CH1
 
     return volts, ymax, ymin, scope_time
 
 
-def plot_waveforms(channel_data, decoded_wfdata, plot_filename):
-    """Generate four plots with waveforms and additional info."""
-    # Initialize all return variables
-    ch1_threshold = ch2_threshold = ch3_threshold = False
-    freq_phase_pass = False
-    vpp1 = vpp2 = vpp3 = 0
-    frequency = phase_shift = 0
-    f, ax = init_plots()
-    clear_plots(ax)
-    volts, ymax, ymin, scope_time = unpack_raw_adc(channel_data, decoded_wfdata)
-
-    # Plot Channel 1
-    ax[0, 0].plot(scope_time, volts[1], label="Channel 1")
-    ax[0, 0].set_title("Channel 1, IOUT 1")
-    ax[0, 0].grid(True)
-    ax[0, 0].text(0.05, 0.9, f"Peak-to-Peak: {round(ymax[1] - ymin[1], 3)} V",
-                  transform=ax[0, 0].transAxes, fontsize=14, verticalalignment='top',
-                  bbox={'facecolor': 'wheat', 'alpha': 0.7})
-    vpp = ymax[1] - ymin[1]
-    vpp1 = ymax[1] - ymin[1]
-    if 0.50 <= vpp <= 0.54:  # Set Pass/Fail Tolerance
-        ax[0, 0].set_facecolor((0, 1, 0, 0.2))  # Green with 50% alpha
-        ch1_threshold = True
-    else:
-        ax[0, 0].set_facecolor((1, 0, 0, 0.2))  # Red with 50% alpha
-        ch1_threshold = False
-
-    # Plot Channel 2
-    ax[0, 1].plot(scope_time, volts[2], label="Channel 2")
-    ax[0, 1].set_title("Channel 2, IOUT 2")
-    ax[0, 1].grid(True)
-    ax[0, 1].text(0.05, 0.9, f"Peak-to-Peak: {round(ymax[2] - ymin[2], 3)} V",
-                  transform=ax[0, 1].transAxes, fontsize=14, verticalalignment='top',
-                  bbox=dict(facecolor='wheat', alpha=0.7))
-    vpp = ymax[2] - ymin[2]  # Set Pass/Fail Tolerance
-    vpp2 = ymax[2] - ymin[2]
-    if 0.50 <= vpp <= 0.54:
-        ax[0, 1].set_facecolor((0, 1, 0, 0.2))  # Green with 50% alpha
-        ch2_threshold = True
-    else:
-        ax[0, 1].set_facecolor((1, 0, 0, 0.2))  # Red with 50% alpha
-        ch2_threshold = False
-
-    # Plot Channel 3
-    ax[1, 0].plot(scope_time, volts[3], label="Channel 3")
-    ax[1, 0].set_title("Channel 3, SIGNAL GEN")
-    ax[1, 0].grid(True)
-    ax[1, 0].text(0.05, 0.9, f"Peak-to-Peak: {round(ymax[3] - ymin[3], 3)} V",
-                  transform=ax[1, 0].transAxes, fontsize=14, verticalalignment='top',
-                  bbox={'facecolor': 'wheat', 'alpha': 0.7})
-    vpp = ymax[3] - ymin[3]  # Set Pass/Fail Tolerance
-    vpp3 = ymax[3] - ymin[3]
-    if 20 <= vpp <= 22:
-        ax[1, 0].set_facecolor((0, 1, 0, 0.2))  # Green with 50% alpha
-        ch3_threshold = True
-    else:
-        ax[1, 0].set_facecolor((1, 0, 0, 0.2))  # Red with 50% alpha
-        ch3_threshold = False
-
-    # Calculate Phase Shift between Channel 1 and Channel 2
-    frequency, phase_shift = calculate_phase_shift(volts)
-
-    # Plot Channel 1 and Channel 2 (Phase Shift)
-    ax[1, 1].plot(scope_time, volts[1], label="Channel 1")
-    ax[1, 1].plot(scope_time, volts[2], label="Channel 2")
-    ax[1, 1].set_title("Channel 1 & Channel 2 (IOUT 1 and IOUT 2) Phase Shift")
-    ax[1, 1].grid(True)
-    phase_shift = round(phase_shift, 2)
-    frequency = round(frequency, 2)
-    ax[1, 1].text(0.05, 0.9, f"Phase Shift: {phase_shift}°\nFrequency:"
-                  f"{frequency} Hz",
-                  transform=ax[1, 1].transAxes, fontsize=14, verticalalignment='top',
-                  bbox={'facecolor': 'wheat', 'alpha': 0.7})
-    if 9 <= frequency <= 11 and 178 <= phase_shift <= 181:   # Set Pass/Fail Tolerance
-        ax[1, 1].set_facecolor((0, 1, 0, 0.2))  # Green with 50% alpha
-        freq_phase_pass = True
-    else:
-        ax[1, 1].set_facecolor((1, 0, 0, 0.2))  # Red with 50% alpha
-        freq_phase_pass = False
-
-    f.savefig(plot_filename, bbox_inches='tight')
-    # Saves the figure with tight bounding box
-
-    plt.tight_layout()
-    plt.show()
-    return plot_filename, ch1_threshold, ch2_threshold, ch3_threshold, \
-        frequency, phase_shift, freq_phase_pass, vpp1, vpp2, vpp3
+def analyze_distortion(volts, fs, frequency,
+                       harmonics=DISTORTION_HARMONICS,
+                       lobe_bins=DISTORTION_LOBE_BINS):
+    """Distortion and noise of CH1-CH3 from one batched, Hann-windowed FFT.
+
+    frequency: fundamental (Hz), e.g. from calculate_phase_shift()
+    Returns a dict keyed as the CurrentTestResult fields: dc_offset<n> (V),
+    thd<n> (%), snr<n> and sinad<n> (dB), and gain_mismatch (%, CH1
+    fundamental relative to CH2)."""
+    stack = np.vstack([volts[1], volts[2], volts[3]])
+    n = stack.shape[1]
+    dc_offset = stack.mean(axis=1)
+    power = np.abs(np.fft.rfft((stack - dc_offset[:, None]) * np.hanning(n),
+                               axis=1)) ** 2
+
+    # Bin masks of the fundamental (row 0), harmonics and DC
+    bins = np.arange(power.shape[1])
+    centres = np.rint(np.arange(1, harmonics + 1) * frequency * n / fs)
+    centres = centres[centres < power.shape[1]]
+    tones = np.abs(bins[None, :] - centres[:, None]) <= lobe_bins
+    harmonic = tones[1:].any(axis=0)
+    noise = ~(tones.any(axis=0) | (bins <= lobe_bins))
+
+    p_fund = power @ tones[0]
+    p_harm = power @ harmonic
+    p_noise = power @ noise
+    with np.errstate(divide="ignore", invalid="ignore"):
+        thd = 100 * np.sqrt(p_harm / p_fund)
+        snr = 10 * np.log10(p_fund / p_noise)
+        sinad = 10 * np.log10(p_fund / (p_noise + p_harm))
+    amp1, amp2 = np.sqrt(p_fund[:2])
+    gain_mismatch = 100 * (amp1 - amp2) / amp2 if amp2 else 0.0
+
+    measurements = {"gain_mismatch": float(gain_mismatch)}
+    for i in range(3):
+        measurements[f"dc_offset{i + 1}"] = float(dc_offset[i])
+        measurements[f"thd{i + 1}"] = float(thd[i])
+        measurements[f"snr{i + 1}"] = float(snr[i])
+        measurements[f"sinad{i + 1}"] = float(sinad[i])
+    return measurements
+
+
+def grade_measurements(measurements, plot_filename="", distortion=None):
+    """Grade the current test from its measured values. Used both for the
+    waveform analysis and for on-scope measurements (fast mode).
+
+    measurements: dict with "vpp1", "vpp2", "vpp3", "frequency" and
+    "phase_shift" (CH2 relative to CH1, degrees) keys.
+    distortion: optional analyze_distortion() dict, recorded. Only the DC
+    offsets have limits (dc_offset_ok), which do not decide the verdict.
+    Limits come from grading_limits.json (see grading_rules).
+    Returns a CurrentTestResult record."""
+    values = {"vpp1": measurements["vpp1"],
+              "vpp2": measurements["vpp2"],
+              "vpp3": measurements["vpp3"],
+              "frequency": round(measurements["frequency"], 2),
+              "phase_shift": round(measurements["phase_shift"] % 360, 2)}
+    # Without waveforms (fast mode) the distortion fields keep their
+    # record defaults; their checks are informational ("verdict": false)
+    checks = default_rules().grade_values(
+        "current", {"dc_offset1": 0.0, "dc_offset2": 0.0, "dc_offset3": 0.0,
+                    **values, **(distortion or {})})
+    return CurrentTestResult(
+        **values,
+        ch1_threshold=checks["ch1_threshold"],
+        ch2_threshold=checks["ch2_threshold"],
+        ch3_threshold=checks["ch3_threshold"],
+        freq_phase_pass=checks["freq_phase_pass"],
+        distortion_analyzed=distortion is not None,
+        plot_filename=plot_filename, **(distortion or {}))
+
+
+def analyze_volts(volts, fs, plot_filename=""):
+    """Measure and grade unpacked CH1-CH3 voltages (no plotting).
+    fs is the sample rate, 1 / xincr. Returns a CurrentTestResult."""
+    vpp1, vpp2, vpp3 = np.ptp(np.vstack([volts[1], volts[2], volts[3]]),
+                              axis=1)
+    frequency, phase_shift = calculate_phase_shift(volts, fs=fs)
+    return grade_measurements({"vpp1": float(vpp1), "vpp2": float(vpp2),
+                               "vpp3": float(vpp3),
+                               "frequency": float(frequency),
+                               "phase_shift": float(phase_shift)},
+                              plot_filename,
+                              analyze_distortion(volts, fs, frequency))
+
+
+def analyze_waveforms(channel_data, decoded_wfdata, plot_filename=""):
+    """Unpack, measure and grade the acquired waveforms (no plotting).
+    Returns a CurrentTestResult record."""
+    volts, _, _, _ = unpack_raw_adc(channel_data, decoded_wfdata)
+    return analyze_volts(volts, 1 / sample_interval(channel_data),
+                         plot_filename)
+
+
+class StreamingStats:
+    """Welford running mean and variance of equally shaped samples.
+
+    State lives in arrays allocated once, and update() works in place, so
+    memory stays fixed however many samples are added."""
+
+    def __init__(self, shape):
+        self.count = 0
+        self.mean = np.zeros(shape)
+        self._m2 = np.zeros(shape)
+        self._delta = np.empty(shape)
+        self._scratch = np.empty(shape)
+
+    def update(self, sample):
+        """Add one sample"""
+        self.count += 1
+        np.subtract(sample, self.mean, out=self._delta)
+        np.divide(self._delta, self.count, out=self._scratch)
+        self.mean += self._scratch
+        np.subtract(sample, self.mean, out=self._scratch)
+        self._scratch *= self._delta
+        self._m2 += self._scratch
+
+    @property
+    def variance(self):
+        """Sample variance (zero until two samples have been added)"""
+        if self.count < 2:
+            return np.zeros_like(self.mean)
+        return self._m2 / (self.count - 1)
+
+    @property
+    def std(self):
+        """Sample standard deviation"""
+        return np.sqrt(self.variance)
+
+    def ci_half_width(self, z=SHOT_CI_Z):
+        """Half-width of the confidence interval of the mean"""
+        if self.count < 2:
+            return np.full_like(self.mean, np.inf)
+        return z * self.std / np.sqrt(self.count)
+
+
+class ShotAverager:
+    """Accumulate the measurements (SHOT_QUANTITIES) and the CH1-CH3
+    waveforms of repeated acquisitions, without keeping the shots."""
+
+    def __init__(self):
+        self.measurements = StreamingStats(len(SHOT_QUANTITIES))
+        self.waveforms = None  # Allocated on the first shot
+        self.fs = None
+
+    @property
+    def shots(self):
+        """Number of shots accumulated"""
+        return self.measurements.count
+
+    def add(self, volts, fs):
+        """Analyze one shot's unpacked voltages and accumulate it"""
+        result = analyze_volts(volts, fs)
+        self.fs = fs
+        stack = np.vstack([volts[1], volts[2], volts[3]])
+        if self.waveforms is None:
+            self.waveforms = StreamingStats(stack.shape)
+        self.measurements.update([getattr(result, key)
+                                  for key in SHOT_QUANTITIES])
+        self.waveforms.update(stack)
+        return result
+
+    def converged(self, ci_limits, min_shots=2):
+        """True once every quantity's confidence interval half-width is
+        within its limit. ci_limits: dict keyed as SHOT_QUANTITIES."""
+        if self.shots < max(min_shots, 2):
+            return False
+        half_width = self.measurements.ci_half_width()
+        return all(half_width[i] <= ci_limits[key]
+                   for i, key in enumerate(SHOT_QUANTITIES))
+
+    def summary(self):
+        """mean ± sigma of every quantity, as a printable string"""
+        mean = self.measurements.mean
+        std = self.measurements.std
+        return ", ".join(f"{key}: {mean[i]:.4g} ± {std[i]:.2g}"
+                         for i, key in enumerate(SHOT_QUANTITIES)) + \
+            f" ({self.shots} shots)"
+
+    def mean_volts(self):
+        """Averaged CH1-CH3 waveforms, keyed like unpack_raw_adc volts"""
+        return {i + 1: self.waveforms.mean[i] for i in range(3)}
+
+    def result(self, plot_filename=""):
+        """Grade the mean measurements, with the distortion analysis of the
+        averaged waveforms. Returns a CurrentTestResult."""
+        measurements = {key: float(self.measurements.mean[i])
+                        for i, key in enumerate(SHOT_QUANTITIES)}
+        return grade_measurements(
+            measurements, plot_filename,
+            analyze_distortion(self.mean_volts(), self.fs,
+                               measurements["frequency"]))
+
+
+def decimate_minmax(x, y, n_out=PLOT_MAX_POINTS):
+    """Reduce a trace to at most n_out points for plotting, keeping the
+    minimum and maximum sample of each of n_out / 2 equal columns (in time
+    order), so visible peaks and the drawn Vpp match the full record.
+
+    Returns (x, y) unchanged when the trace is already short enough."""
+    n = len(y)
+    if n_out is None or n <= n_out:
+        return x, y
+    columns = n_out // 2
+    width = -(-n // columns)  # Samples per column, rounded up
+    # Pad with the last sample so the record reshapes into whole columns
+    padded = np.pad(np.asarray(y), (0, columns * width - n), mode="edge")
+    blocks = padded.reshape(columns, width)
+    base = np.arange(columns) * width
+    lo = base + blocks.argmin(axis=1)
+    hi = base + blocks.argmax(axis=1)
+    idx = np.minimum(np.column_stack((np.minimum(lo, hi), np.maximum(lo, hi))),
+                     n - 1).ravel()
+    return np.asarray(x)[idx], np.asarray(y)[idx]
+
+
+def verdict_color(passed):
+    """Green for pass, red for fail, 20% alpha"""
+    return (0, 1, 0, 0.2) if passed else (1, 0, 0, 0.2)
+
+
+class WaveformFigure:
+    """Persistent 2x2 waveform figure. Axes, titles, grids, lines and text
+    boxes are built once; each unit only updates line data, annotation
+    text and facecolors, so render time and memory stay flat over a shift.
+    The layout is fixed at construction instead of being recomputed on
+    every save."""
+
+    def __init__(self, interactive=False):
+        self.fig, self.ax = init_plots(interactive)
+        self.fig.subplots_adjust(left=0.06, right=0.97, bottom=0.04,
+                                 top=0.93, wspace=0.15, hspace=0.15)
+        self._lock = threading.Lock()
+        self.lines = {}  # (row, col) -> list of Line2D
+        self.text = {}  # (row, col) -> Text
+        panels = (
+            ((0, 0), "Channel 1, IOUT 1", (1,)),
+            ((0, 1), "Channel 2, IOUT 2", (2,)),
+            ((1, 0), "Channel 3, SIGNAL GEN", (3,)),
+            ((1, 1), "Channel 1 & Channel 2 (IOUT 1 and IOUT 2) Phase Shift",
+             (1, 2)),
+        )
+        for pos, title, chans in panels:
+            axis = self.ax[pos]
+            axis.set_title(title)
+            axis.grid(True)
+            self.lines[pos] = [axis.plot([], [], color=f"C{i}",
+                                         label=f"Channel {chan}")[0]
+                               for i, chan in enumerate(chans)]
+            self.text[pos] = axis.text(0.05, 0.9, "",
+                                       transform=axis.transAxes,
+                                       fontsize=14, verticalalignment='top',
+                                       bbox={'facecolor': 'wheat',
+                                             'alpha': 0.7})
+
+    def update(self, result, volts, scope_time):
+        """Load one unit's waveforms and verdicts into the figure"""
+        verdicts = {(0, 0): (result.vpp1, result.ch1_threshold),
+                    (0, 1): (result.vpp2, result.ch2_threshold),
+                    (1, 0): (result.vpp3, result.ch3_threshold)}
+        for pos, (vpp, passed) in verdicts.items():
+            self.text[pos].set_text(f"Peak-to-Peak: {round(vpp, 3)} V")
+            self.ax[pos].set_facecolor(verdict_color(passed))
+        self.text[1, 1].set_text(f"Phase Shift: {result.phase_shift}°\n"
+                                 f"Frequency:{result.frequency} Hz")
+        self.ax[1, 1].set_facecolor(verdict_color(result.freq_phase_pass))
+
+        channels = {(0, 0): (1,), (0, 1): (2,), (1, 0): (3,), (1, 1): (1, 2)}
+        for pos, chans in channels.items():
+            for line, chan in zip(self.lines[pos], chans):
+                line.set_data(*decimate_minmax(scope_time, volts[chan]))
+            self.ax[pos].relim()
+            self.ax[pos].autoscale_view()
+
+    def render(self, result, volts, scope_time, plot_filename):
+        """Update the figure for one unit and save it. Returns
+        plot_filename."""
+        with self._lock:
+            self.update(result, volts, scope_time)
+            self.fig.savefig(plot_filename)
+        if PLOT_OPTIMIZE_PNG:
+            try:
+                optimize_png(plot_filename)
+            except (ImportError, OSError) as e:
+                print(f"PNG optimization skipped for {plot_filename}: {e}")
+        return plot_filename
+
+
+_TEMPLATE = None
+_TEMPLATE_LOCK = threading.Lock()
+
+
+def waveform_figure():
+    """Return this process' shared headless WaveformFigure, building it on
+    first use"""
+    global _TEMPLATE  # pylint: disable=global-statement
+    with _TEMPLATE_LOCK:
+        if _TEMPLATE is None:
+            _TEMPLATE = WaveformFigure()
+        return _TEMPLATE
+
+
+def render_waveforms(result, volts, scope_time, plot_filename, fig=None):
+    """Draw the 2x2 waveform figure for an analyzed unit and save it.
+
+    result: CurrentTestResult from analyze_volts/analyze_waveforms
+    fig: optional WaveformFigure; the shared headless template is reused
+    when omitted.
+    Returns plot_filename."""
+    template = fig if fig is not None else waveform_figure()
+    return template.render(result, volts, scope_time, plot_filename)
+
+
+_RENDER_EXECUTOR = ThreadPoolExecutor(max_workers=1,
+                                      thread_name_prefix="plot-render")
+
+
+def render_waveforms_async(result, volts, scope_time, plot_filename):
+    """Render on a background thread. Returns a Future resolving to
+    plot_filename; wait on it before the PNG is needed (e.g. the report)."""
+    return _RENDER_EXECUTOR.submit(render_waveforms, result, volts,
+                                   scope_time, plot_filename)
+
+
+def plot_waveforms(channel_data, decoded_wfdata, plot_filename, show=False,
+                   cache=None):
+    """Analyze the waveforms, then render and save the four plots.
+    With show=True the figure is also displayed (blocks until closed).
+    cache: optional analysis_cache.AnalysisCache; unchanged waveforms are
+    then not re-analyzed or re-rendered, the cached plot is copied.
+    Returns a CurrentTestResult record."""
+    if cache is not None and not show:
+        result = cache.analyze(channel_data, decoded_wfdata, render=True)
+        shutil.copyfile(result.plot_filename, plot_filename)
+        result.plot_filename = plot_filename
+        return result
+    volts, _, _, scope_time = unpack_raw_adc(channel_data, decoded_wfdata)
+    result = analyze_volts(volts, 1 / sample_interval(channel_data),
+                           plot_filename)
+    render_waveforms(result, volts, scope_time, plot_filename,
+                     fig=WaveformFigure(interactive=True) if show else None)
+    if show:
+        plt.show()
+    return result
 
 
 if __name__ == "__main__":
@@ -248,8 +654,8 @@ if __name__ == "__main__":
         3: {"headerlen": 2, "header": b"\x00\x01", "adc_wave": sine_wave_3_adc.tobytes()},
     }
 
-    plot_waveforms(test_channel_data, test_decoded_wfdata, plot_filename_l)  # Now works correctly!
+    plot_waveforms(test_channel_data, test_decoded_wfdata, plot_filename_l, show=True)
 
     input()
 
-    plot_waveforms(test_channel_data, test_decoded_wfdata, plot_filename_l)  # Now works correctly!
+    plot_waveforms(test_channel_data, test_decoded_wfdata, plot_filename_l, show=True)
@@ -11,15 +11,30 @@ from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, \
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.colors import Color
 from reportlab.lib import colors
+from grading_rules import default_rules
 
 
 PAGE_WIDTH, PAGE_HEIGHT = letter  # Page size!
 styles = getSampleStyleSheet()
 
-
-def plot_pdf(dut_info, report_path, plot_path):
+# Shown in place of the waveform plot, by the reason there is none
+NO_PLOT_MESSAGES = {
+    "fast_mode": "Waveforms not transferred: unit graded from on-scope "
+                 "measurements (fast mode).",
+    "skipped": "Waveform plot not rendered (plot rendering is set to "
+               "skip); the waveforms are in the run's raw data.",
+    "render_failed": "Waveform plot could not be rendered; the waveforms "
+                     "are in the run's raw data.",
+    "not_saved": "Waveforms not available: the raw waveform file of this "
+                 "run was not saved.",
+}
+NO_PLOT_MESSAGE = "Waveform plot not available."
+
+
+def plot_pdf(dut_info, report_path, plot_path, no_plot_reason=None):
     """Generate the PDF using data from the dictionary and save it to the
-    provided report path."""
+    provided report path. plot_path may be None or empty if there is no
+    plot; no_plot_reason (a NO_PLOT_MESSAGES key) then says why."""
     # Create the document object
     print(report_path)
     doc = SimpleDocTemplate(report_path, pagesize=letter)
@@ -84,10 +99,13 @@ def plot_pdf(dut_info, report_path, plot_path):
     #############################################################################
     # ******FLT12 Fault 1 and 2 Test Results******
     #############################################################################
-    # Define threshold values for voltage comparison
-    INIT_THRESHOLD_VOLTAGE = 14.3  # Change this as needed
-    FAULT_THRESHOLD_VOLTAGE = 1
-
+    # Threshold values for voltage comparison, from grading_limits.json
+    rules = default_rules()
+    INIT_THRESHOLD_VOLTAGE = rules.limits("fault", "initial_voltage_ok",
+                                          "initial_voltage")[0]
+    FAULT_THRESHOLD_VOLTAGE = rules.limits("fault",
+                                           "positive_fault_voltage_ok",
+                                           "positive_assert_pin_voltage")[1]
 
     # Extract voltage values, ensuring they are floats
     flt12_initial_voltage = float(dut_info["flt12_initial_voltage_l"])
@@ -95,6 +113,10 @@ def plot_pdf(dut_info, report_path, plot_path):
          dut_info["flt12_positive_signal_voltage_l"])
     flt12_negative_signal_voltage = float(
          dut_info["flt12_negative_signal_voltage_l"])
+    fault_checks = rules.grade_values("fault", {
+        "initial_voltage": flt12_initial_voltage,
+        "positive_assert_pin_voltage": flt12_positive_signal_voltage,
+        "negative_assert_pin_voltage": flt12_negative_signal_voltage})
     # Dictionary containing test names, values, and pass/fail results
     # print(dut_info)
 
@@ -103,11 +125,9 @@ def plot_pdf(dut_info, report_path, plot_path):
         "FLT12 Positive Assertion": dut_info['flt12_positive_assertion_test_passed_l'],
         "FLT12 Negative Assertion": dut_info['flt12_negative_assertion_test_passed_l'],
         "FLT12 De-Assertion": dut_info['flt12_deassertion_test_passed_l'],
-        "FLT12 Initial Voltage": (flt12_initial_voltage, flt12_initial_voltage >= INIT_THRESHOLD_VOLTAGE),
-        "FLT12 Positive Fault Voltage": (flt12_positive_signal_voltage, (flt12_positive_signal_voltage
-                                         <= FAULT_THRESHOLD_VOLTAGE)),
-        "FLT12 Negative Fault Voltage": (flt12_negative_signal_voltage, (flt12_negative_signal_voltage
-                                         <= FAULT_THRESHOLD_VOLTAGE))
+        "FLT12 Initial Voltage": (flt12_initial_voltage, fault_checks["initial_voltage_ok"]),
+        "FLT12 Positive Fault Voltage": (flt12_positive_signal_voltage, fault_checks["positive_fault_voltage_ok"]),
+        "FLT12 Negative Fault Voltage": (flt12_negative_signal_voltage, fault_checks["negative_fault_voltage_ok"])
     }
     #############################################################################
     # ******Add Current Test Values******
@@ -304,6 +324,53 @@ def plot_pdf(dut_info, report_path, plot_path):
     # Add the table to the story
     Story.append(table)
 
+#############################################################################
+# ******Add Distortion/Noise Table (informational)******
+#############################################################################
+
+    Story.append(Spacer(1, 18))
+    Story.append(Paragraph("Distortion and Noise (Informational)",
+                           table_title_style))
+    Story.append(Spacer(1, 12))
+    if dut_info.get('current_test_distortion_analyzed'):
+        distortion_rows = (
+            ("DC Offset (mV)", [v * 1000 for v in
+                                dut_info['current_test_dc_offset']]),
+            ("THD (%)", dut_info['current_test_thd']),
+            ("SNR (dB)", dut_info['current_test_snr']),
+            ("SINAD (dB)", dut_info['current_test_sinad']),
+        )
+        distortion_data = [["Measurement", "Channel 1", "Channel 2",
+                            "Channel 3"]]
+        for name, values in distortion_rows:
+            distortion_data.append([name] + [f"{v:.3g}" for v in values])
+        table = Table(distortion_data)
+        table.setStyle(TableStyle([
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),  # Header text
+            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),  # Header bg
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),  # Center text
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.black),  # Grid lines
+            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),  # Font
+            ('FONTSIZE', (0, 0), (-1, -1), 10),  # Font size
+        ]))
+        # Outside the informational DC offset limits (grading_limits.json)
+        for ch in (1, 2):
+            low, high = rules.limits("current", "dc_offset_ok",
+                                     f"dc_offset{ch}")
+            offset = dut_info['current_test_dc_offset'][ch - 1]
+            if (low is not None and offset < low) or \
+                    (high is not None and offset > high):
+                table.setStyle(TableStyle([('BACKGROUND', (ch, 1),
+                                            (ch, 1), red)]))
+        Story.append(table)
+        Story.append(Spacer(1, 6))
+        Story.append(Paragraph(
+            "Channel 1 / Channel 2 gain mismatch: "
+            f"{dut_info['current_test_gain_mismatch']:.3g}%"))
+    else:  # Fast mode pass: no waveforms to analyze
+        Story.append(Paragraph("Not available: waveforms not transferred "
+                               "(fast mode)."))
+
 
 #############################################################################
 # ******Add Current Test Plots and Data******
@@ -318,10 +385,14 @@ def plot_pdf(dut_info, report_path, plot_path):
     Story.append(Spacer(1, 0.125*inch))  # Adds space after title
     Story.append(plot_title)
 
-    img = Image(plot_path, width=width_in_inches * inch,
-                height=height_in_inches * inch)
-    img.hAlign = 'CENTER'  # Center the image
-    Story.append(img)
+    if plot_path:
+        img = Image(plot_path, width=width_in_inches * inch,
+                    height=height_in_inches * inch)
+        img.hAlign = 'CENTER'  # Center the image
+        Story.append(img)
+    else:
+        Story.append(Paragraph(NO_PLOT_MESSAGES.get(no_plot_reason,
+                                                    NO_PLOT_MESSAGE)))
 #############################################################################
 
 #############################################################################
@@ -0,0 +1,151 @@
+"""This module writes test result files on a background thread, so a slow
+disk or network share never stalls the thread driving the instruments.
+
+Callers hand over complete file contents (bytes); the writer thread drains
+its bounded queue in batches and writes each file to a temporary name,
+fsyncs it, and renames it over the target, so a reader never sees a
+partial file. flush() at the end of a unit waits for every queued write,
+makes the renames since the last flush durable, and returns the writes
+that failed (with their contents) so the caller can retry or give up.
+
+M. Capotosto
+10/19/2026
+NSLS-II Diagnostics and Instrumentation"""
+import io
+import os
+import csv
+import queue
+import threading
+from collections import namedtuple
+
+TEMP_SUFFIX = ".tmp"
+DEFAULT_QUEUE_SIZE = 64  # Writes queued before submit() blocks
+DEFAULT_BATCH_SIZE = 16  # Writes handled per wake-up of the writer thread
+
+# data: contents of a failed file write, so it can be resubmitted (None for
+# directory syncs and flush timeouts)
+WriteFailure = namedtuple("WriteFailure", ["path", "error", "data"],
+                          defaults=(None,))
+
+
+def csv_bytes(rows):
+    """Encode rows exactly as csv.writer writes them to a file opened with
+    newline='' and encoding='utf-8'"""
+    buffer = io.StringIO(newline="")
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue().encode("utf-8")
+
+
+def write_atomic(path, data):
+    """Write data to path via a temporary file, flushed to disk before it
+    is renamed over path"""
+    temp_path = path + TEMP_SUFFIX
+    try:
+        with open(temp_path, "wb") as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _fsync_directory(path):
+    """Flush a directory's entries (renames) to disk. POSIX only: Windows
+    cannot open a directory for fsync, and NTFS journals the rename."""
+    if os.name != "posix":
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class _Flush:  # pylint: disable=too-few-public-methods
+    """Queue marker: everything before it has been written"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.failures = []
+
+
+class ResultWriter:
+    """Background writer for one test station"""
+
+    def __init__(self, queue_size=DEFAULT_QUEUE_SIZE,
+                 batch_size=DEFAULT_BATCH_SIZE):
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._batch_size = batch_size
+        self._written = set()  # Directories written to since the last flush
+        self._failures = []  # Failed writes since the last flush
+        self._closed = False
+        self._thread = threading.Thread(target=self._run,
+                                        name="result-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, path, data):
+        """Queue a file write. Returns at once unless the queue is full."""
+        if self._closed:
+            raise RuntimeError("Result writer is closed")
+        self._queue.put((path, bytes(data)))
+
+    def submit_csv(self, path, rows):
+        """Queue a CSV file write"""
+        self.submit(path, csv_bytes(rows))
+
+    def flush(self, timeout=None):
+        """Wait for every queued write and make the renames since the last
+        flush durable. Returns a list of WriteFailure (empty on success)."""
+        marker = _Flush()
+        self._queue.put(marker)
+        if not marker.done.wait(timeout):
+            return [WriteFailure(None, TimeoutError(
+                "Result writes still pending after flush timeout"))]
+        return marker.failures
+
+    def close(self, timeout=None):
+        """Flush, then stop the writer thread. Returns the flush failures."""
+        failures = self.flush(timeout)
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+        return failures
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self._batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            for job in batch:
+                if job is None:
+                    return
+                if isinstance(job, _Flush):
+                    self._sync(job)
+                else:
+                    self._write(*job)
+
+    def _write(self, path, data):
+        # Any error is reported by the next flush; the thread must survive
+        # it, or flush() would wait forever
+        try:
+            write_atomic(path, data)
+            self._written.add(os.path.dirname(os.path.abspath(path)))
+        except Exception as e:  # pylint: disable=broad-except
+            self._failures.append(WriteFailure(path, e, data))
+
+    def _sync(self, marker):
+        for directory in self._written:  # Make the renames durable
+            try:
+                _fsync_directory(directory)
+            except Exception as e:  # pylint: disable=broad-except
+                self._failures.append(WriteFailure(directory, e))
+        marker.failures = self._failures
+        self._written = set()
+        self._failures = []
+        marker.done.set()
@@ -0,0 +1,255 @@
+"""This module defines the typed result records passed between the test
+stages, the report generator and the archive tools.
+
+Each record has a fixed field set, packs to a compact little-endian binary
+blob (prefixed by SCHEMA_VERSION), and converts to/from NumPy structured
+arrays so that many unit results can be graded or aggregated column-wise
+without per-row dicts.
+
+M. Capotosto
+10/19/2026
+NSLS-II Diagnostics and Instrumentation"""
+import struct
+from dataclasses import dataclass, field, fields, is_dataclass
+from datetime import datetime
+from typing import ClassVar
+import numpy as np
+
+SCHEMA_VERSION = 4  # Bump whenever a record field is added/removed/resized
+_VERSION_STRUCT = struct.Struct("<H")
+
+# Struct / NumPy type codes for scalar record fields
+_STRUCT_CODES = {bool: "?", int: "q", float: "d", datetime: "q"}
+_NUMPY_CODES = {bool: "?", int: "<i8", float: "<f8", datetime: "<M8[s]"}
+
+
+def _text(size):
+    """Declare a fixed-width text field (size in UTF-8 bytes; longer text
+    is rejected, see _check_text)"""
+    return field(default="", metadata={"size": size})
+
+
+# *************************************************************************
+# ******Record Layout Helpers******
+
+def _columns(cls, prefix=""):
+    """Yield (name, struct code, numpy code) for every flattened field,
+    recursing into nested records"""
+    for f in fields(cls):
+        if is_dataclass(f.type):
+            yield from _columns(f.type, f"{prefix}{f.name}_")
+        elif f.type is str:
+            size = f.metadata["size"]
+            yield f"{prefix}{f.name}", f"{size}s", f"<U{size}"
+        else:
+            yield f"{prefix}{f.name}", _STRUCT_CODES[f.type], \
+                _NUMPY_CODES[f.type]
+
+
+def _flatten(record):
+    """Return the record as a flat list of scalar values, in column order"""
+    values = []
+    for f in fields(record):
+        value = getattr(record, f.name)
+        if is_dataclass(f.type):
+            values.extend(_flatten(value))
+        else:
+            values.append(value)
+    return values
+
+
+def _unflatten(cls, values):
+    """Rebuild a (possibly nested) record from an iterator of flat values"""
+    kwargs = {}
+    for f in fields(cls):
+        if is_dataclass(f.type):
+            kwargs[f.name] = _unflatten(f.type, values)
+        else:
+            kwargs[f.name] = f.type(next(values)) if f.type is not datetime \
+                else next(values)
+    return cls(**kwargs)
+
+
+def _check_text(record):
+    """Raise ValueError if a text field does not fit its declared width,
+    rather than letting it be cut (possibly mid-character) when stored"""
+    for (name, struct_code, _), value in zip(_columns(type(record)),
+                                             _flatten(record)):
+        if struct_code.endswith("s"):
+            size = int(struct_code[:-1])
+            length = len(value.encode("utf-8"))
+            if length > size:
+                raise ValueError(f"{name} is {length} bytes, the record "
+                                 f"holds {size}: {value!r}")
+
+
+def _build_layout(cls):
+    """Attach the binary struct and structured dtype to a record class"""
+    columns = list(_columns(cls))
+    cls.STRUCT = struct.Struct("<" + "".join(c[1] for c in columns))
+    cls.DTYPE = np.dtype([(c[0], c[2]) for c in columns])
+    return cls
+
+
+class _Record:
+    """Serialization shared by every result record"""
+    __slots__ = ()
+    STRUCT: ClassVar[struct.Struct]
+    DTYPE: ClassVar[np.dtype]
+    # Schema version in which this record's own layout last changed; blobs
+    # from then on are still read after unrelated schema bumps
+    LAYOUT_VERSION: ClassVar[int] = SCHEMA_VERSION
+
+    def _packable(self):
+        """Flat values converted to what struct.pack expects"""
+        _check_text(self)
+        packed = []
+        for value in _flatten(self):
+            if isinstance(value, str):
+                value = value.encode("utf-8")
+            elif isinstance(value, datetime):
+                value = int(value.timestamp())
+            packed.append(value)
+        return packed
+
+    def to_bytes(self):
+        """Pack the record into a versioned binary blob"""
+        return _VERSION_STRUCT.pack(SCHEMA_VERSION) + \
+            self.STRUCT.pack(*self._packable())
+
+    @classmethod
+    def from_bytes(cls, blob):
+        """Unpack a blob written by to_bytes()"""
+        (version,) = _VERSION_STRUCT.unpack_from(blob)
+        if not cls.LAYOUT_VERSION <= version <= SCHEMA_VERSION:
+            raise ValueError(f"{cls.__name__} schema version {version} is "
+                             f"not supported (expected {cls.LAYOUT_VERSION}"
+                             f"-{SCHEMA_VERSION})")
+        raw = cls.STRUCT.unpack_from(blob, _VERSION_STRUCT.size)
+        values = []
+        for (_, struct_code, numpy_code), value in zip(_columns(cls), raw):
+            if struct_code.endswith("s"):
+                value = value.rstrip(b"\0").decode("utf-8")
+            elif numpy_code == _NUMPY_CODES[datetime]:
+                value = datetime.fromtimestamp(value)
+            values.append(value)
+        return _unflatten(cls, iter(values))
+
+    @classmethod
+    def to_array(cls, records):
+        """Convert a sequence of records into a NumPy structured array"""
+        rows = []
+        for record in records:
+            _check_text(record)
+            rows.append(tuple(np.datetime64(v.replace(microsecond=0))
+                              if isinstance(v, datetime) else v
+                              for v in _flatten(record)))
+        return np.array(rows, dtype=cls.DTYPE)
+
+    @classmethod
+    def from_array(cls, array):
+        """Yield records from a structured array built by to_array()"""
+        for row in array:
+            values = []
+            for name in cls.DTYPE.names:
+                value = row[name]
+                if isinstance(value, np.datetime64):
+                    value = value.astype(datetime)
+                values.append(value.item() if isinstance(value, np.generic)
+                              else value)
+            yield _unflatten(cls, iter(values))
+
+
+# *************************************************************************
+# ******Result Records******
+
+@dataclass(slots=True)
+class FaultTestResult(_Record):
+    """FLT12 fault test results. Field order matches the
+    <sn>_fault_test_raw_data.csv header."""
+    LAYOUT_VERSION: ClassVar[int] = 1
+    test_passed: bool = False
+    positive_assertion_test: bool = False
+    deassertion_test: bool = False
+    initial_voltage: float = 0.0
+    positive_assert_pin_voltage: float = 0.0
+    positive_assert_ps_voltage: float = 0.0
+    negative_assertion_test: bool = False
+    negative_assert_pin_voltage: float = 0.0
+    negative_assert_ps_voltage: float = 0.0
+    test_current: float = 0.0
+
+
+@dataclass(slots=True)
+class CurrentTestResult(_Record):
+    """AC current test results"""
+    LAYOUT_VERSION: ClassVar[int] = 2
+    vpp1: float = 0.0
+    vpp2: float = 0.0
+    vpp3: float = 0.0
+    frequency: float = 0.0
+    phase_shift: float = 0.0
+    ch1_threshold: bool = False
+    ch2_threshold: bool = False
+    ch3_threshold: bool = False
+    freq_phase_pass: bool = False
+    # Distortion/noise screening (informational; the DC offsets have
+    # non-verdict limits, dc_offset_ok). Only available when waveforms were
+    # analyzed (distortion_analyzed).
+    distortion_analyzed: bool = False
+    dc_offset1: float = 0.0  # V
+    dc_offset2: float = 0.0
+    dc_offset3: float = 0.0
+    thd1: float = 0.0  # %
+    thd2: float = 0.0
+    thd3: float = 0.0
+    snr1: float = 0.0  # dB
+    snr2: float = 0.0
+    snr3: float = 0.0
+    sinad1: float = 0.0  # dB
+    sinad2: float = 0.0
+    sinad3: float = 0.0
+    gain_mismatch: float = 0.0  # CH1 vs CH2 fundamental amplitude, %
+    plot_filename: str = _text(256)
+
+    @property
+    def test_passed(self):
+        """True if every current test check passed"""
+        return (self.ch1_threshold and self.ch2_threshold
+                and self.ch3_threshold and self.freq_phase_pass)
+
+
+@dataclass(slots=True)
+class UnitResult(_Record):
+    """Everything recorded for one DCCT test run"""
+    dcct_sn: str = _text(16)
+    dcct_sn_raw: str = _text(256)
+    tester_name: str = _text(64)
+    tester_life: str = _text(16)
+    test_time: datetime = field(default_factory=datetime.now)
+    script_revision: int = 0
+    limits_version: int = 0  # grading_limits.json version graded against
+    fault: FaultTestResult = field(default_factory=FaultTestResult)
+    current: CurrentTestResult = field(default_factory=CurrentTestResult)
+
+    @property
+    def test_passed(self):
+        """True if both the fault and current tests passed"""
+        return self.fault.test_passed and self.current.test_passed
+
+
+for _cls in (FaultTestResult, CurrentTestResult, UnitResult):
+    _build_layout(_cls)
+
+
+if __name__ == "__main__":
+    demo = UnitResult(dcct_sn="DCCT-M-A-0001", tester_name="Demo",
+                      test_time=datetime(2025, 3, 22, 12, 29, 13),
+                      fault=FaultTestResult(test_passed=True,
+                                            initial_voltage=14.77),
+                      current=CurrentTestResult(vpp1=0.52, phase_shift=179.5))
+    blob = demo.to_bytes()
+    print(f"{len(blob)} bytes: {UnitResult.from_bytes(blob)}")
+    table = UnitResult.to_array([demo] * 3)
+    print(table["fault_initial_voltage"], table["current_vpp1"])
+    print(next(UnitResult.from_array(table)) == demo)
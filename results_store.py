@@ -0,0 +1,299 @@
+"""This module keeps one consolidated, append-only results file for the
+whole fleet (Test_Data/results_store.dcrs), with one fixed-size record per
+test run: every UnitResult column (SN, time, technician, fault and current
+metrics) plus the path of the run's waveform file.
+
+The file is a 16-byte header followed by NumPy structured records, so the
+whole history reads back as one structured array (np.memmap, no parsing)
+and fleet-wide questions are single column operations, e.g.
+
+    runs = read_results()
+    m_a = np.char.startswith(runs["dcct_sn"], b"DCCT-M-A")
+    runs["fault_positive_assert_ps_voltage"][m_a]
+
+Text columns are stored as UTF-8 bytes to keep records compact. Arrow /
+Parquet export is available when pyarrow is installed.
+
+Usage: python results_store.py [--rebuild [root]] [--parquet out.parquet]
+
+M. Capotosto
+10/19/2026
+NSLS-II Diagnostics and Instrumentation"""
+import os
+import csv
+import argparse
+import functools
+import numpy as np
+from grading_rules import default_rules
+from results import UnitResult, FaultTestResult, SCHEMA_VERSION
+from waveform_store import open_waveforms, read_legacy_channel_csv, \
+    WAVEFORM_SUFFIX
+from archive_migration import read_legacy_fault_csv, \
+    LEGACY_CHANNEL_SUFFIX, LEGACY_FAULT_SUFFIX, FAULT_SUFFIX
+from run_layout import find_runs, run_time, run_sn, run_root, relocated, \
+    DEFAULT_ROOT
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Optional, only needed for Arrow/Parquet export
+    pa = pq = None
+
+DEFAULT_STORE_PATH = os.path.join(DEFAULT_ROOT, "results_store.dcrs")
+STORE_VERSION = 1
+_MAGIC = b"DCRS"
+_HEADER = np.dtype([("magic", "S4"), ("store_version", "<u2"),
+                    ("schema_version", "<u2"), ("itemsize", "<u4"),
+                    ("reserved", "<u4")])
+
+
+def _stored(dtype):
+    """Storage dtype of a column: text as UTF-8 bytes, one byte per
+    character of the record field (whose width is checked in UTF-8 bytes,
+    so stored text is never cut)"""
+    return np.dtype(f"S{dtype.itemsize // 4}") if dtype.kind == "U" \
+        else dtype
+
+
+STORE_DTYPE = np.dtype(
+    [(name, _stored(UnitResult.DTYPE[name])) for name in UnitResult.DTYPE.names]
+    + [("waveform_path", "S256")])
+TEXT_COLUMNS = [name for name in STORE_DTYPE.names
+                if STORE_DTYPE[name].kind == "S"]
+
+
+def _header():
+    header = np.zeros(1, dtype=_HEADER)
+    header["magic"] = _MAGIC
+    header["store_version"] = STORE_VERSION
+    header["schema_version"] = SCHEMA_VERSION
+    header["itemsize"] = STORE_DTYPE.itemsize
+    return header.tobytes()
+
+
+def _check_header(path):
+    """Raise ValueError unless the store at path matches this layout"""
+    header = np.fromfile(path, dtype=_HEADER, count=1)
+    if len(header) == 0 or header[0]["magic"] != _MAGIC:
+        raise ValueError(f"{path} is not a results store")
+    if header[0]["store_version"] != STORE_VERSION or \
+            header[0]["schema_version"] != SCHEMA_VERSION or \
+            header[0]["itemsize"] != STORE_DTYPE.itemsize:
+        raise ValueError(f"{path} was written with another record layout "
+                         f"(schema {header[0]['schema_version']}), rebuild "
+                         f"it with 'python results_store.py --rebuild'")
+
+
+def _encode_path(path):
+    """waveform_path column value, raising ValueError if it does not fit"""
+    encoded = path.encode("utf-8")
+    if len(encoded) > STORE_DTYPE["waveform_path"].itemsize:
+        raise ValueError(f"waveform_path is {len(encoded)} bytes, the store "
+                         f"holds {STORE_DTYPE['waveform_path'].itemsize}: "
+                         f"{path!r}")
+    return encoded
+
+
+def to_records(unit_results, waveform_paths):
+    """Convert UnitResults (and their waveform file paths) to store
+    records"""
+    table = UnitResult.to_array(unit_results)
+    records = np.zeros(len(table), dtype=STORE_DTYPE)
+    for name in UnitResult.DTYPE.names:
+        records[name] = np.char.encode(table[name], "utf-8") \
+            if name in TEXT_COLUMNS else table[name]
+    records["waveform_path"] = [_encode_path(path)
+                                for path in waveform_paths]
+    return records
+
+
+def append_records(records, path=DEFAULT_STORE_PATH):
+    """Append store records, creating the store if needed. A partial
+    record left by an interrupted append is dropped first, so it cannot
+    shift the records after it."""
+    if os.path.exists(path):
+        _check_header(path)
+        with open(path, "r+b") as file:
+            size = file.seek(0, os.SEEK_END)
+            whole = _HEADER.itemsize + (size - _HEADER.itemsize) // \
+                STORE_DTYPE.itemsize * STORE_DTYPE.itemsize
+            if whole != size:
+                print(f"Dropping a partial record ({size - whole} bytes) "
+                      f"at the end of {path}")
+                file.truncate(whole)
+                file.seek(whole)
+            file.write(records.tobytes())
+    else:
+        with open(path, "wb") as file:
+            file.write(_header())
+            file.write(records.tobytes())
+
+
+def append_result(unit_result, waveform_path="", path=DEFAULT_STORE_PATH):
+    """Append one test run (called by main at the end of each run)"""
+    append_records(to_records([unit_result], [waveform_path]), path)
+
+
+def read_results(path=DEFAULT_STORE_PATH, decode_text=False):
+    """The whole store as a structured array (read-only memmap).
+    decode_text=True instead returns a dict of columns, with text columns
+    decoded to str."""
+    _check_header(path)
+    count = (os.path.getsize(path) - _HEADER.itemsize) // STORE_DTYPE.itemsize
+    if count == 0:
+        records = np.zeros(0, dtype=STORE_DTYPE)
+    else:
+        records = np.memmap(path, dtype=STORE_DTYPE, mode="r",
+                            offset=_HEADER.itemsize, shape=(count,))
+    if not decode_text:
+        return records
+    return {name: np.char.decode(records[name], "utf-8", "replace")
+            if name in TEXT_COLUMNS else np.asarray(records[name])
+            for name in STORE_DTYPE.names}
+
+
+def to_arrow(path=DEFAULT_STORE_PATH):
+    """The store as a pyarrow Table (requires pyarrow)"""
+    if pa is None:
+        raise ImportError("pyarrow is required for Arrow/Parquet export")
+    return pa.table(read_results(path, decode_text=True))
+
+
+def export_parquet(out_path, path=DEFAULT_STORE_PATH):
+    """Write the store to a Parquet file (requires pyarrow)"""
+    table = to_arrow(path)
+    pq.write_table(table, out_path)
+    return out_path
+
+
+def relocate_runs(moves, path=DEFAULT_STORE_PATH):
+    """Rewrite the waveform paths of runs moved to another directory
+    (moves {old run_dir: new run_dir}, relative to the archive root, see
+    run_layout.migrate_layout). Returns the number of records changed."""
+    _check_header(path)
+    with open(path, "rb") as file:
+        file.seek(_HEADER.itemsize)
+        records = np.frombuffer(file.read(), dtype=STORE_DTYPE).copy()
+    changed = 0
+    for record in records:
+        old = record["waveform_path"].decode("utf-8")
+        new = relocated(old, moves) if old else old
+        if new != old:
+            record["waveform_path"] = _encode_path(new)
+            changed += 1
+    if changed:
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as file:
+            file.write(_header())
+            file.write(records.tobytes())
+        os.replace(temp_path, path)
+    return changed
+
+
+# *************************************************************************
+# ******Rebuild From the Archive******
+
+def _read_text_row(path):
+    with open(path, newline="", encoding="utf-8") as file:
+        return list(csv.reader(file))
+
+
+def load_run(run_dir, cache=None, render=False):
+    """Rebuild the UnitResult of an archived run from its raw_data files.
+    The current test is re-analyzed from the stored waveforms, through
+    'cache' (an analysis_cache.AnalysisCache) when given; render=True also
+    renders (or reuses) the cached plot. Returns (UnitResult, waveform
+    path relative to the archive root) or None if the run is incomplete.
+
+    The fault verdicts are the ones recorded at test time; the current test
+    is re-graded against the current grading_limits.json, whose version is
+    recorded as limits_version. The script revision of the run is not
+    archived and is left at 0."""
+    if cache is not None:
+        analyze = functools.partial(cache.analyze, render=render)
+    else:
+        # pylint: disable=import-outside-toplevel
+        from plotter_calculator import analyze_waveforms as analyze
+    dcct_sn = run_sn(run_dir)
+    raw = os.path.join(run_dir, "raw_data", dcct_sn)
+    if os.path.exists(raw + FAULT_SUFFIX):
+        with open(raw + FAULT_SUFFIX, "rb") as file:
+            fault = FaultTestResult.from_bytes(file.read())
+    elif os.path.exists(raw + LEGACY_FAULT_SUFFIX):
+        fault = read_legacy_fault_csv(raw + LEGACY_FAULT_SUFFIX)
+    else:
+        return None
+    waveform_path = raw + WAVEFORM_SUFFIX
+    if os.path.exists(waveform_path):
+        with open_waveforms(waveform_path) as wf:
+            current = analyze(wf.channel_data(), wf.decoded_wfdata())
+    elif os.path.exists(raw + LEGACY_CHANNEL_SUFFIX):
+        waveform_path = raw + LEGACY_CHANNEL_SUFFIX
+        current = analyze(*read_legacy_channel_csv(waveform_path))
+    else:
+        return None
+    tester_name = tester_life = dcct_sn_raw = ""
+    if os.path.exists(raw + "_Technician_Data.csv"):
+        tester_name, tester_life = _read_text_row(
+            raw + "_Technician_Data.csv")[1][:2]
+    if os.path.exists(raw + "_raw_label.csv"):
+        rows = _read_text_row(raw + "_raw_label.csv")
+        dcct_sn_raw = "".join(rows[0]) if rows else ""
+    unit = UnitResult(dcct_sn=dcct_sn, dcct_sn_raw=dcct_sn_raw,
+                      tester_name=tester_name, tester_life=tester_life,
+                      test_time=run_time(run_dir),
+                      limits_version=default_rules().version, fault=fault,
+                      current=current)
+    return unit, os.path.relpath(waveform_path, run_root(run_dir))
+
+
+def rebuild_store(root=DEFAULT_ROOT, path=None):
+    """Recreate the store from every complete run under root. The new store
+    replaces the old one only once it is fully written. Analyses are reused
+    from the archive's analysis cache; current test verdicts are re-graded
+    against the current limits (see load_run)."""
+    # pylint: disable=import-outside-toplevel
+    from analysis_cache import AnalysisCache
+    cache = AnalysisCache(os.path.join(root, "analysis_cache"))
+    path = path or os.path.join(root, os.path.basename(DEFAULT_STORE_PATH))
+    records = [to_records([], [])]
+    for run_dir in find_runs(root):
+        loaded = load_run(run_dir, cache)
+        if loaded is None:
+            print(f"Skipping incomplete run {run_dir}")
+            continue
+        try:
+            records.append(to_records([loaded[0]], [loaded[1]]))
+        except ValueError as e:
+            print(f"Skipping run {run_dir}: {e}")
+    records = np.concatenate(records)
+    records = records[np.argsort(records["test_time"], kind="stable")]
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as file:
+        file.write(_header())
+        file.write(records.tobytes())
+    os.replace(temp_path, path)
+    return len(records)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fleet results store")
+    parser.add_argument("--rebuild", nargs="?", const=DEFAULT_ROOT,
+                        metavar="ROOT",
+                        help="Rebuild the store from an archive root")
+    parser.add_argument("--store", default=None, help="Store file")
+    parser.add_argument("--parquet", metavar="OUT",
+                        help="Export the store to a Parquet file")
+    args = parser.parse_args()
+
+    store_path = args.store or DEFAULT_STORE_PATH
+    if args.rebuild:
+        store_path = args.store or os.path.join(
+            args.rebuild, os.path.basename(DEFAULT_STORE_PATH))
+        print(f"Rebuilt {store_path}: "
+              f"{rebuild_store(args.rebuild, store_path)} runs")
+    if args.parquet:
+        print(f"Exported {export_parquet(args.parquet, store_path)}")
+    runs = read_results(store_path)
+    passed = default_rules().grade_units(runs)["passed"]
+    print(f"{len(runs)} runs, {passed.sum()} pass the current limits")
@@ -0,0 +1,213 @@
+"""This module maintains an SQLite index of test runs (Test_Data/
+run_index.sqlite), so a unit's history, recent failures or retests are
+found with indexed queries instead of globbing the run directories and
+parsing their two-digit-year timestamps.
+
+Times are stored as ISO 8601 text, which sorts chronologically. main adds
+each run in its own transaction; the index can be rebuilt from the run
+directories at any time.
+
+Usage:
+    python run_index.py latest
+    python run_index.py failures [--since YYYY-MM-DD]   (default: this week)
+    python run_index.py retests
+    python run_index.py history <sn>
+    python run_index.py rebuild [root]
+
+M. Capotosto
+10/19/2026
+NSLS-II Diagnostics and Instrumentation"""
+import os
+import sqlite3
+import argparse
+from datetime import datetime, timedelta
+from time import perf_counter
+from run_layout import DEFAULT_ROOT
+
+DEFAULT_INDEX_PATH = os.path.join(DEFAULT_ROOT, "run_index.sqlite")
+INDEX_VERSION = 1  # Stored in PRAGMA user_version
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_dir TEXT PRIMARY KEY,  -- Relative to the archive root
+    dcct_sn TEXT NOT NULL,
+    test_time TEXT NOT NULL,  -- ISO 8601
+    passed INTEGER NOT NULL,
+    fault_passed INTEGER NOT NULL,
+    current_passed INTEGER NOT NULL,
+    tester_name TEXT,
+    tester_life TEXT,
+    script_revision INTEGER,
+    limits_version INTEGER
+);
+CREATE INDEX IF NOT EXISTS runs_sn_time ON runs (dcct_sn, test_time);
+CREATE INDEX IF NOT EXISTS runs_time ON runs (test_time);
+CREATE INDEX IF NOT EXISTS runs_passed_time ON runs (passed, test_time);
+CREATE INDEX IF NOT EXISTS runs_tester ON runs (tester_name, test_time);
+CREATE INDEX IF NOT EXISTS runs_revision ON runs (script_revision);
+"""
+_COLUMNS = ("run_dir", "dcct_sn", "test_time", "passed", "fault_passed",
+            "current_passed", "tester_name", "tester_life",
+            "script_revision", "limits_version")
+
+
+class RunIndex:
+    """Connection to the run index. Use as a context manager."""
+
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version not in (0, INDEX_VERSION):
+            raise ValueError(f"{path} is index version {version}, rebuild "
+                             f"it with 'python run_index.py rebuild'")
+        with self.conn:
+            self.conn.executescript(_SCHEMA)
+            self.conn.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Close the database"""
+        self.conn.close()
+
+    @staticmethod
+    def _row(unit_result, run_dir):
+        return (run_dir, unit_result.dcct_sn,
+                unit_result.test_time.isoformat(timespec="seconds"),
+                unit_result.test_passed, unit_result.fault.test_passed,
+                unit_result.current.test_passed, unit_result.tester_name,
+                unit_result.tester_life, unit_result.script_revision,
+                unit_result.limits_version)
+
+    def add_run(self, unit_result, run_dir):
+        """Index (or re-index) one run in a single transaction.
+        run_dir: the run directory, relative to the archive root."""
+        self.add_runs([(unit_result, run_dir)])
+
+    def _insert(self, runs):
+        placeholders = ", ".join("?" * len(_COLUMNS))
+        self.conn.executemany(
+            f"INSERT OR REPLACE INTO runs ({', '.join(_COLUMNS)}) "
+            f"VALUES ({placeholders})",
+            (self._row(unit, run_dir) for unit, run_dir in runs))
+
+    def add_runs(self, runs):
+        """Index many (UnitResult, run_dir) pairs in one transaction"""
+        with self.conn:
+            self._insert(runs)
+
+    def rebuild(self, root=DEFAULT_ROOT):
+        """Replace the index contents with every complete run under root,
+        in one transaction, with current test verdicts re-graded against
+        the current limits (see load_run). Returns the number of runs
+        indexed."""
+        # pylint: disable=import-outside-toplevel
+        from run_layout import find_runs
+        from results_store import load_run
+        from analysis_cache import AnalysisCache
+        cache = AnalysisCache(os.path.join(root, "analysis_cache"))
+        runs = []
+        for run_dir in find_runs(root):
+            loaded = load_run(run_dir, cache)
+            if loaded is None:
+                print(f"Skipping incomplete run {run_dir}")
+                continue
+            runs.append((loaded[0], os.path.relpath(run_dir, root)))
+        with self.conn:
+            self.conn.execute("DELETE FROM runs")
+            self._insert(runs)
+        return len(runs)
+
+    def relocate(self, moves):
+        """Update the directories of runs moved to another layout, in one
+        transaction. moves: {old run_dir: new run_dir}, relative to the
+        archive root."""
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE runs SET run_dir = ? WHERE run_dir = ?",
+                ((new, old) for old, new in moves.items()))
+
+    # *********************************************************************
+    # ******Queries******
+    def latest_per_sn(self):
+        """The most recent run of every serial number"""
+        return self.conn.execute(
+            "SELECT runs.* FROM runs JOIN ("
+            "  SELECT dcct_sn, MAX(test_time) AS latest FROM runs"
+            "  GROUP BY dcct_sn) AS last"
+            " ON runs.dcct_sn = last.dcct_sn AND runs.test_time = last.latest"
+            " ORDER BY runs.dcct_sn").fetchall()
+
+    def failures_since(self, since):
+        """Failed runs at or after 'since' (a datetime), oldest first"""
+        return self.conn.execute(
+            "SELECT * FROM runs WHERE passed = 0 AND test_time >= ?"
+            " ORDER BY test_time",
+            (since.isoformat(timespec="seconds"),)).fetchall()
+
+    def failures_this_week(self):
+        """Failed runs since Monday 00:00"""
+        today = datetime.now().replace(hour=0, minute=0, second=0,
+                                       microsecond=0)
+        return self.failures_since(today - timedelta(days=today.weekday()))
+
+    def retests(self):
+        """Serial numbers tested more than once, with run count, first and
+        last test times, and the verdict of the last run"""
+        return self.conn.execute(
+            "SELECT dcct_sn, COUNT(*) AS runs, MIN(test_time) AS first,"
+            " MAX(test_time) AS last,"
+            " (SELECT passed FROM runs AS r WHERE r.dcct_sn = runs.dcct_sn"
+            "  ORDER BY test_time DESC LIMIT 1) AS last_passed"
+            " FROM runs GROUP BY dcct_sn HAVING COUNT(*) > 1"
+            " ORDER BY dcct_sn").fetchall()
+
+    def history(self, dcct_sn):
+        """Every run of one serial number, oldest first"""
+        return self.conn.execute(
+            "SELECT * FROM runs WHERE dcct_sn = ? ORDER BY test_time",
+            (dcct_sn,)).fetchall()
+
+
+def _print_rows(rows):
+    for row in rows:
+        print("  ".join(str(row[key]) for key in row.keys()))
+    print(f"({len(rows)} rows)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the run index")
+    parser.add_argument("--db", default=DEFAULT_INDEX_PATH,
+                        help="Index file")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("latest", help="Latest run per serial number")
+    failures = commands.add_parser("failures", help="Failed runs")
+    failures.add_argument("--since", type=datetime.fromisoformat,
+                          help="Start date (default: this week)")
+    commands.add_parser("retests", help="Units tested more than once")
+    history = commands.add_parser("history", help="All runs of one unit")
+    history.add_argument("sn")
+    rebuild = commands.add_parser("rebuild", help="Rebuild from disk")
+    rebuild.add_argument("root", nargs="?", default=DEFAULT_ROOT)
+    args = parser.parse_args()
+
+    with RunIndex(args.db) as index:
+        start = perf_counter()
+        if args.command == "rebuild":
+            print(f"Indexed {index.rebuild(args.root)} runs")
+        elif args.command == "latest":
+            _print_rows(index.latest_per_sn())
+        elif args.command == "failures":
+            _print_rows(index.failures_since(args.since) if args.since
+                        else index.failures_this_week())
+        elif args.command == "retests":
+            _print_rows(index.retests())
+        elif args.command == "history":
+            _print_rows(index.history(args.sn))
+        print(f"{(perf_counter() - start) * 1000:.1f} ms")
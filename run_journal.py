@@ -0,0 +1,118 @@
+"""This module keeps an append-only journal of each unit's progress
+(<run dir>/run_journal.jsonl), so a unit interrupted by a VISA hang, a
+sleeping laptop or Ctrl-C can be resumed (python main.py --resume <run
+dir>) without repeating the technician prompts or the completed stages.
+
+One JSON object per line, in order:
+    unit          S/N, raw label, technician, test time
+    fault_start   start of a fault test attempt
+    fault         a fault test sweep step ("positive_step"/"negative_step")
+                  or completed phase ("initial"/"positive"/"negative")
+    fault_test    the accepted FaultTestResult
+    current_test  the graded CurrentTestResult
+(fault_test and current_test are written once the stage's raw data files
+are on disk; on resume, main re-queues any technician, label or fault CSV
+that is missing.)
+    complete      report generated, run stored
+
+Records are stored as their results.py binary blob (hex). Completed stages
+and phases are fsynced; sweep steps are only flushed, to keep the sweep
+timing unchanged. A line cut short by a crash is ignored when loading.
+
+M. Capotosto
+10/19/2026
+NSLS-II Diagnostics and Instrumentation"""
+import os
+import json
+from dataclasses import dataclass, field
+from datetime import datetime
+from results import FaultTestResult, CurrentTestResult
+
+JOURNAL_NAME = "run_journal.jsonl"
+
+
+class RunJournal:
+    """Append-only journal of one run directory"""
+
+    def __init__(self, run_dir):
+        self.path = os.path.join(run_dir, JOURNAL_NAME)
+        self._file = open(self.path, "a",  # pylint: disable=R1732
+                          encoding="utf-8")
+        if self._file.tell() > 0:
+            with open(self.path, "rb") as file:
+                file.seek(-1, os.SEEK_END)
+                if file.read(1) != b"\n":  # End a line cut short
+                    self._file.write("\n")
+
+    def record(self, event, durable=True, **data):
+        """Append one event. durable=True also fsyncs the journal."""
+        entry = {"time": datetime.now().isoformat(timespec="seconds"),
+                 "event": event, **data}
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+        if durable:
+            os.fsync(self._file.fileno())
+
+    def record_result(self, event, result):
+        """Append a completed stage's result record"""
+        self.record(event, record=result.to_bytes().hex())
+
+    def fault_step(self, event, data):
+        """on_step callback for FLT12_Fault_Test.run_the_fault_test"""
+        self.record("fault", durable=not event.endswith("_step"),
+                    phase=event, **data)
+
+    def close(self):
+        """Close the journal file"""
+        self._file.close()
+
+
+@dataclass
+class ResumeState:
+    """What a journal says was completed before the run was interrupted"""
+    unit: dict = None
+    fault_phases: dict = field(default_factory=dict)  # Current attempt
+    fault: FaultTestResult = None
+    current: CurrentTestResult = None
+    complete: bool = False
+
+
+def load_journal(run_dir):
+    """Read a run's journal. Returns a ResumeState."""
+    state = ResumeState()
+    with open(os.path.join(run_dir, JOURNAL_NAME), encoding="utf-8") as file:
+        for line in file:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Cut short by the interruption
+            event = entry.pop("event")
+            entry.pop("time")
+            if event == "unit":
+                entry["test_time"] = datetime.fromisoformat(
+                    entry["test_time"])
+                state.unit = entry
+            elif event == "fault_start":
+                state.fault_phases = {}
+            elif event == "fault" and not entry["phase"].endswith("_step"):
+                state.fault_phases[entry.pop("phase")] = entry
+            elif event == "fault_test":
+                state.fault = FaultTestResult.from_bytes(
+                    bytes.fromhex(entry["record"]))
+            elif event == "current_test":
+                state.current = CurrentTestResult.from_bytes(
+                    bytes.fromhex(entry["record"]))
+            elif event == "complete":
+                state.complete = True
+    return state
+
+
+if __name__ == "__main__":
+    import sys
+    for arg in sys.argv[1:]:
+        resume = load_journal(arg)
+        print(f"{arg}: unit {resume.unit}, fault phases "
+              f"{sorted(resume.fault_phases)}, fault test "
+              f"{'done' if resume.fault else 'pending'}, current test "
+              f"{'done' if resume.current else 'pending'}, "
+              f"{'complete' if resume.complete else 'incomplete'}")
@@ -0,0 +1,243 @@
+"""This module defines where run directories live in the Test_Data archive,
+and finds them in either of its two layouts:
+
+    flat (original)   Test_Data/DCCT_<sn>-<mm-dd-yy_HH-MM-SS>/
+    sharded           Test_Data/<model>/<YYYY>/<MM>/<DD>/<sn>-<YYYY-MM-DDTHH-MM-SS>/
+
+The model shard is the S/N without its "DCCT-" prefix and unit number
+(DCCT-M-A-0001 -> M-A). Each shard directory holds one day of one model, so
+creating a run, or finding runs of a model or a date range, lists only the
+shards involved instead of every run in the archive. The contents of a
+run directory are the same in both layouts.
+
+The tools (archive migration, results store, run index, fleet loader,
+analysis cache) find runs through find_runs(), and paths recorded before
+a migration are mapped to the run's current directory by
+resolve_run_dir(). migrate_layout() moves flat runs into shards and updates
+the run index, results store and fleet file.
+
+Usage: python run_layout.py [root] [--dry-run]
+
+M. Capotosto
+10/19/2026
+NSLS-II Diagnostics and Instrumentation"""
+import os
+import glob
+import argparse
+from datetime import datetime
+
+DEFAULT_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            "Test_Data")
+LAYOUT_FLAT = "flat"
+LAYOUT_SHARDED = "sharded"
+FLAT_PREFIX = "DCCT_"
+FLAT_TIME_FORMAT = "%m-%d-%y_%H-%M-%S"  # Suffix of every flat run name
+SHARDED_TIME_FORMAT = "%Y-%m-%dT%H-%M-%S"  # ISO 8601, ':' is not allowed
+UNSORTED_MODEL = "unsorted"  # Shard of S/Ns without a model prefix
+_FLAT_TIME_LEN = len("00-00-00_00-00-00")
+_SHARDED_TIME_LEN = len("0000-00-00T00-00-00")
+
+
+# *************************************************************************
+# ******Run Directory Names******
+
+def run_model(dcct_sn):
+    """Model shard of a S/N, e.g. DCCT-M-A-0001 -> M-A"""
+    name = dcct_sn[len("DCCT-"):] if dcct_sn.startswith("DCCT-") \
+        else dcct_sn
+    return name.rpartition("-")[0] or UNSORTED_MODEL
+
+
+def run_dir_path(root, dcct_sn, test_time, layout=LAYOUT_SHARDED):
+    """Directory of a new run in the given layout"""
+    if layout == LAYOUT_FLAT:
+        return os.path.join(
+            root, f"{FLAT_PREFIX}{dcct_sn}-"
+            f"{test_time.strftime(FLAT_TIME_FORMAT)}")
+    if layout == LAYOUT_SHARDED:
+        return os.path.join(
+            root, run_model(dcct_sn), test_time.strftime("%Y"),
+            test_time.strftime("%m"), test_time.strftime("%d"),
+            f"{dcct_sn}-{test_time.strftime(SHARDED_TIME_FORMAT)}")
+    raise ValueError(f"Unknown run directory layout '{layout}'")
+
+
+def parse_run_dir(run_dir):
+    """(S/N, test time) encoded in a run directory name of either layout"""
+    name = os.path.basename(os.path.normpath(run_dir))
+    if name.startswith(FLAT_PREFIX):
+        return name[len(FLAT_PREFIX):-_FLAT_TIME_LEN - 1], \
+            datetime.strptime(name[-_FLAT_TIME_LEN:], FLAT_TIME_FORMAT)
+    return name[:-_SHARDED_TIME_LEN - 1], \
+        datetime.strptime(name[-_SHARDED_TIME_LEN:], SHARDED_TIME_FORMAT)
+
+
+def run_sn(run_dir):
+    """DCCT S/N encoded in a run directory name"""
+    return parse_run_dir(run_dir)[0]
+
+
+def run_time(run_dir):
+    """Acquisition time encoded in a run directory name"""
+    return parse_run_dir(run_dir)[1]
+
+
+def run_root(run_dir):
+    """Archive root that holds a run directory of either layout"""
+    run_dir = os.path.normpath(run_dir)
+    levels = 1 if os.path.basename(run_dir).startswith(FLAT_PREFIX) else 5
+    for _ in range(levels):
+        run_dir = os.path.dirname(run_dir)
+    return run_dir
+
+
+def relocated(path, moves):
+    """path (relative to the archive root) after the run directory it starts
+    with was moved, per moves {old run_dir: new run_dir}"""
+    parts = os.path.normpath(path).split(os.sep)
+    if parts[0] not in moves:
+        return path
+    return os.path.join(moves[parts[0]], *parts[1:])
+
+
+# *************************************************************************
+# ******Finding Runs******
+
+def _subdirs(path, digits=None):
+    """Names of the subdirectories of path (optionally only those named
+    with exactly 'digits' digits), sorted"""
+    try:
+        entries = list(os.scandir(path))
+    except OSError:
+        return []
+    return sorted(e.name for e in entries if e.is_dir() and (
+        digits is None or (len(e.name) == digits and e.name.isdigit())))
+
+
+def _in_range(value, low, high):
+    return (low is None or value >= low) and (high is None or value <= high)
+
+
+def _sharded_runs(root, model, since, until):
+    """Run directories in the sharded layout, listing only the shards that
+    can hold runs of 'model' between since and until"""
+    models = [model] if model is not None else [
+        name for name in _subdirs(root) if not name.startswith(FLAT_PREFIX)]
+    low = since.strftime("%Y%m%d") if since else None
+    high = until.strftime("%Y%m%d") if until else None
+    runs = []
+    for model_name in models:
+        model_dir = os.path.join(root, model_name)
+        for year in _subdirs(model_dir, 4):
+            if not _in_range(year, low and low[:4], high and high[:4]):
+                continue
+            for month in _subdirs(os.path.join(model_dir, year), 2):
+                if not _in_range(year + month, low and low[:6],
+                                 high and high[:6]):
+                    continue
+                for day in _subdirs(os.path.join(model_dir, year, month), 2):
+                    if not _in_range(year + month + day, low, high):
+                        continue
+                    shard = os.path.join(model_dir, year, month, day)
+                    runs.extend(os.path.join(shard, name)
+                                for name in _subdirs(shard))
+    return runs
+
+
+def find_runs(root=DEFAULT_ROOT, model=None, since=None, until=None):
+    """Every run directory (with a raw_data folder) in either layout,
+    ordered by S/N then test time. model (e.g. "M-A"), since and until
+    (datetimes) restrict the search; in the sharded layout only the
+    matching shards are listed."""
+    runs = _sharded_runs(root, model, since, until) + \
+        glob.glob(os.path.join(root, glob.escape(FLAT_PREFIX) + "*"))
+    found = []
+    for run_dir in runs:
+        if not os.path.isdir(os.path.join(run_dir, "raw_data")):
+            continue
+        try:
+            dcct_sn, test_time = parse_run_dir(run_dir)
+        except ValueError:
+            continue  # Not a run directory
+        if (model is None or run_model(dcct_sn) == model) and \
+                _in_range(test_time, since, until):
+            found.append(((dcct_sn, test_time), run_dir))
+    return [run_dir for _, run_dir in sorted(found)]
+
+
+def resolve_run(root, dcct_sn, test_time):
+    """Existing directory of a run in either layout, or None"""
+    for layout in (LAYOUT_SHARDED, LAYOUT_FLAT):
+        run_dir = run_dir_path(root, dcct_sn, test_time, layout)
+        if os.path.isdir(run_dir):
+            return run_dir
+    return None
+
+
+def resolve_run_dir(root, run_dir):
+    """Current directory of a run recorded as run_dir (absolute or relative
+    to root), which may have moved to the other layout since. Returns None
+    if the run is not found."""
+    path = run_dir if os.path.isabs(run_dir) else os.path.join(root, run_dir)
+    if os.path.isdir(path):
+        return path
+    try:
+        return resolve_run(root, *parse_run_dir(run_dir))
+    except ValueError:
+        return None
+
+
+# *************************************************************************
+# ******Migration******
+
+def migrate_layout(root=DEFAULT_ROOT, dry_run=False):
+    """Move every flat run into its shard, then update the run index,
+    results store and fleet file to the new paths.
+    Returns {old path: new path} (relative to root)."""
+    # pylint: disable=import-outside-toplevel
+    moves = {}
+    for run_dir in glob.glob(os.path.join(root,
+                                          glob.escape(FLAT_PREFIX) + "*")):
+        try:
+            target = run_dir_path(root, *parse_run_dir(run_dir))
+        except ValueError:
+            continue
+        if os.path.exists(target):
+            print(f"Skipping {run_dir}: {target} already exists")
+            continue
+        if not dry_run:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.rename(run_dir, target)
+        moves[os.path.relpath(run_dir, root)] = os.path.relpath(target, root)
+    if dry_run or not moves:
+        return moves
+
+    from run_index import RunIndex, DEFAULT_INDEX_PATH
+    from results_store import relocate_runs as relocate_store, \
+        DEFAULT_STORE_PATH
+    from fleet_loader import relocate_runs as relocate_fleet
+    index_path = os.path.join(root, os.path.basename(DEFAULT_INDEX_PATH))
+    if os.path.exists(index_path):
+        with RunIndex(index_path) as index:
+            index.relocate(moves)
+    store_path = os.path.join(root, os.path.basename(DEFAULT_STORE_PATH))
+    if os.path.exists(store_path):
+        relocate_store(moves, store_path)
+    relocate_fleet(moves, root)
+    return moves
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Move flat Test_Data runs into the sharded layout")
+    parser.add_argument("root", nargs="?", default=DEFAULT_ROOT,
+                        help="Archive root (default: Test_Data next to "
+                             "this script)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Only list the moves")
+    args = parser.parse_args()
+
+    planned = migrate_layout(args.root, args.dry_run)
+    for old, new in planned.items():
+        print(f"{old} -> {new}")
+    print(f"{'Would move' if args.dry_run else 'Moved'} {len(planned)} runs")
@@ -0,0 +1,219 @@
+"""This module provides the payload codecs of the waveform file
+(waveform_store.py) and lossless PNG optimization for the waveform plots,
+with a benchmark over the real Test_Data archive.
+
+A codec is stored in the waveform file header as one byte: the algorithm
+(CODEC_RAW, CODEC_ZLIB, CODEC_LZMA) optionally OR'ed with CODEC_DELTA.
+Delta encoding replaces each 8-bit ADC sample by its difference from the
+previous one (modulo 256), which turns the slowly varying sine records
+into small, repetitive values that compress far better. Compression
+levels only affect encoding, so they are not stored.
+
+Raw files stay memory-mappable; compressed files are decoded into memory
+on open.
+
+Usage: python waveform_compression.py [root] [--png]
+
+M. Capotosto
+10/19/2026
+NSLS-II Diagnostics and Instrumentation"""
+import os
+import lzma
+import zlib
+import argparse
+from time import perf_counter
+import numpy as np
+
+try:
+    from PIL import Image
+except ImportError:  # Optional, only needed for PNG optimization
+    Image = None
+
+CODEC_RAW = 0  # Uncompressed, memory-mappable
+CODEC_ZLIB = 1
+CODEC_LZMA = 2
+CODEC_DELTA = 0x10  # Flag: samples are delta encoded before compression
+_ALGORITHM_MASK = 0x0F
+_ALGORITHMS = {CODEC_RAW: "raw", CODEC_ZLIB: "zlib", CODEC_LZMA: "lzma"}
+
+
+def codec_name(codec):
+    """Readable name of a codec byte, e.g. "zlib+delta" """
+    name = _ALGORITHMS.get(codec & _ALGORITHM_MASK, f"unknown({codec})")
+    return name + "+delta" if codec & CODEC_DELTA else name
+
+
+def parse_codec(name):
+    """Codec byte of a name as returned by codec_name()"""
+    algorithm, _, delta = name.partition("+")
+    codecs = {v: k for k, v in _ALGORITHMS.items()}
+    if algorithm not in codecs or delta not in ("", "delta"):
+        raise ValueError(f"Unknown waveform codec '{name}'")
+    return codecs[algorithm] | (CODEC_DELTA if delta else 0)
+
+
+def delta_encode(block):
+    """Per-row differences of a uint8 (n_channels, n_samples) block, the
+    first sample kept as is (wraps modulo 256)"""
+    encoded = np.empty_like(block)
+    encoded[:, :1] = block[:, :1]
+    np.subtract(block[:, 1:], block[:, :-1], out=encoded[:, 1:])
+    return encoded
+
+
+def delta_decode(encoded):
+    """Inverse of delta_encode"""
+    return np.cumsum(encoded, axis=1, dtype=np.uint8)
+
+
+def encode_samples(block, codec, level=None):
+    """Payload bytes of a uint8 (n_channels, n_samples) sample block.
+    level: zlib 0-9 (default 6) or lzma preset 0-9 (default 6)"""
+    if codec & CODEC_DELTA:
+        block = delta_encode(block)
+    data = np.ascontiguousarray(block).tobytes()
+    algorithm = codec & _ALGORITHM_MASK
+    if algorithm == CODEC_RAW:
+        return data
+    if algorithm == CODEC_ZLIB:
+        return zlib.compress(data, 6 if level is None else level)
+    if algorithm == CODEC_LZMA:
+        return lzma.compress(data, preset=6 if level is None else level)
+    raise ValueError(f"Unknown waveform codec {codec}")
+
+
+def decode_samples(payload, codec, shape):
+    """Sample block of a payload written by encode_samples"""
+    algorithm = codec & _ALGORITHM_MASK
+    if algorithm == CODEC_ZLIB:
+        payload = zlib.decompress(payload)
+    elif algorithm == CODEC_LZMA:
+        payload = lzma.decompress(payload)
+    elif algorithm != CODEC_RAW:
+        raise ValueError(f"Unknown waveform codec {codec}")
+    block = np.frombuffer(payload, dtype=np.uint8).reshape(shape)
+    return delta_decode(block) if codec & CODEC_DELTA else block
+
+
+def optimize_png(path):
+    """Losslessly recompress a PNG in place (requires Pillow): drop an
+    all-opaque alpha channel (matplotlib always writes RGBA), use a palette
+    when the image has at most 256 colors, and recompress with the best
+    deflate settings. The file is only replaced when the result is
+    smaller. Returns bytes saved."""
+    if Image is None:
+        raise ImportError("Pillow is required for PNG optimization")
+    temp_path = path + ".tmp"
+    with Image.open(path) as image:
+        if image.mode == "RGBA" and \
+                image.getchannel("A").getextrema() == (255, 255):
+            image = image.convert("RGB")
+        colors = image.getcolors(256) if image.mode == "RGB" else None
+        if colors is not None:  # Exact palette, no dithering
+            palette = Image.new("P", (1, 1))
+            palette.putpalette([c for _, rgb in colors for c in rgb])
+            image = image.quantize(palette=palette,
+                                   dither=Image.Dither.NONE)
+        image.save(temp_path, format="PNG", optimize=True)
+    saved = os.path.getsize(path) - os.path.getsize(temp_path)
+    if saved > 0:
+        os.replace(temp_path, path)
+    else:
+        os.remove(temp_path)
+    return max(saved, 0)
+
+
+# *************************************************************************
+# ******Benchmark******
+
+BENCH_CODECS = [("raw", None), ("zlib", 1), ("zlib", 6), ("zlib", 9),
+                ("zlib+delta", 1), ("zlib+delta", 6), ("zlib+delta", 9),
+                ("lzma", 0), ("lzma", 6), ("lzma+delta", 0),
+                ("lzma+delta", 6)]
+
+
+def benchmark_codecs(blocks):
+    """Compress every sample block with each BENCH_CODECS setting.
+    Returns rows of (codec, level, ratio, encode MB/s, decode MB/s)."""
+    raw_bytes = sum(block.nbytes for block in blocks)
+    rows = []
+    for name, level in BENCH_CODECS:
+        codec = parse_codec(name)
+        start = perf_counter()
+        payloads = [encode_samples(block, codec, level) for block in blocks]
+        encode_time = perf_counter() - start
+        start = perf_counter()
+        for block, payload in zip(blocks, payloads):
+            if not np.array_equal(decode_samples(payload, codec, block.shape),
+                                  block):
+                raise ValueError(f"{name} does not round-trip")
+        decode_time = perf_counter() - start
+        rows.append((name, level, raw_bytes / sum(map(len, payloads)),
+                     raw_bytes / 1e6 / max(encode_time, 1e-9),
+                     raw_bytes / 1e6 / max(decode_time, 1e-9)))
+    return rows
+
+
+def benchmark_png(paths):
+    """Optimize copies of the PNGs. Returns (original bytes, optimized
+    bytes, seconds per file)."""
+    # pylint: disable=import-outside-toplevel
+    import shutil
+    import tempfile
+    original = optimized = 0
+    start = perf_counter()
+    with tempfile.TemporaryDirectory() as scratch:
+        for i, path in enumerate(paths):
+            copy = shutil.copy(path, os.path.join(scratch, f"{i}.png"))
+            original += os.path.getsize(copy)
+            optimize_png(copy)
+            optimized += os.path.getsize(copy)
+    return original, optimized, (perf_counter() - start) / max(len(paths), 1)
+
+
+if __name__ == "__main__":
+    import glob
+    from waveform_store import open_waveforms, read_legacy_channel_csv, \
+        WAVEFORM_SUFFIX
+    from archive_migration import LEGACY_CHANNEL_SUFFIX
+    from run_layout import find_runs, DEFAULT_ROOT
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark waveform/PNG compression on an archive")
+    parser.add_argument("root", nargs="?", default=DEFAULT_ROOT,
+                        help="Archive root (default: Test_Data next to "
+                             "this script)")
+    parser.add_argument("--png", action="store_true",
+                        help="Also benchmark PNG optimization (slow)")
+    args = parser.parse_args()
+
+    sample_blocks = []
+    for run_dir in find_runs(args.root):
+        raw_data = os.path.join(run_dir, "raw_data")
+        for wf_path in glob.glob(os.path.join(raw_data, "*" + WAVEFORM_SUFFIX)):
+            with open_waveforms(wf_path) as wf:
+                sample_blocks.append(np.array(wf.samples))
+            break
+        else:
+            for csv_path in glob.glob(os.path.join(
+                    raw_data, "*" + LEGACY_CHANNEL_SUFFIX)):
+                _, decoded = read_legacy_channel_csv(csv_path)
+                sample_blocks.append(np.vstack([np.frombuffer(
+                    decoded[i]["adc_wave"], dtype=np.uint8)
+                    for i in sorted(decoded)]))
+    print(f"{len(sample_blocks)} runs, "
+          f"{sum(b.nbytes for b in sample_blocks) / 1e3:.0f} kB of samples")
+    print(f"{'codec':<12}{'level':>6}{'ratio':>8}{'enc MB/s':>10}"
+          f"{'dec MB/s':>10}")
+    for bench in benchmark_codecs(sample_blocks):
+        print(f"{bench[0]:<12}{str(bench[1]):>6}{bench[2]:>8.2f}"
+              f"{bench[3]:>10.1f}{bench[4]:>10.1f}")
+
+    if args.png:
+        pngs = [png for run_dir in find_runs(args.root)
+                for png in glob.glob(os.path.join(run_dir, "raw_data",
+                                                  "*.png"))]
+        before, after, per_file = benchmark_png(pngs)
+        print(f"PNG: {len(pngs)} files, {before / 1e6:.1f} MB -> "
+              f"{after / 1e6:.1f} MB ({100 * (1 - after / max(before, 1)):.0f}"
+              f"% smaller), {per_file * 1000:.0f} ms per file")
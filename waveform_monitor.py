@@ -0,0 +1,185 @@
+"""This module provides a live waveform monitor for debugging a failed
+current test. The scope is left in continuous (RUNSTOP) acquisition and
+CH1-CH3 are pulled with the fast preamble/curve path, graded with the same
+analysis as the current test, and drawn with matplotlib blitting, so
+wiring changes show up within a fraction of a second instead of a full
+test re-run.
+
+Each channel is read from its latest acquisition. The scope triggers on
+the CH3 stimulus, so the channels stay phase-aligned even when they come
+from different acquisitions.
+
+M. Capotosto
+10/19/2026
+NSLS-II Diagnostics and Instrumentation"""
+from time import monotonic
+import matplotlib.pyplot as plt
+from plotter_calculator import init_plots, unpack_raw_adc, sample_interval, \
+    analyze_volts, decimate_minmax, verdict_color
+from functional_tests.current_test import decode_wfdata
+
+LIMIT_MARGIN = 0.2  # Y-axis headroom, as a fraction of the trace span
+SHRINK_FRACTION = 0.5  # Zoom in once the fitted span falls below this
+                       # fraction of the current y-axis span
+
+
+class LiveMonitor:
+    """Blitted 2x2 waveform display. Only the traces and text boxes are
+    redrawn each frame; the axes are redrawn in full only when a verdict
+    colour changes, a trace leaves its y-limits or the traces shrink well
+    inside them."""
+
+    PANELS = (
+        ((0, 0), "Channel 1, IOUT 1", (1,)),
+        ((0, 1), "Channel 2, IOUT 2", (2,)),
+        ((1, 0), "Channel 3, SIGNAL GEN", (3,)),
+        ((1, 1), "Channel 1 & Channel 2 (IOUT 1 and IOUT 2) Phase Shift",
+         (1, 2)),
+    )
+
+    def __init__(self):
+        self.fig, self.ax = init_plots(interactive=True)
+        self.fig.suptitle("ALSu DCCT Live Monitor (close window to stop)")
+        self.lines = {}
+        self.text = {}
+        for pos, title, chans in self.PANELS:
+            axis = self.ax[pos]
+            axis.set_title(title)
+            axis.grid(True)
+            self.lines[pos] = [axis.plot([], [], color=f"C{i}",
+                                         animated=True)[0]
+                               for i in range(len(chans))]
+            self.text[pos] = axis.text(0.05, 0.9, "",
+                                       transform=axis.transAxes,
+                                       fontsize=14, verticalalignment='top',
+                                       animated=True,
+                                       bbox={'facecolor': 'wheat',
+                                             'alpha': 0.7})
+        self._verdicts = None
+        self._background = None
+        self.fig.canvas.mpl_connect("draw_event", self._on_draw)
+        plt.show(block=False)
+        plt.pause(0.1)
+
+    def is_open(self):
+        """True until the monitor window is closed"""
+        return plt.fignum_exists(self.fig.number)
+
+    def _on_draw(self, _event):
+        """Cache the static background after every full redraw"""
+        self._background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        self._draw_animated()
+
+    def _draw_animated(self):
+        for pos, _, _ in self.PANELS:
+            for line in self.lines[pos]:
+                self.ax[pos].draw_artist(line)
+            self.ax[pos].draw_artist(self.text[pos])
+
+    def _rescale(self, volts, scope_time):
+        """Fit the x-limits and y-limits (with headroom) to the traces when
+        they leave the y-limits or use less than SHRINK_FRACTION of them.
+        Returns True if any limit changed."""
+        changed = False
+        for pos, _, chans in self.PANELS:
+            axis = self.ax[pos]
+            lo = min(volts[chan].min() for chan in chans)
+            hi = max(volts[chan].max() for chan in chans)
+            pad = (hi - lo) * LIMIT_MARGIN or 0.1
+            ymin, ymax = axis.get_ylim()
+            if self._verdicts is None or lo < ymin or hi > ymax or \
+                    (hi - lo) + 2 * pad < SHRINK_FRACTION * (ymax - ymin):
+                axis.set_ylim(lo - pad, hi + pad)
+                axis.set_xlim(scope_time[0], scope_time[-1])
+                changed = True
+        return changed
+
+    def update(self, result, volts, scope_time, fps):
+        """Show one frame"""
+        if not self.is_open():  # Closed during the transfer
+            return
+        verdicts = (result.ch1_threshold, result.ch2_threshold,
+                    result.ch3_threshold, result.freq_phase_pass)
+        rescaled = self._rescale(volts, scope_time)
+
+        for (pos, _, chans), vpp in zip(self.PANELS,
+                                        (result.vpp1, result.vpp2,
+                                         result.vpp3, None)):
+            for line, chan in zip(self.lines[pos], chans):
+                line.set_data(*decimate_minmax(scope_time, volts[chan]))
+            if vpp is not None:
+                self.text[pos].set_text(f"Peak-to-Peak: {round(vpp, 3)} V")
+        self.text[1, 1].set_text(f"Phase Shift: {result.phase_shift}°\n"
+                                 f"Frequency:{result.frequency} Hz\n"
+                                 f"{fps:.1f} frames/s")
+
+        if rescaled or verdicts != self._verdicts \
+                or not self.fig.canvas.supports_blit:
+            for (pos, _, _), passed in zip(self.PANELS, verdicts):
+                self.ax[pos].set_facecolor(verdict_color(passed))
+            self._verdicts = verdicts
+            self.fig.canvas.draw()  # Re-caches the background
+        else:
+            self.fig.canvas.restore_region(self._background)
+            self._draw_animated()
+            self.fig.canvas.blit(self.fig.bbox)
+        self.fig.canvas.flush_events()
+
+
+def acquire_live_frame(scope):
+    """Pull the latest CH1-CH3 records with the fast transfer path.
+    Returns channel_data in the same layout as the current test."""
+    channel_data = {}
+    for i in range(1, 4):
+        ymult, yzero, yoff, xincr, data = scope.acquire_waveform_fast(str(i))
+        channel_data[i] = {
+            "ymult": ymult,
+            "yzero": yzero,
+            "yoff": yoff,
+            "xincr": xincr,
+            "data": data
+        }
+    return channel_data
+
+
+def run_live_monitor(scope):
+    """Run the live monitor until its window is closed (or Ctrl+C).
+
+    The scope must already be configured for the current test
+    (init_scope_ct) and the DCCT driven. The scope is returned to
+    single-sequence acquisition on exit."""
+    print("Starting live waveform monitor, close the plot window to stop...")
+    scope.config_curve_transfer("1", "RPB")
+    scope.acquire_stopafter("RUNSTOP")
+    scope.acquire_state("ON")
+    monitor = LiveMonitor()
+    frames = 0
+    last = monotonic()
+    try:
+        while monitor.is_open():
+            channel_data = acquire_live_frame(scope)
+            decoded_wfdata = decode_wfdata(channel_data)
+            volts, _, _, scope_time = unpack_raw_adc(channel_data,
+                                                     decoded_wfdata)
+            result = analyze_volts(volts, 1 / sample_interval(channel_data))
+            now = monotonic()
+            monitor.update(result, volts, scope_time, 1 / (now - last))
+            last = now
+            frames += 1
+    except KeyboardInterrupt:
+        pass
+    finally:
+        scope.acquire_state("OFF")
+        scope.acquire_stopafter("SEQUENCE")
+        plt.close(monitor.fig)
+    print(f"Live monitor stopped after {frames} frames")
+
+
+if __name__ == "__main__":
+    from instrument_modules.Tek_DPO4000 import DPO4000
+    from functional_tests.current_test import init_scope_ct
+    SCOPE_IP_ADDRESS = "10.0.142.3"  # Set oscope IP Address
+    scope_standalone = DPO4000(connection_method="IP",
+                               address=SCOPE_IP_ADDRESS)
+    init_scope_ct(scope_standalone)
+    run_live_monitor(scope_standalone)
@@ -0,0 +1,192 @@
+"""This module defines the native waveform file (<sn>_waveforms.dcwf) that
+replaces the Python bytes repr previously written to <sn>_channel_data.csv.
+
+Layout (little-endian):
+    FILE_HEADER       magic, format version, codec, channel/sample counts,
+                      acquisition timestamp, payload size
+    CHANNEL_HEADER    one per channel: channel number, ymult, yzero, yoff,
+                      xincr (the scope preamble)
+    payload           uint8 ADC samples, (n_channels, n_samples), raw or
+                      compressed (codec, see waveform_compression.py)
+
+Both headers are NumPy structured dtypes, so a raw file opens with two
+np.fromfile reads and an np.memmap of the sample block; no text is parsed.
+
+M. Capotosto
+10/19/2026
+NSLS-II Diagnostics and Instrumentation"""
+import ast
+import csv
+from datetime import datetime
+import numpy as np
+from waveform_compression import CODEC_RAW, encode_samples, decode_samples
+
+MAGIC = b"DCWF"
+FORMAT_VERSION = 1
+WAVEFORM_SUFFIX = "_waveforms.dcwf"
+
+FILE_HEADER = np.dtype([
+    ("magic", "S4"),
+    ("version", "<u2"),
+    ("codec", "u1"),
+    ("reserved", "u1"),
+    ("n_channels", "<u2"),
+    ("n_samples", "<u4"),
+    ("timestamp", "<M8[us]"),
+    ("payload_bytes", "<u8"),
+])
+CHANNEL_HEADER = np.dtype([
+    ("channel", "<u2"),
+    ("ymult", "<f8"),
+    ("yzero", "<f8"),
+    ("yoff", "<f8"),
+    ("xincr", "<f8"),
+])
+SAMPLE_DTYPE = np.uint8
+
+
+def parse_curve_block(data):
+    """Return the sample bytes of a CURVE? response, an IEEE 488.2
+    definite-length block: '#', digit count n, n-digit byte count, the
+    samples, then the terminator."""
+    n_digits = int(chr(data[1]))
+    length = int(data[2:2 + n_digits])
+    start = 2 + n_digits
+    return data[start:start + length]
+
+
+class WaveformFile:
+    """An opened waveform file. 'samples' is the ADC block, shape
+    (n_channels, n_samples): a read-only memmap for raw files, decoded into
+    memory for compressed ones."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as file:
+            self.header = np.fromfile(file, dtype=FILE_HEADER, count=1)[0]
+            if self.header["magic"] != MAGIC:
+                raise ValueError(f"{path} is not a waveform file")
+            if self.header["version"] != FORMAT_VERSION:
+                raise ValueError(f"{path}: waveform format version "
+                                 f"{self.header['version']} is not supported")
+            self.channels = np.fromfile(file, dtype=CHANNEL_HEADER,
+                                        count=int(self.header["n_channels"]))
+        self.data_offset = FILE_HEADER.itemsize + self.channels.nbytes
+        self.shape = (int(self.header["n_channels"]),
+                      int(self.header["n_samples"]))
+        codec = int(self.header["codec"])
+        if codec == CODEC_RAW:
+            self.samples = np.memmap(path, dtype=SAMPLE_DTYPE, mode="r",
+                                     offset=self.data_offset,
+                                     shape=self.shape)
+        else:
+            with open(path, "rb") as file:
+                file.seek(self.data_offset)
+                payload = file.read(int(self.header["payload_bytes"]))
+            self.samples = decode_samples(payload, codec, self.shape)
+
+    def close(self):
+        """Release the memory map, so the file can be replaced or removed
+        (Windows). Arrays taken from 'samples' must not be used after."""
+        if isinstance(self.samples, np.memmap):
+            self.samples._mmap.close()  # pylint: disable=protected-access
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def timestamp(self):
+        """Acquisition time as a datetime"""
+        return self.header["timestamp"].astype(datetime)
+
+    def volts(self):
+        """All channels scaled to volts in one operation, (n_channels,
+        n_samples) float64"""
+        return (self.samples - self.channels["yoff"][:, None]) * \
+            self.channels["ymult"][:, None] + self.channels["yzero"][:, None]
+
+    def channel_data(self):
+        """Preamble dict in the layout of current_test.transfer_wfdata
+        (without the raw "data" block)"""
+        return {int(ch["channel"]): {"ymult": float(ch["ymult"]),
+                                     "yzero": float(ch["yzero"]),
+                                     "yoff": float(ch["yoff"]),
+                                     "xincr": float(ch["xincr"])}
+                for ch in self.channels}
+
+    def decoded_wfdata(self):
+        """Sample dict in the layout of current_test.decode_wfdata, so the
+        file can be passed straight to unpack_raw_adc/analyze_waveforms"""
+        return {int(ch["channel"]): {"adc_wave": self.samples[i]}
+                for i, ch in enumerate(self.channels)}
+
+
+def waveform_bytes(channel_data, decoded_wfdata, timestamp=None,
+                   codec=CODEC_RAW, level=None):
+    """Contents of a waveform file holding the acquired channels
+    (channel_data/decoded_wfdata as returned by the current test).
+    codec/level: payload compression (see waveform_compression.py)"""
+    numbers = sorted(channel_data)
+    block = np.vstack([np.frombuffer(decoded_wfdata[i]["adc_wave"],
+                                     dtype=SAMPLE_DTYPE) for i in numbers])
+    header = np.zeros(1, dtype=FILE_HEADER)
+    header["magic"] = MAGIC
+    header["version"] = FORMAT_VERSION
+    header["codec"] = codec
+    header["n_channels"], header["n_samples"] = block.shape
+    header["timestamp"] = np.datetime64(timestamp or datetime.now(), "us")
+    payload = encode_samples(block, codec, level)
+    header["payload_bytes"] = len(payload)
+    channels = np.zeros(len(numbers), dtype=CHANNEL_HEADER)
+    for row, i in zip(channels, numbers):
+        row["channel"] = i
+        for key in ("ymult", "yzero", "yoff", "xincr"):
+            row[key] = channel_data[i][key]
+    return header.tobytes() + channels.tobytes() + payload
+
+
+def write_waveforms(path, channel_data, decoded_wfdata, timestamp=None,
+                    codec=CODEC_RAW, level=None):
+    """Write acquired channels to a waveform file. Returns path."""
+    with open(path, "wb") as file:
+        file.write(waveform_bytes(channel_data, decoded_wfdata, timestamp,
+                                  codec, level))
+    return path
+
+
+def open_waveforms(path):
+    """Open a waveform file (raw files are memory-mapped)"""
+    return WaveformFile(path)
+
+
+def read_legacy_channel_csv(path):
+    """Read a <sn>_channel_data.csv written before the waveform file
+    existed. Returns (channel_data, decoded_wfdata) as the current test
+    would have."""
+    channel_data = {}
+    decoded_wfdata = {}
+    with open(path, newline="", encoding="utf-8") as file:
+        reader = csv.reader(file)
+        next(reader)  # Header
+        for row in reader:
+            channel = int(row[0])
+            data = ast.literal_eval(row[5])
+            channel_data[channel] = {"ymult": float(row[1]),
+                                     "yzero": float(row[2]),
+                                     "yoff": float(row[3]),
+                                     "xincr": float(row[4]),
+                                     "data": data}
+            decoded_wfdata[channel] = {"adc_wave": parse_curve_block(data)}
+    return channel_data, decoded_wfdata
+
+
+if __name__ == "__main__":
+    import sys
+    from waveform_compression import codec_name
+    for arg in sys.argv[1:]:
+        wf = open_waveforms(arg)
+        print(f"{arg}: {wf.shape[0]} channels x {wf.shape[1]} samples, "
+              f"{codec_name(int(wf.header['codec']))}, {wf.timestamp}")